@@ -0,0 +1,92 @@
+// Live samples pushed by the dashboard server over server-sent events (see live_stream.py).
+// New samples are appended directly to the plots, between the regular refreshes.
+
+// Columns shown in the power plots, in the order of the traces (PLOT_FIELDS in user_app.py).
+const LIVE_PLOT_FIELDS = {
+    energy_plot: ["bus_voltage_battery", "bus_voltage_solar", "current_battery", "current_solar"],
+    env_plot: ["temperature", "humidity"],
+};
+const LIVE_TIMEOUT = 15000;
+
+function liveGraph(plotId) {
+    const graph = document.querySelector(`#${plotId} .js-plotly-plot`);
+    return graph && graph.data && window.Plotly ? graph : null;
+}
+
+function liveExtend(stream, plotId, sample, fields) {
+    const graph = liveGraph(plotId);
+    if (!graph) {
+        return;
+    }
+    // Measurement plot traces are named after their columns.
+    fields = fields || graph.data.map((trace) => trace.name);
+    const indices = [];
+    const update = {x: [], y: []};
+    fields.forEach((field, i) => {
+        if (field in sample && i < graph.data.length) {
+            indices.push(i);
+            update.x.push([sample.datetime]);
+            update.y.push([sample[field]]);
+        }
+    });
+    if (!indices.length) {
+        return;
+    }
+    // The same cap as the appends of the server (plot_max_points in user_app.py).
+    const state = stream.plotState && stream.plotState.plots && stream.plotState.plots[plotId];
+    const maxPoints = state && state.max_points ? indices.map((i) => state.max_points[i]) : undefined;
+    window.Plotly.extendTraces(graph, update, indices, maxPoints);
+    const appended = stream.plots[plotId] ? stream.plots[plotId].appended : 0;
+    stream.plots[plotId] = {last: sample.datetime, appended: appended + 1};
+}
+
+function liveHandle(stream, message) {
+    stream.lastMessage[message.topic] = Date.now();
+    if (message.topic === "Power") {
+        liveExtend(stream, "energy_plot", message.sample, LIVE_PLOT_FIELDS.energy_plot);
+        liveExtend(stream, "env_plot", message.sample, LIVE_PLOT_FIELDS.env_plot);
+    } else if (stream.topics.includes(message.topic)) {
+        liveExtend(stream, "mu_plot", message.sample);
+    }
+}
+
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    live_stream: {
+        update: function (topics, n, plotState) {
+            // The topics that can be appended live are decided by the server (stream_topics in user_app.py).
+            topics = topics || [];
+            const url = "/stream?" + topics.map((topic) => "topic=" + encodeURIComponent(topic)).join("&");
+
+            let stream = window.liveStream;
+            if (!stream || stream.url !== url) {
+                if (stream) {
+                    stream.source.close();
+                }
+                stream = window.liveStream = {
+                    url: url,
+                    topics: topics,
+                    source: new EventSource(url),
+                    lastMessage: {},
+                    drawn: null,
+                    plots: {},
+                };
+                stream.source.onmessage = (event) => liveHandle(stream, JSON.parse(event.data));
+            }
+            if (plotState && plotState.drawn !== stream.drawn) {
+                // The plots were redrawn, the samples appended to the old ones don't count anymore.
+                stream.drawn = plotState.drawn;
+                stream.plots = {};
+            }
+            stream.plotState = plotState;
+
+            // Report the topics that currently deliver samples, so that the server doesn't send them again, and the
+            // newest sample and number of samples appended to each plot since it was drawn.
+            const now = Date.now();
+            return {
+                drawn: stream.drawn,
+                topics: Object.keys(stream.lastMessage).filter((topic) => now - stream.lastMessage[topic] < LIVE_TIMEOUT),
+                plots: stream.plots,
+            };
+        },
+    },
+});
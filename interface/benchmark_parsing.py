@@ -0,0 +1,66 @@
+import argparse
+import io
+import time
+
+import numpy as np
+import pandas as pd
+
+import data_reader
+
+# Columns of a MU measurement file besides datetime and the plotted fields.
+OTHER_COLUMNS = [f"extra_{i}" for i in range(12)]
+
+
+def make_content(rows):
+    """Synthetic MU measurement file with the plotted fields and as many other columns as the real ones."""
+    rng = np.random.default_rng(0)
+    times = pd.Timestamp("2024-01-01") + pd.to_timedelta(np.arange(rows) * 100_000, unit="us")
+    df = pd.DataFrame({"datetime": times.strftime(data_reader.FAST_TIME_FORMAT)})
+    for column in data_reader.SENSOR_FIELDS["MU"] + OTHER_COLUMNS:
+        df[column] = rng.normal(1000, 100, rows).round(3)
+    return df.to_csv(index=False).encode()
+
+
+def previous_path(content):
+    """How measurement files were parsed before: all columns, strptime for the timestamps."""
+    df = pd.read_csv(io.BytesIO(content), on_bad_lines="warn")
+    df.dropna(inplace=True)
+    df["datetime"] = pd.to_datetime(df["datetime"], format=data_reader.FAST_TIME_FORMAT, errors="coerce")
+    return df
+
+
+def current_path(content):
+    df = data_reader.read_csv(content, data_reader.SENSOR_FIELDS["MU"])
+    df.dropna(inplace=True)
+    df["datetime"] = data_reader.parse_times(df["datetime"], data_reader.FAST_TIME_FORMAT)
+    return df
+
+
+def measure(function, content, repeat):
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        df = function(content)
+        durations.append(time.perf_counter() - start)
+    return min(durations), df.memory_usage(deep=True).sum()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the CSV parsing of measurement files with the old path.")
+    parser.add_argument("--file", action="store", help="MU measurement file, synthetic data if not given.")
+    parser.add_argument("--rows", action="store", type=int, default=200_000, help="Rows of synthetic data.")
+    parser.add_argument("--repeat", action="store", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.file:
+        with open(args.file, "rb") as f:
+            content = f.read()
+    else:
+        content = make_content(args.rows)
+
+    previous_time, previous_memory = measure(previous_path, content, args.repeat)
+    current_time, current_memory = measure(current_path, content, args.repeat)
+    print(f"{len(content) / 1e6:.1f} MB of CSV")
+    print(f"previous: {previous_time * 1000:.0f} ms, {previous_memory / 1e6:.1f} MB")
+    print(f"current:  {current_time * 1000:.0f} ms, {current_memory / 1e6:.1f} MB")
+    print(f"speedup:  {previous_time / current_time:.1f}x")
@@ -0,0 +1,122 @@
+import argparse
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+from measurement_store import columnar, manifest
+
+COMPACTION_INTERVAL = 600
+REMOVE_DELAY = columnar.REMOVE_DELAY
+
+
+def _csv_rows(csv_path):
+    """Complete lines after the header, counted like the manifest does."""
+    with open(csv_path, "rb") as f:
+        lines = sum(block.count(b"\n") for block in iter(lambda: f.read(manifest.SCAN_BLOCK_SIZE), b""))
+    return max(lines - 1, 0)
+
+
+class Compactor():
+    """Background stage that converts closed CSV files to Parquet, keeping the directory layout.
+
+    Only directories with a datetime column are compacted. The manifest lists the Parquet file instead of the
+    CSV file as soon as it exists, the CSV file is removed REMOVE_DELAY seconds later if the Parquet file has all
+    of its rows. Files that can't be converted without losing data are left as they are.
+    """
+
+    def __init__(self, measurement_path, fmt=None, interval=COMPACTION_INTERVAL, remove_delay=REMOVE_DELAY):
+        self.measurement_path = Path(measurement_path)
+        self.fmt = fmt
+        self.interval = interval
+        self.remove_delay = remove_delay
+        # Files that were not converted or not removed, so they are not retried (and logged) in every pass.
+        self.skipped = set()
+
+    def compact_dir(self, data_dir):
+        # Power data is stored without fractions of a second.
+        fmt = None if data_dir.name == "Power" else self.fmt
+        for entry in manifest.get(data_dir).files():
+            if (
+                not entry["closed"]
+                or columnar.is_columnar(entry["name"])
+                or entry["rows"] == 0
+                or not entry["header"].startswith("datetime")
+                or data_dir / entry["name"] in self.skipped
+            ):
+                continue
+            start = time.monotonic()
+            try:
+                parquet_path = columnar.convert(data_dir / entry["name"], entry, fmt)
+            except ValueError as e:
+                logging.warning(f"Not compacting {data_dir / entry['name']}: {e}")
+                self.skipped.add(data_dir / entry["name"])
+                continue
+            if parquet_path is not None:
+                logging.info(
+                    f"Compacted {data_dir / entry['name']}: {entry['size'] / 1e6:.1f} MB -> "
+                    f"{parquet_path.stat().st_size / 1e6:.1f} MB in {time.monotonic() - start:.1f} s"
+                )
+
+    def remove_replaced(self, data_dir):
+        now = time.time()
+        for name in os.listdir(data_dir):
+            csv_path = data_dir / name
+            if not name.endswith(".csv") or csv_path in self.skipped:
+                continue
+            parquet_path = csv_path.with_suffix(columnar.SUFFIX)
+            try:
+                if now - parquet_path.stat().st_mtime <= self.remove_delay:
+                    continue
+                rows = columnar.read_metadata(parquet_path)["rows"]
+                csv_rows = _csv_rows(csv_path)
+                if rows != csv_rows:
+                    logging.warning(f"Keeping {csv_path}, {parquet_path.name} has {rows} rows instead of its {csv_rows}.")
+                    self.skipped.add(csv_path)
+                    continue
+                csv_path.unlink()
+            except FileNotFoundError:
+                continue
+
+    def update(self):
+        for data_dir in manifest.find_measurement_dirs(self.measurement_path):
+            try:
+                self.remove_replaced(data_dir)
+                self.compact_dir(data_dir)
+            except Exception as e:
+                logging.error(f"Compacting {data_dir} failed: {e}")
+
+    def run(self):
+        while True:
+            start = time.monotonic()
+            self.update()
+            time.sleep(max(0, self.interval - (time.monotonic() - start)))
+
+    def start(self):
+        if not columnar.available():
+            logging.warning("pyarrow is not installed, measurement files are not compacted.")
+            return None
+        thread = threading.Thread(target=self.run, daemon=True)
+        thread.start()
+        return thread
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert closed measurement CSV files to Parquet.")
+    parser.add_argument(
+        "--dir", action="store", default=Path.home() / "measurements", help="Directory with the measurements."
+    )
+    parser.add_argument(
+        "--format", action="store", default="%Y-%m-%d %H:%M:%S:%f", help="Time format of the sensor measurements."
+    )
+    parser.add_argument(
+        "--remove-delay", action="store", type=float, default=REMOVE_DELAY, help="Seconds to keep replaced CSV files."
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    compactor = Compactor(args.dir, args.format, remove_delay=args.remove_delay)
+    compactor.update()
+    # The second pass removes the replaced CSV files if they don't have to be kept.
+    compactor.update()
@@ -0,0 +1,295 @@
+import collections
+import io
+import logging
+import os
+import pathlib
+import threading
+
+import numpy as np
+import pandas as pd
+
+from measurement_store import columnar, manifest
+
+
+# Below this many bytes, the binary search for a timestamp stops and the rest is parsed.
+SEEK_RESOLUTION = 4096
+# Timestamps of the sensor drivers. This fixed-width layout is parsed without strptime.
+FAST_TIME_FORMAT = "%Y-%m-%d %H:%M:%S:%f"
+# Columns that are plotted for each sensor type (the name of the directory above the node). Only these are read,
+# all columns of other sensor types.
+SENSOR_FIELDS = {
+    "MU": [
+        "temp_external",
+        "light_external",
+        "humidity_external",
+        "differential_potential_ch1",
+        "differential_potential_ch2",
+        "RMS_CH1",
+        "RMS_CH2",
+        "transpiration",
+    ],
+    "Zigbee": [
+        "temp_external",
+        "humidity_external",
+        "air_pressure",
+        "mag_X",
+        "mag_Y",
+        "mag_Z",
+    ],
+}
+
+
+def parse_timestamp(value, fmt=None):
+    if isinstance(value, bytes):
+        value = value.decode(errors="replace")
+    timestamp = pd.to_datetime(value.strip(), format=fmt, errors="coerce")
+    return None if pd.isna(timestamp) else timestamp
+
+
+def fields_for(data_dir):
+    return SENSOR_FIELDS.get(pathlib.Path(data_dir).parent.name)
+
+
+def drop_incomplete(df, fields=None, time_column="datetime"):
+    """Drop the rows without a time or without a value in one of the fields.
+
+    Other columns may be empty, e.g. the burst aggregates of an interval without readings in the power log.
+    """
+    return df.dropna(subset=[column for column in [time_column, *(fields or [])] if column in df])
+
+
+def _parse_fixed_width(values):
+    """Parse timestamps in FAST_TIME_FORMAT from their digits. Returns the times and which ones are valid."""
+    # One byte more than the layout, so that longer strings can be detected.
+    chars = np.asarray(values, dtype="S27").view(np.uint8).reshape(-1, 27)
+    digits = chars.astype(np.int64) - ord("0")
+
+    def number(start, length):
+        result = np.zeros(len(chars), dtype=np.int64)
+        for i in range(start, start + length):
+            result = result * 10 + digits[:, i]
+        return result
+
+    valid = (chars[:, 26] == 0) & (chars[:, 10] == ord(" "))
+    for i in (4, 7):
+        valid &= chars[:, i] == ord("-")
+    for i in (13, 16, 19):
+        valid &= chars[:, i] == ord(":")
+    for i in (0, 1, 2, 3, 5, 6, 8, 9, 11, 12, 14, 15, 17, 18, 20, 21, 22, 23, 24, 25):
+        valid &= (digits[:, i] >= 0) & (digits[:, i] <= 9)
+
+    year, month, day = number(0, 4), number(5, 2), number(8, 2)
+    hour, minute, second = number(11, 2), number(14, 2), number(17, 2)
+    valid &= (month >= 1) & (month <= 12) & (hour < 24) & (minute < 60) & (second < 60)
+    year = np.where(valid, year, 1970)
+    month = np.where(valid, month, 1)
+
+    months = (year - 1970).astype("M8[Y]") + (month - 1).astype("m8[M]")
+    days_in_month = ((months + 1).astype("M8[D]") - months.astype("M8[D]")).astype(np.int64)
+    valid &= (day >= 1) & (day <= days_in_month)
+    day = np.where(valid, day, 1)
+
+    times = months.astype("M8[D]").astype("M8[us]") + (day - 1).astype("m8[D]")
+    times = times + (((hour * 60 + minute) * 60 + second) * 1_000_000 + number(20, 6)).astype("m8[us]")
+    return times, valid
+
+
+def parse_times(values, fmt=None):
+    """Parse a column of timestamps into datetime64[ns], with NaT for values that can't be parsed.
+
+    Values in FAST_TIME_FORMAT are parsed directly from their digits, which is much faster than strptime.
+    Other formats and values that don't fit the layout fall back to pandas.
+    """
+    values = pd.Series(values)
+    if fmt != FAST_TIME_FORMAT or values.empty or values.dtype.kind == "M":
+        return pd.to_datetime(values, format=fmt, errors="coerce").astype("datetime64[ns]")
+
+    try:
+        times, valid = _parse_fixed_width(values.to_numpy(dtype=object))
+    except UnicodeEncodeError:
+        return pd.to_datetime(values, format=fmt, errors="coerce").astype("datetime64[ns]")
+    result = pd.Series(times, index=values.index).astype("datetime64[ns]")
+    if not valid.all():
+        result[~valid] = pd.to_datetime(values[~valid], format=fmt, errors="coerce")
+    return result
+
+
+def read_csv(content, fields=None, time_column="datetime", on_bad_lines="warn"):
+    """Parse CSV content (bytes including the header).
+
+    With fields, only these columns and the time column are read, and the fields as float32.
+    """
+    if fields is None:
+        return pd.read_csv(io.BytesIO(content), on_bad_lines=on_bad_lines)
+
+    wanted = set(fields) | {time_column}
+    try:
+        return pd.read_csv(
+            io.BytesIO(content),
+            usecols=lambda column: column in wanted,
+            dtype={field: "float32" for field in fields},
+            on_bad_lines=on_bad_lines,
+        )
+    except ValueError:
+        # A corrupted value in one of the fields, convert what can be converted.
+        df = pd.read_csv(io.BytesIO(content), usecols=lambda column: column in wanted, on_bad_lines=on_bad_lines)
+        for field in fields:
+            if field in df:
+                df[field] = pd.to_numeric(df[field], errors="coerce").astype("float32")
+        return df
+
+
+def find_time_offset(f, start, fmt=None):
+    """Return the offset of a row at or before the first row newer than start.
+
+    Rows in measurement files are sorted by time, so the file can be bisected by byte offset
+    instead of being parsed from the beginning.
+    """
+    f.seek(0)
+    f.readline()
+    lo = f.tell()
+    hi = f.seek(0, os.SEEK_END)
+    while hi - lo > SEEK_RESOLUTION:
+        mid = (lo + hi) // 2
+        f.seek(mid)
+        f.readline()
+        row_start = f.tell()
+        timestamp = parse_timestamp(f.readline().split(b",", 1)[0], fmt)
+        # Unreadable rows are treated as being in range so that nothing is skipped.
+        if timestamp is not None and timestamp <= start:
+            lo = row_start
+        else:
+            hi = mid
+    return lo
+
+
+class _TailEntry():
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self.offset = 0
+        self.header = None
+        self.df = None
+
+    def update(self, file_path, time_column, fmt, fields=None):
+        size = file_path.stat().st_size
+        if size < self.offset:
+            # File was truncated or rewritten, start over.
+            self.__init__(self.file_name)
+        if size == self.offset:
+            return
+
+        with open(file_path, "rb") as f:
+            f.seek(self.offset)
+            chunk = f.read(size - self.offset)
+
+        # Only consume complete lines, the writer might be in the middle of a row.
+        end = chunk.rfind(b"\n")
+        if end < 0:
+            return
+        chunk = chunk[: end + 1]
+        self.offset += end + 1
+
+        if self.header is None:
+            header_end = chunk.find(b"\n")
+            self.header = chunk[: header_end + 1]
+            chunk = chunk[header_end + 1 :]
+
+        new_rows = read_csv(self.header + chunk, fields, time_column)
+        new_rows = drop_incomplete(new_rows, fields, time_column)
+        if time_column == "datetime" and time_column in new_rows:
+            new_rows[time_column] = parse_times(new_rows[time_column], fmt)
+
+        if self.df is None or self.df.empty:
+            self.df = new_rows
+        elif not new_rows.empty:
+            self.df = pd.concat([self.df, new_rows], ignore_index=True)
+
+
+class CsvTailCache():
+    """Cache of the latest CSV file per directory that parses only the rows appended since the last read."""
+
+    def __init__(self):
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def read(self, data_dir, file_name, time_column="datetime", fmt=None):
+        data_dir = pathlib.Path(data_dir)
+        with self.lock:
+            entry = self.entries.get(data_dir)
+            if entry is None or entry.file_name != file_name:
+                if entry is not None:
+                    logging.info(f"New file in {data_dir}: {file_name}")
+                entry = _TailEntry(file_name)
+                self.entries[data_dir] = entry
+
+            entry.update(data_dir / file_name, time_column, fmt, fields_for(data_dir))
+            if entry.df is None:
+                return pd.DataFrame(columns=[time_column])
+            return entry.df
+
+    def forget(self, data_dir):
+        with self.lock:
+            self.entries.pop(pathlib.Path(data_dir), None)
+
+
+class WindowReader():
+    """Read the rows newer than a given time from all files of a directory that overlap the window.
+
+    The latest file goes through the tail cache. Older files are closed, so they are read once,
+    starting from the first row in the window, and kept in a small LRU cache.
+    """
+
+    def __init__(self, tail_cache, max_closed_files=4):
+        self.tail_cache = tail_cache
+        self.max_closed_files = max_closed_files
+        self.closed_files = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def read(self, data_dir, start, fmt=None):
+        data_dir = pathlib.Path(data_dir)
+        files = manifest.get(data_dir).files()
+
+        df = self.tail_cache.read(data_dir, files[-1]["name"], "datetime", fmt)
+        frames = [df.loc[df["datetime"] > start]]
+
+        with self.lock:
+            for entry in reversed(files[:-1]):
+                if entry["rows"] == 0:
+                    continue
+                last_timestamp = parse_timestamp(entry["last"], fmt)
+                if last_timestamp is not None and last_timestamp <= start:
+                    break
+                frames.append(self._read_closed(data_dir / entry["name"], start, fmt))
+
+        frames = [frame for frame in reversed(frames) if not frame.empty]
+        if len(frames) > 1:
+            return pd.concat(frames, ignore_index=True)
+        return frames[0] if frames else df.iloc[0:0]
+
+    def _read_closed(self, file_path, start, fmt):
+        stat = file_path.stat()
+        version = (stat.st_size, stat.st_mtime_ns)
+        cached = self.closed_files.get(file_path)
+        if cached is not None and cached[0] == version and cached[1] <= start:
+            self.closed_files.move_to_end(file_path)
+            df = cached[2]
+        else:
+            fields = fields_for(file_path.parent)
+            if columnar.is_columnar(file_path):
+                # Only the row groups in the window are decoded.
+                df = drop_incomplete(columnar.read_frame(file_path, start, fields), fields)
+                if fields is not None:
+                    df = df.astype({field: "float32" for field in fields if field in df})
+            else:
+                with open(file_path, "rb") as f:
+                    header = f.readline()
+                    f.seek(find_time_offset(f, start, fmt))
+                    content = f.read()
+                df = drop_incomplete(read_csv(header + content, fields), fields)
+                df["datetime"] = parse_times(df["datetime"], fmt)
+
+            self.closed_files[file_path] = (version, start, df)
+            while len(self.closed_files) > self.max_closed_files:
+                self.closed_files.popitem(last=False)
+
+        return df.loc[df["datetime"] > start]
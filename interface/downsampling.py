@@ -0,0 +1,98 @@
+import numpy as np
+
+METHODS = ("lttb", "minmax", "mean")
+
+
+def _bucket_edges(length, num_buckets):
+    return np.linspace(0, length, num_buckets + 1).astype(np.int64)
+
+
+def lttb(x, y, num_out):
+    """Indices of the points selected by the Largest-Triangle-Three-Buckets algorithm.
+
+    x and y must be float arrays without NaN values. The first and the last point are always kept.
+    """
+    length = len(y)
+    if num_out >= length or num_out < 3:
+        return np.arange(length)
+
+    # Buckets cover all points except the first and the last one.
+    edges = _bucket_edges(length - 2, num_out - 2) + 1
+    counts = np.diff(edges)
+    avg_x = np.add.reduceat(x[1:-1], edges[:-1] - 1) / counts
+    avg_y = np.add.reduceat(y[1:-1], edges[:-1] - 1) / counts
+    # The third point of the last bucket's triangle is the last data point.
+    avg_x = np.append(avg_x[1:], x[-1])
+    avg_y = np.append(avg_y[1:], y[-1])
+
+    selected = np.empty(num_out, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = length - 1
+    a = 0
+    for i in range(num_out - 2):
+        start, end = edges[i], edges[i + 1]
+        ax, ay = x[a], y[a]
+        area = np.abs((ax - avg_x[i]) * (y[start:end] - ay) - (ax - x[start:end]) * (avg_y[i] - ay))
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+
+    return selected
+
+
+def min_max(x, y, num_out):
+    """Indices of the minimum and the maximum of each bucket, in the original order."""
+    length = len(y)
+    num_buckets = num_out // 2
+    if num_out >= length or num_buckets < 1:
+        return np.arange(length)
+
+    # Pad with the last value to a rectangular array so that all buckets are handled at once.
+    bucket_len = -(-length // num_buckets)
+    padded = np.full(num_buckets * bucket_len, y[-1])
+    padded[:length] = y
+    padded = padded.reshape(num_buckets, bucket_len)
+    offsets = np.arange(num_buckets) * bucket_len
+
+    min_idx = np.minimum(np.argmin(padded, axis=1) + offsets, length - 1)
+    max_idx = np.minimum(np.argmax(padded, axis=1) + offsets, length - 1)
+    return np.unique(np.concatenate([min_idx, max_idx]))
+
+
+def mean(x, y, num_out):
+    """Average of x and y in each of num_out buckets."""
+    length = len(y)
+    if num_out >= length:
+        return x, y
+
+    edges = _bucket_edges(length, num_out)[:-1]
+    counts = np.diff(np.append(edges, length))
+    return np.add.reduceat(x, edges) / counts, np.add.reduceat(y, edges) / counts
+
+
+def downsample(x, y, num_out, method="lttb"):
+    """Reduce a series to about num_out representative points.
+
+    Time axes (datetime64) are supported and returned with the same dtype. NaN values are dropped.
+    """
+    x = np.asarray(x)
+    y = np.asarray(y, dtype=np.float64)
+    is_time = np.issubdtype(x.dtype, np.datetime64)
+    x_values = x.astype(np.int64).astype(np.float64) if is_time else x.astype(np.float64)
+
+    keep = ~np.isnan(y)
+    if not keep.all():
+        x, x_values, y = x[keep], x_values[keep], y[keep]
+
+    if method == "lttb":
+        idx = lttb(x_values, y, num_out)
+    elif method == "minmax":
+        idx = min_max(x_values, y, num_out)
+    elif method == "mean":
+        x_out, y_out = mean(x_values, y, num_out)
+        if is_time:
+            x_out = x_out.astype(np.int64).astype(x.dtype)
+        return x_out, y_out
+    else:
+        raise ValueError(f"Unknown downsampling method: {method}")
+
+    return x[idx], y[idx]
@@ -0,0 +1,168 @@
+import hashlib
+import json
+import logging
+import re
+import shutil
+import threading
+import uuid
+from pathlib import Path
+
+from measurement_store import export, manifest
+
+# Archives written by the jobs, and the temporary file and directory of an unfinished one.
+ARCHIVE_PATTERN = re.compile(r"\.?data(_new_.+)?_[0-9a-f]{12}\.zip(\.tmp|\.parts)?")
+
+
+class ExportCancelled(Exception):
+    pass
+
+
+class ExportJob():
+    """One export running in the background, shared by all requests for the same data."""
+
+    def __init__(self, key, client, zip_file_path, total_files, total_bytes):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.client = client
+        self.zip_file_path = zip_file_path
+        self.state = "running"
+        self.error = None
+        self.files = 0
+        self.bytes = 0
+        self.total_files = total_files
+        self.total_bytes = total_bytes
+        self.requests = 1
+        self.cancelled = threading.Event()
+
+    def status(self):
+        return {
+            "state": self.state,
+            "error": self.error,
+            "files": self.files,
+            "bytes": self.bytes,
+            "total_files": self.total_files,
+            "total_bytes": self.total_bytes,
+        }
+
+
+class ExportJobManager():
+    """Runs exports of the measurements for the dashboard.
+
+    Requests for the same data share one job: the key of a job is the state of the manifests (and the watermarks
+    of the client for incremental exports). A finished archive is served again until the data changes.
+    """
+
+    def __init__(self, measurements_path, output_path):
+        self.measurements_path = Path(measurements_path)
+        self.output_path = Path(output_path)
+        self.jobs = {}
+        self.jobs_by_key = {}
+        self.lock = threading.Lock()
+        self._remove_old_archives()
+
+    def _remove_old_archives(self):
+        """Delete the archives left from before a restart, the jobs that could serve them are gone."""
+        if not self.output_path.is_dir():
+            return
+        for path in self.output_path.iterdir():
+            if not ARCHIVE_PATTERN.fullmatch(path.name):
+                continue
+            try:
+                if path.is_dir():
+                    shutil.rmtree(path)
+                else:
+                    path.unlink()
+            except OSError as e:
+                logging.warning(f"Could not remove old export {path}: {e}")
+
+    def _plan(self, client):
+        """Return the key of the export and how many files and bytes it will process."""
+        state = []
+        for data_dir in manifest.find_measurement_dirs(self.measurements_path):
+            state.extend(
+                (data_dir.name, entry["name"], entry["offset"], entry["size"], entry["closed"])
+                for entry in manifest.get(data_dir).files()
+            )
+
+        if client is None:
+            groups = list(export.merge_groups(self.measurements_path))
+            total_files = len(groups)
+            total_bytes = sum(entry["size"] for _, parts in groups for _, entry in parts)
+            watermarks = None
+        else:
+            watermarks = export.current_watermarks(self.measurements_path, export.load_watermarks(client))
+            changes = export.find_changes(self.measurements_path, watermarks)
+            total_files = len(changes) + 1
+            total_bytes = sum(part["size"] for part in changes)
+
+        key = hashlib.sha1(json.dumps([client, state, watermarks], sort_keys=True).encode()).hexdigest()
+        return key, total_files, total_bytes
+
+    def submit(self, client=None):
+        """Start an export of all measurements, or of the new data for client, unless the same one exists."""
+        key, total_files, total_bytes = self._plan(client)
+        with self.lock:
+            job = self.jobs_by_key.get(key)
+            if job is not None and job.state == "running":
+                job.requests += 1
+                return job
+            if job is not None and job.state == "done" and job.zip_file_path.exists():
+                return job
+
+            name = "data" if client is None else f"data_new_{client}"
+            zip_file_path = self.output_path / f"{name}_{key[:12]}.zip"
+            job = ExportJob(key, client, zip_file_path, total_files, total_bytes)
+            self.jobs[job.id] = job
+            self.jobs_by_key[key] = job
+        threading.Thread(target=self._run, args=(job,), daemon=True).start()
+        return job
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def cancel(self, job_id):
+        """Withdraw one request for a job. The job is stopped when nobody waits for it anymore."""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None or job.state != "running":
+                return
+            job.requests -= 1
+            if job.requests <= 0:
+                job.cancelled.set()
+
+    def _run(self, job):
+        def progress(entry):
+            if job.cancelled.is_set():
+                raise ExportCancelled()
+            job.files += 1
+            job.bytes += entry["size"]
+
+        try:
+            self.output_path.mkdir(parents=True, exist_ok=True)
+            if job.client is None:
+                export.export_measurements(self.measurements_path, job.zip_file_path, progress=progress)
+            else:
+                stats = export.export_changes(self.measurements_path, job.zip_file_path, job.client, progress=progress)
+                # The download can't be confirmed, the data counts as delivered once the archive is ready.
+                export.save_watermarks(job.client, stats["watermarks"])
+            state = "done"
+        except ExportCancelled:
+            state = "cancelled"
+        except Exception as e:
+            logging.error(f"Export failed: {e}")
+            job.error = str(e)
+            state = "failed"
+
+        with self.lock:
+            job.state = state
+            if state != "done":
+                del self.jobs_by_key[job.key]
+                return
+            # Only the latest archive of each kind is kept.
+            for old_job in list(self.jobs.values()):
+                if old_job is not job and old_job.client == job.client and old_job.state != "running":
+                    del self.jobs[old_job.id]
+                    if self.jobs_by_key.get(old_job.key) is old_job:
+                        del self.jobs_by_key[old_job.key]
+                    old_job.zip_file_path.unlink(missing_ok=True)
@@ -0,0 +1,73 @@
+import collections
+import threading
+import time
+
+
+class _Entry():
+    def __init__(self):
+        self.version = None
+        self.value = None
+        self.updated = 0
+        self.building = None
+
+
+class FigureCache():
+    """Built figures shared between all browser sessions.
+
+    Values are keyed by the plot settings and validated against the version of the source data.
+    Even if the data doesn't change, values are rebuilt after max_age seconds because the time window moves.
+    While one session rebuilds an outdated value, the other sessions get the stale value instead of
+    repeating the work (stale-while-revalidate). Sessions only wait if there is no value at all yet.
+    """
+
+    def __init__(self, max_entries=16, max_age=60, max_stale=60):
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.max_stale = max_stale
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, version, build):
+        owner = False
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                entry = self.entries[key] = _Entry()
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+            self.entries.move_to_end(key)
+
+            age = time.monotonic() - entry.updated
+            if entry.value is not None and entry.version == version and age < self.max_age:
+                self.hits += 1
+                return entry.value
+
+            if entry.building is None:
+                entry.building = threading.Event()
+                owner = True
+                self.misses += 1
+            elif entry.value is not None and age < self.max_stale:
+                self.hits += 1
+                return entry.value
+            building = entry.building
+
+        if not owner:
+            # There is no usable value yet, wait until the other session has built it.
+            building.wait()
+            with self.lock:
+                value = entry.value
+            return value if value is not None else build()
+
+        try:
+            value = build()
+            with self.lock:
+                entry.value = value
+                entry.version = version
+                entry.updated = time.monotonic()
+            return value
+        finally:
+            with self.lock:
+                entry.building = None
+            building.set()
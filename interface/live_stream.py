@@ -0,0 +1,86 @@
+import json
+import logging
+import queue
+import threading
+
+import flask
+import zmq
+
+# Producers (e.g. i2c_sensors.py) connect to this address and publish [topic, JSON sample] messages.
+# The topic is the name of the sensor node as shown in the dashboard, e.g. "Power" or "CYB1".
+LIVE_DATA_ADDRESS = "tcp://127.0.0.1:5557"
+KEEPALIVE_INTERVAL = 15
+CLIENT_QUEUE_SIZE = 100
+
+
+class LiveStream():
+    """Subscribe once to the samples published by the producers and fan them out to the browsers.
+
+    Browsers connect with server-sent events to /stream?topic=<name>&topic=<name>...
+    """
+
+    def __init__(self, address=LIVE_DATA_ADDRESS):
+        self.address = address
+        self.clients = set()
+        self.lock = threading.Lock()
+
+    def start(self):
+        thread = threading.Thread(target=self.run, daemon=True)
+        thread.start()
+        return thread
+
+    def run(self):
+        zmq_context = zmq.Context.instance()
+        zmq_socket = zmq_context.socket(zmq.SUB)
+        zmq_socket.bind(self.address)
+        zmq_socket.subscribe(b"")
+        try:
+            while True:
+                try:
+                    topic, payload = zmq_socket.recv_multipart()
+                    message = json.dumps({"topic": topic.decode(), "sample": json.loads(payload)})
+                except ValueError as e:
+                    logging.warning(f"Invalid live data message: {e}")
+                    continue
+                self.publish(topic.decode(), message)
+        finally:
+            zmq_socket.close()
+
+    def publish(self, topic, message):
+        with self.lock:
+            clients = list(self.clients)
+        for topics, client_queue in clients:
+            if topic in topics:
+                try:
+                    client_queue.put_nowait(message)
+                except queue.Full:
+                    # Slow clients lose samples, they will be filled in by the regular refresh.
+                    pass
+
+    def events(self, topics):
+        client = (frozenset(topics), queue.Queue(maxsize=CLIENT_QUEUE_SIZE))
+        with self.lock:
+            self.clients.add(client)
+        try:
+            yield ": connected\n\n"
+            while True:
+                try:
+                    message = client[1].get(timeout=KEEPALIVE_INTERVAL)
+                    yield f"data: {message}\n\n"
+                except queue.Empty:
+                    # Writing to a closed connection ends the generator.
+                    yield ": keepalive\n\n"
+        finally:
+            with self.lock:
+                self.clients.discard(client)
+
+    def register(self, server, route="/stream"):
+        def stream():
+            topics = flask.request.args.getlist("topic")
+            return flask.Response(
+                self.events(topics),
+                mimetype="text/event-stream",
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+            )
+
+        server.add_url_rule(route, "live_stream", stream)
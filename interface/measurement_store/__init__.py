@@ -0,0 +1,4 @@
+"""Measurement files on disk: the per-directory manifests, Parquet compaction and exports.
+
+Shared by the dashboard and the system scripts (Telegram bot, clean-up), install with `pip3 install -e .` here.
+"""
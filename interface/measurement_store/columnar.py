@@ -0,0 +1,146 @@
+import io
+import json
+import os
+import tempfile
+from pathlib import Path
+
+import pandas as pd
+
+try:
+    import pyarrow
+    import pyarrow.parquet as pq
+except ImportError:
+    pyarrow = None
+
+SUFFIX = ".parquet"
+COMPRESSION = "zstd"
+CHUNK_ROWS = 100_000
+# Key of the schema metadata with the manifest fields of the original CSV file.
+METADATA_KEY = b"orangebox"
+# Replaced CSV files are kept this long, so that readers that listed them before can finish.
+REMOVE_DELAY = 600
+
+
+def available():
+    return pyarrow is not None
+
+
+def is_columnar(file_path):
+    return str(file_path).endswith(SUFFIX)
+
+
+def _typed(df, column_types, fmt):
+    """Convert the columns of a chunk to the types decided by the first chunk. Raise ValueError if a value is lost."""
+    times = pd.to_datetime(df["datetime"], format=fmt, errors="coerce")
+    if times.isna().any():
+        raise ValueError(f"{times.isna().sum()} timestamps can't be parsed")
+    df["datetime"] = times
+    for column in df.columns:
+        if column == "datetime":
+            continue
+        dtype = column_types.get(column, "string")
+        if dtype == "string":
+            df[column] = df[column].astype("string")
+            continue
+        values = pd.to_numeric(df[column], errors="coerce")
+        lost = values.isna() & df[column].notna()
+        if dtype == "Int64":
+            lost |= values.notna() & (values != values.round())
+        if lost.any():
+            raise ValueError(f"{lost.sum()} values of column {column} are not {dtype}")
+        df[column] = values.astype(dtype)
+    return df
+
+
+def convert(csv_path, entry, fmt=None):
+    """Convert a closed CSV file with a datetime column into a Parquet file next to it and return its path.
+
+    The datetime column is stored as a timestamp, integer columns as Int64, other numeric columns as float64 and
+    everything else as strings. The file is converted in chunks and written to a unique temporary file first. The
+    manifest fields of the CSV file are kept in the metadata, so the first and last timestamps keep their original
+    formatting.
+    The conversion must be lossless: it raises ValueError (and writes no Parquet file) if a value doesn't fit the
+    type of its column or if not all rows of entry made it.
+    """
+    csv_path = Path(csv_path)
+    parquet_path = csv_path.with_suffix(SUFFIX)
+    # The logger and the compaction may convert the same file at once, each writes to its own temporary file.
+    prefix = f".{parquet_path.name}."
+    with tempfile.NamedTemporaryFile(dir=csv_path.parent, prefix=prefix, suffix=".tmp", delete=False) as f:
+        tmp_path = Path(f.name)
+    writer = None
+    rows = 0
+    try:
+        for chunk in pd.read_csv(csv_path, chunksize=CHUNK_ROWS, on_bad_lines="skip"):
+            if writer is None:
+                # Column types are decided by the first chunk, so that all row groups have the same schema.
+                column_types = {column: "Int64" for column in chunk.select_dtypes("integer").columns}
+                column_types.update((column, "float64") for column in chunk.select_dtypes("floating").columns)
+                chunk = _typed(chunk, column_types, fmt)
+                schema = pyarrow.Schema.from_pandas(chunk, preserve_index=False)
+                writer = pq.ParquetWriter(tmp_path, schema, compression=COMPRESSION)
+            else:
+                chunk = _typed(chunk, column_types, fmt)
+            writer.write_table(pyarrow.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+            rows += len(chunk)
+        if writer is None:
+            return None
+        if rows != entry["rows"]:
+            raise ValueError(f"{rows} of {entry['rows']} rows could be read")
+
+        metadata = {key: entry[key] for key in ("header", "first", "last", "last_row")}
+        metadata.update(rows=rows, time_format=fmt, source=csv_path.name, source_size=csv_path.stat().st_size)
+        writer.add_key_value_metadata({METADATA_KEY: json.dumps(metadata).encode()})
+        writer.close()
+        writer = None
+        os.replace(tmp_path, parquet_path)
+    finally:
+        if writer is not None:
+            writer.close()
+        if tmp_path.exists():
+            tmp_path.unlink()
+    return parquet_path
+
+
+def read_metadata(file_path):
+    """Return the manifest fields (header, first, last, last_row, rows) and the time format of a Parquet file."""
+    metadata = pq.read_metadata(file_path).metadata or {}
+    if METADATA_KEY in metadata:
+        return json.loads(metadata[METADATA_KEY])
+
+    # Written by something else, describe it from the data.
+    df = read_frame(file_path)
+    last_row = df.iloc[-1].astype(str).str.cat(sep=",") if len(df) else None
+    return {
+        "header": ",".join(df.columns),
+        "first": str(df["datetime"].iloc[0]) if len(df) else None,
+        "last": str(df["datetime"].iloc[-1]) if len(df) else None,
+        "last_row": last_row,
+        "rows": len(df),
+        "time_format": None,
+    }
+
+
+def read_frame(file_path, start=None, columns=None):
+    """Read the rows newer than start, and only the given columns (plus datetime) if columns is set.
+
+    Row groups that end before start are skipped without being decoded.
+    """
+    if columns is not None:
+        names = pq.read_schema(file_path).names
+        columns = ["datetime"] + [column for column in columns if column != "datetime" and column in names]
+    filters = [("datetime", ">", pd.Timestamp(start))] if start is not None else None
+    return pd.read_parquet(file_path, columns=columns, filters=filters)
+
+
+def write_csv(file_path, out, columns, time_format=None):
+    """Write the rows of a Parquet file as CSV lines with the given columns to the binary stream out."""
+    parquet_file = pq.ParquetFile(file_path)
+    available_columns = [column for column in columns if column in parquet_file.schema_arrow.names]
+    text_out = io.TextIOWrapper(out, encoding="utf-8", newline="", write_through=True)
+    for batch in parquet_file.iter_batches(batch_size=CHUNK_ROWS, columns=available_columns):
+        df = batch.to_pandas().reindex(columns=columns)
+        if time_format is not None and "datetime" in df:
+            df["datetime"] = df["datetime"].dt.strftime(time_format)
+        df.to_csv(text_out, header=False, index=False, lineterminator="\n")
+    text_out.detach()
@@ -0,0 +1,547 @@
+import argparse
+import collections
+import concurrent.futures
+import csv
+import functools
+import io
+import json
+import logging
+import lzma
+import os
+import shutil
+import struct
+import time
+import zipfile
+import zlib
+from datetime import datetime
+from pathlib import Path
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from . import columnar, manifest
+
+COPY_BLOCK_SIZE = 1 << 20
+ZIP64_LIMIT = (1 << 32) - 1
+
+# Codec: (zip compression method, version needed to extract, default level)
+CODECS = {
+    "deflate": (zipfile.ZIP_DEFLATED, 20, 1),
+    "lzma": (zipfile.ZIP_LZMA, 63, 6),
+    "zstd": (93, 63, 3),
+}
+DEFAULT_CODEC = "deflate"
+# Dictionary size of each LZMA preset, it is part of the properties in the entry's LZMA header.
+LZMA_DICT_SIZES = (1 << 18, 1 << 20, 1 << 21, 1 << 22, 1 << 22, 1 << 23, 1 << 23, 1 << 24, 1 << 25, 1 << 26)
+
+WATERMARK_PATH = Path.home() / "OrangeBox/status/export_watermarks"
+MANIFEST_NAME = "export_manifest.json"
+
+
+def _columns(header):
+    return next(csv.reader([header]))
+
+
+def merge_groups(measurements_path):
+    """Yield the name of each merged file in the archive and the manifest entries with paths of its parts.
+
+    All files of a measurement directory are merged into one file per node. Power files are merged per prefix
+    (host name).
+    """
+    for data_dir in manifest.find_measurement_dirs(measurements_path):
+        # Files without any rows are known from the manifest and don't have to be opened.
+        entries = manifest.get(data_dir).files()
+        if data_dir.name == "Power":
+            groups = {}
+            for entry in entries:
+                if entry["rows"] > 0:
+                    groups.setdefault(entry["name"].split("_")[0], []).append(entry)
+
+            for group in groups.values():
+                group.sort(key=lambda entry: Path(entry["name"]).stem)
+                base_file_name = Path(group[0]["name"]).stem
+                yield f"Power/{base_file_name}_merged_{len(group)}.csv", [(data_dir / e["name"], e) for e in group]
+
+        elif entries:
+            base_file_name = Path(entries[0]["name"]).stem
+            out_dir_structure = data_dir.relative_to(data_dir.parents[2]).parents[1]
+            parts = [(data_dir / entry["name"], entry) for entry in entries if entry["rows"] > 0]
+            if parts:
+                yield f"{out_dir_structure.as_posix()}/{base_file_name}_merged_{len(entries)}.csv", parts
+
+
+def _copy_rows(file_path, out, closed):
+    """Copy the rows of a CSV file without its header, block by block."""
+    with open(file_path, "rb") as f:
+        f.readline()
+        pending = b""
+        while True:
+            block = f.read(COPY_BLOCK_SIZE)
+            if not block:
+                break
+            block = pending + block
+            end = block.rfind(b"\n") + 1
+            out.write(block[:end])
+            pending = block[end:]
+    # The last line of a file that is still being written might be incomplete.
+    if pending.strip() and closed:
+        out.write(pending + b"\n")
+
+
+def _copy_realigned_rows(file_path, out, columns, closed):
+    """Copy the rows of a CSV file whose columns differ from the merged file, line by line."""
+    text_out = io.TextIOWrapper(out, encoding="utf-8", newline="", write_through=True)
+    writer = csv.DictWriter(text_out, columns, extrasaction="ignore")
+    with open(file_path, "r", newline="", encoding="utf-8", errors="replace") as f:
+        for line in csv.DictReader(_complete_lines(f, closed)):
+            writer.writerow(line)
+    text_out.detach()
+
+
+def _complete_lines(f, closed):
+    for line in f:
+        if line.endswith("\n") or closed:
+            yield line
+
+
+def merge_files(parts, out):
+    """Concatenate the CSV files of one group into the binary stream out, with a single header.
+
+    Files with the same header are copied as bytes. If the columns changed between files (e.g. after a
+    configuration change), all columns are written and rows are realigned to them. Parquet files are converted
+    back to CSV rows.
+    """
+    headers = [entry["header"] for _, entry in parts]
+    columns = []
+    for header in headers:
+        columns.extend(column for column in _columns(header) if column not in columns)
+
+    same_header = all(header == headers[0] for header in headers)
+    if same_header and columnar.is_columnar(parts[0][0]):
+        out.write(f"{headers[0]}\n".encode())
+    elif same_header:
+        with open(parts[0][0], "rb") as f:
+            out.write(f.readline())
+    else:
+        header = io.StringIO()
+        csv.writer(header).writerow(columns)
+        out.write(header.getvalue().encode())
+
+    for file_path, entry in parts:
+        if columnar.is_columnar(file_path):
+            # Compacted files are written as CSV again, with timestamps in their original format.
+            time_format = columnar.read_metadata(file_path).get("time_format")
+            columnar.write_csv(file_path, out, columns, time_format)
+        elif same_header or _columns(entry["header"]) == columns:
+            _copy_rows(file_path, out, entry["closed"])
+        else:
+            _copy_realigned_rows(file_path, out, columns, entry["closed"])
+
+
+def available_codecs():
+    return [codec for codec in CODECS if codec != "zstd" or zstandard is not None]
+
+
+class _LzmaCompressor:
+    """Raw LZMA1 stream of a zip entry, which starts with the LZMA SDK version and the encoder properties."""
+
+    def __init__(self, level):
+        if not 0 <= level < len(LZMA_DICT_SIZES):
+            raise ValueError(f"LZMA level {level} is not in 0..{len(LZMA_DICT_SIZES) - 1}.")
+        dict_size = LZMA_DICT_SIZES[level]
+        lc, lp, pb = 3, 0, 2
+        self.compressor = lzma.LZMACompressor(
+            lzma.FORMAT_RAW,
+            filters=[{"id": lzma.FILTER_LZMA1, "preset": level, "dict_size": dict_size, "lc": lc, "lp": lp, "pb": pb}],
+        )
+        properties = struct.pack("<BI", (pb * 5 + lp) * 9 + lc, dict_size)
+        self.header = struct.pack("<BBH", 9, 4, len(properties)) + properties
+
+    def compress(self, data):
+        header, self.header = self.header, b""
+        return header + self.compressor.compress(data)
+
+    def flush(self):
+        header, self.header = self.header, b""
+        return header + self.compressor.flush()
+
+
+def _compressor(codec, level):
+    if codec == "deflate":
+        return zlib.compressobj(level, zlib.DEFLATED, -15)
+    if codec == "lzma":
+        return _LzmaCompressor(level)
+    return zstandard.ZstdCompressor(level=level).compressobj()
+
+
+class _CompressedFile(io.RawIOBase):
+    """Binary stream that compresses everything written to it into a file and keeps the CRC and size."""
+
+    def __init__(self, path, codec, level):
+        self.file = open(path, "wb")
+        self.compressor = _compressor(codec, level)
+        self.crc = 0
+        self.size = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.crc = zlib.crc32(data, self.crc)
+        self.size += len(data)
+        self.file.write(self.compressor.compress(data))
+        return len(data)
+
+    def close(self):
+        if not self.closed:
+            self.file.write(self.compressor.flush())
+            self.file.close()
+        super().close()
+
+
+def _compress_entry(name, mtime, write, path, codec, level):
+    """Write one archive entry compressed into path. Runs in a worker thread; zlib, lzma and zstd release the GIL."""
+    with _CompressedFile(path, codec, level) as out:
+        write(out)
+    return {
+        "name": name,
+        "path": path,
+        "codec": codec,
+        "crc": out.crc,
+        "size": out.size,
+        "compressed_size": path.stat().st_size,
+        "mtime": mtime,
+    }
+
+
+def _dos_time(timestamp):
+    t = time.localtime(max(timestamp, 315619200))
+    return (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2), ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+
+
+def _header_fields(entry):
+    method, version, _ = CODECS[entry["codec"]]
+    name = entry["name"].encode()
+    flags = 0 if name.isascii() else 0x800
+    if entry["codec"] == "lzma":
+        # The compressed data ends with an end of stream marker.
+        flags |= 0x02
+    zip64 = max(entry["size"], entry["compressed_size"], entry.get("offset", 0)) >= ZIP64_LIMIT
+    return name, flags, method, max(version, 45) if zip64 else version, *_dos_time(entry["mtime"])
+
+
+def _append_entry(f, entry):
+    """Write the local header and the compressed data of an entry to the archive."""
+    # The offset decides whether the entry needs zip64, so it is set before the header fields.
+    entry["offset"] = f.tell()
+    name, flags, method, version, dos_time, dos_date = _header_fields(entry)
+    sizes = (entry["compressed_size"], entry["size"])
+    extra = b""
+    if max(sizes) >= ZIP64_LIMIT:
+        extra = struct.pack("<HHQQ", 1, 16, entry["size"], entry["compressed_size"])
+        sizes = (0xFFFFFFFF, 0xFFFFFFFF)
+    f.write(
+        struct.pack(
+            "<4s2B4HL2L2H",
+            b"PK\x03\x04",
+            version,
+            0,
+            flags,
+            method,
+            dos_time,
+            dos_date,
+            entry["crc"],
+            *sizes,
+            len(name),
+            len(extra),
+        )
+    )
+    f.write(name + extra)
+    with open(entry["path"], "rb") as compressed:
+        shutil.copyfileobj(compressed, f, COPY_BLOCK_SIZE)
+    entry["path"].unlink()
+    return entry
+
+
+def _write_central_directory(f, entries):
+    start = f.tell()
+    for entry in entries:
+        name, flags, method, version, dos_time, dos_date = _header_fields(entry)
+        fields = [entry["size"], entry["compressed_size"], entry["offset"]]
+        # Values that don't fit are moved to the zip64 extra field, in this order.
+        large = [value for value in fields if value >= ZIP64_LIMIT]
+        extra = struct.pack(f"<HH{len(large)}Q", 1, 8 * len(large), *large) if large else b""
+        size, compressed_size, offset = (min(value, 0xFFFFFFFF) for value in fields)
+        f.write(
+            struct.pack(
+                "<4s4B4HL2L5H2L",
+                b"PK\x01\x02",
+                version,
+                3,
+                version,
+                0,
+                flags,
+                method,
+                dos_time,
+                dos_date,
+                entry["crc"],
+                compressed_size,
+                size,
+                len(name),
+                len(extra),
+                0,
+                0,
+                0,
+                0o644 << 16,
+                offset,
+            )
+        )
+        f.write(name + extra)
+
+    end = f.tell()
+    count = len(entries)
+    if count >= 0xFFFF or end >= ZIP64_LIMIT:
+        f.write(struct.pack("<4sQ2H2L4Q", b"PK\x06\x06", 44, 45, 45, 0, 0, count, count, end - start, start))
+        f.write(struct.pack("<4sLQL", b"PK\x06\x07", 0, end, 1))
+    f.write(
+        struct.pack(
+            "<4s4H2LH",
+            b"PK\x05\x06",
+            0,
+            0,
+            min(count, 0xFFFF),
+            min(count, 0xFFFF),
+            min(end - start, 0xFFFFFFFF),
+            min(start, 0xFFFFFFFF),
+            0,
+        )
+    )
+
+
+def write_archive(entries, zip_file_path, codec=DEFAULT_CODEC, level=None, jobs=None, progress=None):
+    """Write a zip archive, compressing its entries in parallel.
+
+    entries yields (name, mtime, write) for each file of the archive, where write(out) writes the content of the
+    file into a binary stream. Each entry is compressed by a worker into its own temporary file and appended to the
+    archive in order. Only a few finished entries wait on disk at a time. The archive is written next to the target
+    and moved into place when it is complete. Returns the number of files, sizes and duration.
+
+    progress(entry) is called after each appended entry. An exception raised by it cancels the export.
+    """
+    if codec not in available_codecs():
+        raise ValueError(f"Codec {codec} is not available, use one of {available_codecs()}.")
+    if level is None:
+        level = CODECS[codec][2]
+    jobs = jobs or os.cpu_count() or 1
+
+    zip_file_path = Path(zip_file_path)
+    tmp_file = zip_file_path.with_name(f".{zip_file_path.name}.tmp")
+    tmp_dir = zip_file_path.with_name(f".{zip_file_path.name}.parts")
+    start = time.perf_counter()
+    written = []
+    pending = collections.deque()
+
+    def append_next(f):
+        written.append(_append_entry(f, pending.popleft().result()))
+        if progress is not None:
+            progress(written[-1])
+
+    try:
+        tmp_dir.mkdir(parents=True, exist_ok=True)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor, open(tmp_file, "wb") as f:
+            try:
+                for i, (name, mtime, write) in enumerate(entries):
+                    pending.append(
+                        executor.submit(_compress_entry, name, mtime, write, tmp_dir / str(i), codec, level)
+                    )
+                    while len(pending) > 2 * jobs:
+                        append_next(f)
+                while pending:
+                    append_next(f)
+            except BaseException:
+                # Don't start entries that are still queued.
+                for future in pending:
+                    future.cancel()
+                raise
+            _write_central_directory(f, written)
+            compressed_size = f.tell()
+        os.replace(tmp_file, zip_file_path)
+    finally:
+        if tmp_file.exists():
+            tmp_file.unlink()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    stats = {
+        "files": len(written),
+        "size": sum(entry["size"] for entry in written),
+        "compressed_size": compressed_size,
+        "seconds": time.perf_counter() - start,
+    }
+    logging.info(
+        f"Exported {stats['files']} files with {codec} on {jobs} threads: {stats['size'] / 1e6:.1f} MB -> "
+        f"{stats['compressed_size'] / 1e6:.1f} MB in {stats['seconds']:.1f} s "
+        f"({stats['size'] / 1e6 / max(stats['seconds'], 1e-6):.1f} MB/s)"
+    )
+    return stats
+
+
+def export_measurements(measurements_path, zip_file_path, codec=DEFAULT_CODEC, level=None, jobs=None, progress=None):
+    """Write merged measurement files into a zip archive, see write_archive."""
+    entries = (
+        (name, max(entry["mtime"] for _, entry in parts), functools.partial(merge_files, parts))
+        for name, parts in merge_groups(measurements_path)
+    )
+    return write_archive(entries, zip_file_path, codec, level, jobs, progress)
+
+
+def _valid_client(client):
+    if not client or not all(c.isalnum() or c in "-_" for c in client):
+        raise ValueError(f"Invalid export client: {client}")
+    return client
+
+
+def load_watermarks(client):
+    """Return how many bytes of each file (by path relative to the measurements) were delivered to a client."""
+    store_file = WATERMARK_PATH / f"{_valid_client(client)}.json"
+    try:
+        with open(store_file, "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def save_watermarks(client, watermarks):
+    WATERMARK_PATH.mkdir(parents=True, exist_ok=True)
+    store_file = WATERMARK_PATH / f"{_valid_client(client)}.json"
+    tmp_file = store_file.with_suffix(f".{os.getpid()}.tmp")
+    with open(tmp_file, "w") as f:
+        json.dump(watermarks, f)
+    os.replace(tmp_file, store_file)
+
+
+def _copy_range(file_path, start, end, out):
+    with open(file_path, "rb") as f:
+        f.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            block = f.read(min(COPY_BLOCK_SIZE, remaining))
+            if not block:
+                break
+            out.write(block)
+            remaining -= len(block)
+
+
+def _source_size(data_dir, metadata):
+    size = metadata.get("source_size")
+    if size is None:
+        # Written before the size was stored, the CSV file may still be there.
+        try:
+            size = os.stat(data_dir / metadata["source"]).st_size
+        except (KeyError, FileNotFoundError):
+            return None
+    return size
+
+
+def current_watermarks(measurements_path, watermarks):
+    """Return the watermarks of the measurement files that still exist.
+
+    Compacted CSV files are listed under the name of their Parquet file (see compaction). If the CSV file was
+    delivered completely, the Parquet file counts as delivered too, so it isn't sent again.
+    """
+    measurements_path = Path(measurements_path)
+    current = {}
+    for data_dir in manifest.find_measurement_dirs(measurements_path):
+        for entry in manifest.get(data_dir).files():
+            path = (data_dir / entry["name"]).relative_to(measurements_path).as_posix()
+            if path in watermarks:
+                current[path] = watermarks[path]
+            elif columnar.is_columnar(entry["name"]):
+                metadata = columnar.read_metadata(data_dir / entry["name"])
+                if "source" not in metadata:
+                    continue
+                source = (data_dir / metadata["source"]).relative_to(measurements_path).as_posix()
+                delivered = watermarks.get(source)
+                if delivered is not None and delivered == _source_size(data_dir, metadata):
+                    current[path] = entry["size"]
+    return current
+
+
+def find_changes(measurements_path, watermarks):
+    """Return the parts of measurement files that are newer than the watermarks.
+
+    Each part is a dict with the file path relative to the measurements, the byte offset where it starts and its
+    size. Files that are still being written are only included up to their last complete line. The watermarks
+    should come from current_watermarks, so that compacted files are recognized.
+    """
+    measurements_path = Path(measurements_path)
+    changes = []
+    for data_dir in manifest.find_measurement_dirs(measurements_path):
+        for entry in manifest.get(data_dir).files():
+            path = (data_dir / entry["name"]).relative_to(measurements_path).as_posix()
+            end = entry["size"] if entry["closed"] else entry["offset"]
+            start = watermarks.get(path, 0)
+            if start > end:
+                # The file was rewritten, send it again.
+                start = 0
+            if end > start:
+                changes.append({"path": path, "offset": start, "size": end - start, "mtime": entry["mtime"]})
+    return changes
+
+
+def export_changes(
+    measurements_path, zip_file_path, client, codec=DEFAULT_CODEC, level=None, jobs=None, progress=None
+):
+    """Write only the data a client hasn't received yet into a zip archive.
+
+    New files are included completely, files that grew only with their new bytes. The archive keeps the directory
+    structure of the measurements and contains a manifest (MANIFEST_NAME) with the offset of each part in its file,
+    so the receiver can append the parts to the files it already has. Returns the statistics of write_archive and
+    the new watermarks, only of files that still exist. They are not stored here; call save_watermarks once the
+    archive has been delivered.
+    """
+    measurements_path = Path(measurements_path)
+    watermarks = current_watermarks(measurements_path, load_watermarks(client))
+    changes = find_changes(measurements_path, watermarks)
+    export_manifest = {
+        "client": client,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "files": [{key: part[key] for key in ("path", "offset", "size")} for part in changes],
+    }
+
+    entries = []
+    for part in changes:
+        end = part["offset"] + part["size"]
+        write = functools.partial(_copy_range, measurements_path / part["path"], part["offset"], end)
+        entries.append((part["path"], part["mtime"], write))
+    entries.append((MANIFEST_NAME, time.time(), lambda out: out.write(json.dumps(export_manifest, indent=1).encode())))
+    stats = write_archive(entries, zip_file_path, codec, level, jobs, progress)
+
+    stats["watermarks"] = dict(watermarks)
+    stats["watermarks"].update((part["path"], part["offset"] + part["size"]) for part in changes)
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export merged measurements into a zip archive.")
+    parser.add_argument(
+        "--dir", action="store", default=Path.home() / "measurements", help="Directory with the measurements."
+    )
+    parser.add_argument("--output", action="store", default=Path.home() / "data.zip", help="Path of the archive.")
+    parser.add_argument("--codec", action="store", choices=available_codecs(), default=DEFAULT_CODEC)
+    parser.add_argument("--level", action="store", type=int, help="Compression level, the codec's default if unset.")
+    parser.add_argument(
+        "--jobs", action="store", type=int, default=os.cpu_count(), help="Number of files compressed in parallel."
+    )
+    parser.add_argument(
+        "--client", action="store", help="Only export data that this client hasn't received yet (incremental export)."
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    if args.client:
+        stats = export_changes(args.dir, args.output, args.client, args.codec, args.level, args.jobs)
+        save_watermarks(args.client, stats["watermarks"])
+    else:
+        export_measurements(args.dir, args.output, args.codec, args.level, args.jobs)
@@ -0,0 +1,203 @@
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+
+from . import columnar
+
+MANIFEST_PATH = Path.home() / "OrangeBox/status/manifests"
+SCAN_BLOCK_SIZE = 1 << 20
+
+_manifests = {}
+_manifests_lock = threading.Lock()
+
+
+def _store_file(path, manifest_path=None):
+    return Path(manifest_path or MANIFEST_PATH) / (str(Path(path).resolve()).strip("/").replace("/", "__") + ".json")
+
+
+def is_measurement_file(name):
+    return name.endswith(".csv") or (columnar.available() and columnar.is_columnar(name))
+
+
+def _list_files(path):
+    """Measurement files of a directory in order. A CSV file that was converted to Parquet is only listed once."""
+    names = {name for name in os.listdir(path) if is_measurement_file(name)}
+    names = {name for name in names if not name.endswith(".csv") or f"{name[:-4]}{columnar.SUFFIX}" not in names}
+    return sorted(names, key=lambda name: os.path.splitext(name)[0])
+
+
+def _new_entry(name):
+    return {
+        "name": name,
+        "offset": 0,  # Bytes scanned so far, always at the end of a complete line.
+        "size": 0,
+        "mtime": 0,
+        "rows": 0,
+        "header": None,
+        "first": None,
+        "last": None,
+        "last_row": None,
+        "closed": False,
+    }
+
+
+class DirectoryManifest():
+    """Index of the CSV files in one measurement directory.
+
+    For each file it records the first and last timestamp (as written in the file), the number of rows,
+    the size and whether the file is closed, i.e. a newer file exists in the same directory.
+    Closed files may have been converted to Parquet (see compaction), the CSV file is not listed anymore then.
+    The index is stored outside of the measurement tree and shared between processes.
+    """
+
+    def __init__(self, path, manifest_path=None):
+        self.path = Path(path)
+        self.store_file = _store_file(self.path, manifest_path)
+        self.dir_mtime = None
+        self.entries = {}
+        self.lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.store_file, "r") as f:
+                data = json.load(f)
+            self.dir_mtime = data["dir_mtime"]
+            self.entries = {entry["name"]: entry for entry in data["files"]}
+        except (FileNotFoundError, ValueError, KeyError):
+            pass
+
+    def save(self):
+        self.store_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = self.store_file.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_file, "w") as f:
+            json.dump({"dir_mtime": self.dir_mtime, "files": list(self.entries.values())}, f)
+        os.replace(tmp_file, self.store_file)
+
+    def update(self):
+        with self.lock:
+            changed = False
+
+            # The directory mtime changes only when files are added or removed, not when they grow.
+            dir_mtime = os.stat(self.path).st_mtime_ns
+            if dir_mtime != self.dir_mtime:
+                names = _list_files(self.path)
+                self.entries = {name: self.entries.get(name) or _new_entry(name) for name in names}
+                self.dir_mtime = dir_mtime
+                changed = True
+
+            # Closed files don't change anymore, only the latest one has to be checked.
+            for i, entry in enumerate(self.entries.values()):
+                closed = i < len(self.entries) - 1
+                if entry["closed"] and closed:
+                    continue
+                try:
+                    self._scan(entry)
+                except FileNotFoundError:
+                    continue
+                if closed:
+                    entry["closed"] = True
+                    changed = True
+
+            # Growth of the open file is not stored to keep writes to the flash memory low.
+            # Other processes will catch up from the stored offset.
+            if changed:
+                try:
+                    self.save()
+                except OSError as e:
+                    logging.warning(f"Could not save manifest of {self.path}: {e}")
+        return self
+
+    def _scan(self, entry):
+        stat = os.stat(self.path / entry["name"])
+        if stat.st_size < entry["offset"]:
+            # File was truncated or rewritten, start over.
+            entry.update(_new_entry(entry["name"]))
+        entry["size"] = stat.st_size
+        entry["mtime"] = stat.st_mtime
+        if stat.st_size == entry["offset"]:
+            return
+
+        if columnar.is_columnar(entry["name"]):
+            # Parquet files are written at once, their fields are stored in the file's metadata.
+            metadata = columnar.read_metadata(self.path / entry["name"])
+            entry.update({key: metadata[key] for key in ("header", "first", "last", "last_row", "rows")})
+            entry["offset"] = stat.st_size
+            return
+
+        with open(self.path / entry["name"], "rb") as f:
+            f.seek(entry["offset"])
+            pending = b""
+            while True:
+                block = f.read(SCAN_BLOCK_SIZE)
+                if not block:
+                    break
+                data = pending + block
+                end = data.rfind(b"\n")
+                if end < 0:
+                    pending = data
+                    continue
+                pending = data[end + 1 :]
+                self._add_lines(entry, data[: end + 1])
+
+    @staticmethod
+    def _add_lines(entry, lines):
+        entry["offset"] += len(lines)
+        if entry["header"] is None:
+            header_end = lines.find(b"\n")
+            entry["header"] = lines[:header_end].decode(errors="replace").strip()
+            lines = lines[header_end + 1 :]
+        if not lines:
+            return
+
+        entry["rows"] += lines.count(b"\n")
+        if entry["first"] is None:
+            entry["first"] = lines[: lines.find(b"\n")].split(b",", 1)[0].decode(errors="replace").strip()
+        last_row = lines[:-1].rsplit(b"\n", 1)[-1].decode(errors="replace").strip()
+        entry["last_row"] = last_row
+        entry["last"] = last_row.split(",", 1)[0]
+
+    def files(self):
+        with self.lock:
+            return list(self.entries.values())
+
+    def latest(self):
+        with self.lock:
+            return next(reversed(self.entries.values()), None)
+
+
+def get(path):
+    """Return the up-to-date manifest of a measurement directory."""
+    path = Path(path)
+    with _manifests_lock:
+        manifest = _manifests.get(path)
+        if manifest is None:
+            manifest = _manifests[path] = DirectoryManifest(path)
+    return manifest.update()
+
+
+def find_measurement_dirs(root):
+    """Yield all directories below root that contain measurement files.
+
+    Directories that already have a stored manifest are not listed again.
+    """
+    root = Path(root)
+    for path in sorted(p for p in root.iterdir() if p.is_dir()):
+        if path in _manifests or _store_file(path).exists():
+            yield path
+            continue
+
+        subdirs = False
+        has_files = False
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    subdirs = True
+                elif is_measurement_file(entry.name):
+                    has_files = True
+        if has_files:
+            yield path
+        elif subdirs:
+            yield from find_measurement_dirs(path)
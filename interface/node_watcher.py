@@ -0,0 +1,187 @@
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import threading
+import time
+from pathlib import Path
+
+# Nodes that wrote to their measurement files within this many seconds are active.
+ACTIVE_TIMEOUT = 30
+# Used if inotify is not available.
+POLL_INTERVAL = 10
+
+IN_MODIFY = 0x00000002
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+_EVENT = struct.Struct("iIII")
+
+# Watched levels below the experiment directory: <experiment>/<node type>/<node>/*.csv
+_DIR_MASK = IN_CREATE | IN_MOVED_TO | IN_DELETE_SELF
+_NODE_MASK = IN_MODIFY | IN_CREATE | IN_MOVED_TO | IN_DELETE_SELF
+_NODE_DEPTH = 2
+
+_watcher = None
+_watcher_lock = threading.Lock()
+
+
+def _load_libc():
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init1
+        libc.inotify_add_watch
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+class NodeWatcher():
+    """Set of the active nodes of an experiment and their latest files, kept up to date with inotify.
+
+    Reads are served from memory, so idle dashboards don't scan the measurement tree.
+    """
+
+    def __init__(self, experiment_path, active_timeout=ACTIVE_TIMEOUT):
+        self.path = Path(experiment_path)
+        self.active_timeout = active_timeout
+        # Node directory -> [latest file name, time of the last write]
+        self.nodes = {}
+        self.watches = {}
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.fd = None
+        self.libc = None
+
+    def start(self):
+        thread = threading.Thread(target=self.run, daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self.stopped.set()
+
+    def run(self):
+        # The experiment directory is created when the first measurement starts.
+        while not self.path.is_dir():
+            if self.stopped.wait(POLL_INTERVAL):
+                return
+
+        self.libc = _load_libc()
+        if self.libc is not None:
+            self.fd = self.libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd is None or self.fd < 0:
+            logging.warning("inotify is not available, polling the measurement directories instead.")
+            while not self.stopped.is_set():
+                try:
+                    self._rescan()
+                except FileNotFoundError:
+                    pass
+                self.stopped.wait(POLL_INTERVAL)
+            return
+
+        try:
+            # Watches are added before scanning so that no write is missed in between.
+            self._watch(self.path, 0)
+            while not self.stopped.is_set():
+                ready, _, _ = select.select([self.fd], [], [], 1)
+                if ready:
+                    self._read_events(os.read(self.fd, 64 << 10))
+        finally:
+            os.close(self.fd)
+
+    def _rescan(self):
+        nodes = {}
+        for node_type in self.path.iterdir():
+            if node_type.is_dir():
+                for node in node_type.iterdir():
+                    if node.is_dir():
+                        nodes[node] = self._scan_node(node)
+        with self.lock:
+            self.nodes = {node: value for node, value in nodes.items() if value is not None}
+
+    @staticmethod
+    def _scan_node(node):
+        files = sorted(name for name in os.listdir(node) if name.endswith(".csv"))
+        if not files:
+            return None
+        return [files[-1], os.stat(node / files[-1]).st_mtime]
+
+    def _watch(self, path, depth):
+        mask = _NODE_MASK if depth == _NODE_DEPTH else _DIR_MASK
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            logging.warning(f"Could not watch {path}: {os.strerror(ctypes.get_errno())}")
+            return
+        self.watches[wd] = (path, depth)
+
+        try:
+            if depth == _NODE_DEPTH:
+                latest = self._scan_node(path)
+                if latest is not None:
+                    with self.lock:
+                        self.nodes[path] = latest
+                return
+            for child in path.iterdir():
+                if child.is_dir():
+                    self._watch(child, depth + 1)
+        except FileNotFoundError:
+            pass
+
+    def _read_events(self, data):
+        now = time.time()
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = _EVENT.unpack_from(data, offset)
+            name = data[offset + _EVENT.size : offset + _EVENT.size + length].rstrip(b"\0").decode(errors="replace")
+            offset += _EVENT.size + length
+
+            if mask & IN_Q_OVERFLOW:
+                logging.warning("inotify queue overflowed, rescanning the measurement directories.")
+                self._rescan()
+                continue
+            if wd not in self.watches:
+                continue
+            path, depth = self.watches[wd]
+            if mask & IN_IGNORED:
+                # The directory was removed.
+                del self.watches[wd]
+                with self.lock:
+                    self.nodes.pop(path, None)
+            elif depth < _NODE_DEPTH:
+                if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                    self._watch(path / name, depth + 1)
+            elif name.endswith(".csv"):
+                with self.lock:
+                    latest = self.nodes.get(path)
+                    if latest is None or name >= latest[0]:
+                        self.nodes[path] = [name, now]
+
+    def active_nodes(self):
+        """Names of the nodes that are currently measuring."""
+        now = time.time()
+        with self.lock:
+            return sorted(node.name for node, (_, mtime) in self.nodes.items() if now - mtime < self.active_timeout)
+
+    def latest_file(self, node):
+        with self.lock:
+            latest = self.nodes.get(Path(node))
+        return None if latest is None else Path(node) / latest[0]
+
+
+def get(experiment_path):
+    """Return the watcher of the given experiment. Only the current experiment is watched."""
+    global _watcher
+    experiment_path = Path(experiment_path)
+    with _watcher_lock:
+        if _watcher is None or _watcher.path != experiment_path:
+            if _watcher is not None:
+                _watcher.stop()
+            _watcher = NodeWatcher(experiment_path)
+            _watcher.start()
+        return _watcher
@@ -0,0 +1,256 @@
+import logging
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import data_reader
+from measurement_store import columnar, manifest
+
+# Samples kept in memory per sensor. The Rock Pi S has 256-512 MB of RAM, so both limits are small.
+BUFFER_HOURS = 2
+BUFFER_MAX_BYTES = 4 << 20
+BUFFER_UPDATE_INTERVAL = 2
+# Buffers of sensors that are not plotted anymore are dropped after this many seconds.
+BUFFER_IDLE_TIMEOUT = 10 * 60
+REPORT_INTERVAL = 10 * 60
+
+
+class RingBuffer():
+    """Fixed number of the most recent samples, stored as NumPy columns with an int64 time axis (ns since epoch)."""
+
+    def __init__(self, columns, capacity):
+        self.columns = list(columns)
+        self.capacity = capacity
+        self.times = np.zeros(capacity, dtype=np.int64)
+        self.values = np.full((len(self.columns), capacity), np.nan)
+        self.end = 0
+        self.size = 0
+
+    @property
+    def nbytes(self):
+        return self.times.nbytes + self.values.nbytes
+
+    def _segments(self):
+        begin = (self.end - self.size) % self.capacity
+        if begin + self.size <= self.capacity:
+            return [slice(begin, begin + self.size)]
+        return [slice(begin, self.capacity), slice(0, self.end)]
+
+    def oldest(self):
+        return self.times[self._segments()[0].start] if self.size else None
+
+    def newest(self):
+        return self.times[self.end - 1] if self.size else None
+
+    def append(self, times, values):
+        """Append samples sorted by time, values have one row per column."""
+        n = len(times)
+        if n == 0:
+            return
+        if n > self.capacity:
+            times = times[-self.capacity :]
+            values = values[:, -self.capacity :]
+            n = self.capacity
+        indices = (self.end + np.arange(n)) % self.capacity
+        self.times[indices] = times
+        self.values[:, indices] = values
+        self.end = (self.end + n) % self.capacity
+        self.size = min(self.size + n, self.capacity)
+
+    def since(self, start):
+        """Return copies of the times and values newer than start, oldest first."""
+        times = []
+        values = []
+        for segment in self._segments():
+            segment_times = self.times[segment]
+            i = np.searchsorted(segment_times, start, side="right")
+            times.append(segment_times[i:])
+            values.append(self.values[:, segment][:, i:])
+        return np.concatenate(times), np.concatenate(values, axis=1)
+
+
+class _SensorBuffer():
+    def __init__(self, data_dir, fmt, hours, max_bytes):
+        self.data_dir = Path(data_dir)
+        self.fmt = fmt
+        self.window = pd.Timedelta(hours=hours)
+        self.max_bytes = max_bytes
+        self.samples = None
+        # Samples are complete from this time on (ns since epoch).
+        self.covered_from = None
+        self.file_name = None
+        self.offset = 0
+        self.last_read = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _read_rows(self, file_path, start=None):
+        if columnar.is_columnar(file_path):
+            # Compacted files are closed and already typed.
+            df = columnar.read_frame(file_path, start, data_reader.fields_for(self.data_dir))
+            df.index = pd.DatetimeIndex(df.pop("datetime"))
+            return df.select_dtypes("number").astype("float64")
+
+        with open(file_path, "rb") as f:
+            header = f.readline()
+            if start is not None:
+                f.seek(data_reader.find_time_offset(f, start, self.fmt))
+            elif self.offset > f.tell():
+                f.seek(self.offset)
+            content = f.read()
+            end = f.tell()
+        # The writer might be in the middle of a row.
+        incomplete = len(content) - content.rfind(b"\n") - 1
+        content = content[: len(content) - incomplete]
+        self.offset = end - incomplete
+        if not content:
+            return None
+
+        df = data_reader.read_csv(header + content, data_reader.fields_for(self.data_dir), on_bad_lines="skip")
+        if "datetime" not in df:
+            return None
+        times = data_reader.parse_times(df.pop("datetime"), self.fmt)
+        df = df.select_dtypes("number").astype("float64")
+        df.index = times
+        return df.loc[df.index.notna()]
+
+    def fill(self):
+        start = pd.Timestamp.now() - self.window
+        files = manifest.get(self.data_dir).files()
+        frames = []
+        latest_offset = 0
+        for i, entry in enumerate(reversed(files)):
+            if i > 0 and entry["rows"] == 0:
+                continue
+            if i > 0:
+                last_timestamp = data_reader.parse_timestamp(entry["last"], self.fmt)
+                if last_timestamp is not None and last_timestamp <= start:
+                    break
+            df = self._read_rows(self.data_dir / entry["name"], start)
+            if i == 0:
+                # Only the latest file is followed afterwards.
+                self.file_name = entry["name"]
+                latest_offset = self.offset
+            if df is not None:
+                frames.append(df.loc[df.index > start])
+        self.offset = latest_offset
+
+        frames = [frame for frame in reversed(frames) if not frame.empty]
+        if not frames:
+            # The columns are not known yet, try again with the next update.
+            self.samples = None
+            return
+        df = pd.concat(frames)
+        columns = df.columns.to_list()
+        capacity = max(1, self.max_bytes // (8 * (len(columns) + 1)))
+        self.samples = RingBuffer(columns, capacity)
+        self.covered_from = start.value
+        self._append(df)
+        if len(df) > capacity:
+            self.covered_from = self.samples.oldest()
+        logging.info(
+            f"Buffered {self.samples.size} samples of {self.data_dir.name} "
+            f"({self.samples.nbytes / 2**20:.1f} MB for up to {capacity} samples)."
+        )
+
+    def _append(self, df):
+        if df is None or df.empty:
+            return
+        df = df.reindex(columns=self.samples.columns)
+        times = df.index.to_numpy("datetime64[ns]").view(np.int64)
+        # Keep the time axis sorted, e.g. when the driver restarts with overlapping samples.
+        newest = self.samples.newest()
+        if newest is not None:
+            keep = times > newest
+            times = times[keep]
+            df = df.loc[keep]
+        self.samples.append(times, df.to_numpy().T)
+        if self.samples.size == self.samples.capacity:
+            self.covered_from = max(self.covered_from, self.samples.oldest())
+
+    def update(self):
+        with self.lock:
+            files = manifest.get(self.data_dir).files()
+            names = [entry["name"] for entry in files]
+            if self.samples is None or self.file_name not in names:
+                self.fill()
+                return
+            for name in names[names.index(self.file_name) :]:
+                if name != self.file_name:
+                    # The followed file was closed, continue with the next one.
+                    self.file_name = name
+                    self.offset = 0
+                self._append(self._read_rows(self.data_dir / name))
+
+    def read(self, start):
+        with self.lock:
+            self.last_read = time.monotonic()
+            if self.samples is None or start.value < self.covered_from:
+                return None
+            times, values = self.samples.since(start.value)
+        df = pd.DataFrame(values.T, columns=self.samples.columns)
+        df.insert(0, "datetime", pd.to_datetime(times))
+        return df
+
+
+class SensorBuffers():
+    """Ring buffers of the recent samples of the plotted sensors, kept up to date in the background.
+
+    Reads only slice memory. Windows older than the buffered range return None and have to be read from disk.
+    """
+
+    def __init__(self, hours=BUFFER_HOURS, max_bytes=BUFFER_MAX_BYTES, interval=BUFFER_UPDATE_INTERVAL):
+        self.hours = hours
+        self.max_bytes = max_bytes
+        self.interval = interval
+        self.buffers = {}
+        self.lock = threading.Lock()
+
+    def read(self, data_dir, start, fmt=None):
+        data_dir = Path(data_dir)
+        with self.lock:
+            buffer = self.buffers.get(data_dir)
+            if buffer is None:
+                buffer = self.buffers[data_dir] = _SensorBuffer(data_dir, fmt, self.hours, self.max_bytes)
+        if buffer.samples is None:
+            buffer.update()
+        return buffer.read(start)
+
+    def update(self):
+        now = time.monotonic()
+        with self.lock:
+            for data_dir, buffer in list(self.buffers.items()):
+                if now - buffer.last_read > BUFFER_IDLE_TIMEOUT:
+                    logging.info(f"Dropping the buffer of {data_dir.name}.")
+                    del self.buffers[data_dir]
+            buffers = list(self.buffers.values())
+        for buffer in buffers:
+            try:
+                buffer.update()
+            except (FileNotFoundError, IndexError) as e:
+                logging.error(f"Updating the buffer of {buffer.data_dir} failed: {e}")
+
+    def memory_usage(self):
+        """Bytes allocated per buffered sensor."""
+        with self.lock:
+            buffers = list(self.buffers.items())
+        return {data_dir.name: buffer.samples.nbytes for data_dir, buffer in buffers if buffer.samples is not None}
+
+    def run(self):
+        last_report = time.monotonic()
+        while True:
+            start = time.monotonic()
+            self.update()
+            if start - last_report > REPORT_INTERVAL:
+                usage = self.memory_usage()
+                report = ", ".join(f"{name}: {size / 2**20:.1f} MB" for name, size in usage.items())
+                logging.info(f"Sample buffers use {sum(usage.values()) / 2**20:.1f} MB ({report or 'none'}).")
+                last_report = start
+            time.sleep(max(0, self.interval - (time.monotonic() - start)))
+
+    def start(self):
+        thread = threading.Thread(target=self.run, daemon=True)
+        thread.start()
+        return thread
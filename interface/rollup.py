@@ -0,0 +1,365 @@
+import io
+import logging
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+
+import pandas as pd
+
+import data_reader
+from measurement_store import columnar, manifest
+
+ROLLUP_PATH = Path.home() / "OrangeBox/status/rollups"
+# Aggregation levels and their bucket length in seconds, from fine to coarse.
+LEVELS = {"10s": 10, "1min": 60, "10min": 600}
+ROLLUP_INTERVAL = 10
+# Rollups of deleted measurement directories are looked for less often than the rollups are updated.
+PRUNE_INTERVAL = 600
+READ_BLOCK_SIZE = 4 << 20
+# Rollups cover the longest plot window (12 h) with margin. Older buckets are dropped once they are twice as old.
+ROLLUP_RETENTION = 24 * 3600
+
+
+def _read_last_line(file_path):
+    with open(file_path, "rb") as f:
+        size = f.seek(0, os.SEEK_END)
+        f.seek(max(0, size - data_reader.SEEK_RESOLUTION))
+        lines = f.read().rstrip(b"\n").rsplit(b"\n", 1)
+    return lines[-1].decode(errors="replace")
+
+
+def _combine(frames):
+    combined = pd.concat(frames)
+    return pd.concat(
+        {
+            "sum": combined["sum"].groupby(level=0).sum(),
+            "min": combined["min"].groupby(level=0).min(),
+            "max": combined["max"].groupby(level=0).max(),
+            "values": combined["values"].groupby(level=0).sum(),
+            "count": combined["count"].groupby(level=0).sum(),
+        },
+        axis=1,
+    )
+
+
+def _to_frame(buckets):
+    count = buckets["count"]["rows"]
+    df = pd.DataFrame({"count": count}, index=buckets.index)
+    for column in buckets["sum"].columns:
+        # Columns can be empty in some rows, the mean is over the values that exist.
+        df[f"{column}_mean"] = buckets["sum"][column] / buckets["values"][column]
+        df[f"{column}_min"] = buckets["min"][column]
+        df[f"{column}_max"] = buckets["max"][column]
+    df.index.name = "datetime"
+    return df
+
+
+class _Level():
+    def __init__(self, name, seconds, file_path):
+        self.name = name
+        self.seconds = seconds
+        self.freq = pd.Timedelta(seconds=seconds)
+        self.file_path = file_path
+        # Aggregates of the bucket that is still receiving rows.
+        self.open_bucket = None
+        self.last_end = None
+        self.first_start = None
+        # Columns of the file, rows with other columns are written with the header rewritten, see _append.
+        self.columns = None
+        if file_path.exists() and file_path.stat().st_size > 0:
+            last_start = data_reader.parse_timestamp(_read_last_line(file_path).split(",", 1)[0])
+            if last_start is not None:
+                self.last_end = last_start + self.freq
+            with open(file_path, "rb") as f:
+                self.columns = f.readline().decode().strip().split(",")[1:]
+                self.first_start = data_reader.parse_timestamp(f.readline().split(b",", 1)[0])
+
+    def add(self, df):
+        if self.last_end is not None:
+            df = df.loc[df.index >= self.last_end]
+        if df.empty:
+            return
+
+        grouped = df.groupby(df.index.floor(self.freq))
+        buckets = pd.concat(
+            {
+                "sum": grouped.sum(),
+                "min": grouped.min(),
+                "max": grouped.max(),
+                "values": grouped.count(),
+                "count": grouped.size().to_frame("rows"),
+            },
+            axis=1,
+        )
+        if self.open_bucket is not None:
+            buckets = _combine([self.open_bucket, buckets])
+
+        # All buckets except the last one are complete.
+        self._append(buckets.iloc[:-1])
+        self.open_bucket = buckets.iloc[-1:]
+
+    def _append(self, buckets):
+        if buckets.empty:
+            return
+        df = _to_frame(buckets)
+        if not self.file_path.exists() or self.file_path.stat().st_size == 0:
+            self.file_path.parent.mkdir(parents=True, exist_ok=True)
+            df.to_csv(self.file_path)
+            self.columns = df.columns.to_list()
+        elif set(df.columns) <= set(self.columns):
+            df.reindex(columns=self.columns).to_csv(self.file_path, mode="a", header=False)
+        else:
+            # The measurement got new columns (e.g. the power logger's burst fields).
+            self._rewrite(df)
+        self.last_end = buckets.index[-1] + self.freq
+        if self.first_start is None:
+            self.first_start = buckets.index[0]
+        if self.first_start < pd.Timestamp.now() - pd.Timedelta(seconds=2 * ROLLUP_RETENTION):
+            self._trim()
+
+    def _rewrite(self, df):
+        """Rewrite the file with the columns of df added to the header, followed by the rows of df."""
+        old = pd.read_csv(self.file_path, index_col="datetime")
+        old.index = pd.to_datetime(old.index)
+        columns = self.columns + [column for column in df.columns if column not in self.columns]
+        tmp_path = self.file_path.with_name(f".{self.file_path.name}.tmp")
+        pd.concat([old, df]).reindex(columns=columns).to_csv(tmp_path)
+        os.replace(tmp_path, self.file_path)
+        self.columns = columns
+
+    def _trim(self):
+        """Rewrite the file without the buckets older than the retention."""
+        cutoff = pd.Timestamp.now() - pd.Timedelta(seconds=ROLLUP_RETENTION)
+        with open(self.file_path, "rb") as f:
+            header = f.readline()
+            f.seek(data_reader.find_time_offset(f, cutoff))
+            content = f.read()
+        tmp_path = self.file_path.with_name(f".{self.file_path.name}.tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(header + content)
+        os.replace(tmp_path, self.file_path)
+        self.first_start = cutoff
+
+    def read(self, start):
+        frames = []
+        if self.file_path.exists() and self.file_path.stat().st_size > 0:
+            with open(self.file_path, "rb") as f:
+                header = f.readline()
+                f.seek(data_reader.find_time_offset(f, start))
+                content = f.read()
+            # The last line might still be being written.
+            content = content[: content.rfind(b"\n") + 1]
+            df = pd.read_csv(io.BytesIO(header + content), index_col="datetime")
+            df.index = pd.to_datetime(df.index)
+            frames.append(df)
+
+        open_bucket = self.open_bucket
+        if open_bucket is not None:
+            frames.append(_to_frame(open_bucket))
+
+        if not frames:
+            return None
+        df = pd.concat(frames)
+        return df.loc[df.index > start]
+
+
+class DirectoryRollup():
+    """Incrementally aggregated copies of the measurements in one directory at all rollup levels."""
+
+    def __init__(self, data_dir, rollup_dir, fmt=None):
+        self.data_dir = Path(data_dir)
+        self.fmt = fmt
+        self.levels = [_Level(name, seconds, Path(rollup_dir) / f"{name}.csv") for name, seconds in LEVELS.items()]
+        self.enabled = True
+        self.file_name = None
+        self.offset = 0
+        self.header = None
+        # Rows before this are not aggregated, see _seek.
+        self.start = None
+        self.lock = threading.Lock()
+
+    def update(self):
+        files = [entry for entry in manifest.get(self.data_dir).files() if entry["header"] is not None]
+        if not files:
+            return
+        # Only measurements with a datetime column can be aggregated over time.
+        if not files[-1]["header"].startswith("datetime"):
+            self.enabled = False
+            return
+
+        with self.lock:
+            names = [entry["name"] for entry in files]
+            if self.file_name not in names:
+                self._seek(files)
+
+            i = names.index(self.file_name)
+            while True:
+                self._consume(files[i])
+                if i == len(files) - 1:
+                    break
+                # The file is closed and completely consumed, continue with the next one.
+                i += 1
+                self.file_name = files[i]["name"]
+                self.offset = 0
+                self.header = None
+
+    def _seek(self, files):
+        # Continue where the rollups end, but don't go back further than the retention (e.g. on the first start).
+        last_ends = [level.last_end for level in self.levels]
+        start = pd.Timestamp.now() - pd.Timedelta(seconds=ROLLUP_RETENTION)
+        if None not in last_ends:
+            start = max(start, min(last_ends))
+        self.start = start
+
+        self.file_name = files[0]["name"]
+        self.offset = 0
+        self.header = None
+        for entry in reversed(files):
+            first_timestamp = data_reader.parse_timestamp(entry["first"], self.fmt) if entry["first"] else None
+            if first_timestamp is not None and first_timestamp <= start:
+                self.file_name = entry["name"]
+                if columnar.is_columnar(self.file_name):
+                    # Compacted files are read at once, see _consume.
+                    break
+                with open(self.data_dir / self.file_name, "rb") as f:
+                    self.header = f.readline()
+                    self.offset = data_reader.find_time_offset(f, start, self.fmt)
+                break
+
+    def _consume(self, entry):
+        # The manifest offset always points to the end of a complete line.
+        end = entry["offset"]
+        if columnar.is_columnar(entry["name"]):
+            if self.offset < end:
+                df = columnar.read_frame(self.data_dir / entry["name"], self.start - pd.Timedelta(1, "ns"))
+                self._add_frame(df.set_index("datetime"))
+                self.offset = end
+            return
+
+        with open(self.data_dir / entry["name"], "rb") as f:
+            if self.header is None:
+                self.header = f.readline()
+                self.offset = f.tell()
+            f.seek(self.offset)
+            while self.offset < end:
+                chunk = f.read(min(READ_BLOCK_SIZE, end - self.offset))
+                chunk_end = chunk.rfind(b"\n") + 1
+                if chunk_end == 0:
+                    break
+                self.offset += chunk_end
+                f.seek(self.offset)
+                self._add(chunk[:chunk_end])
+
+    def _add(self, chunk):
+        df = pd.read_csv(io.BytesIO(self.header + chunk), on_bad_lines="skip")
+        df["datetime"] = data_reader.parse_times(df["datetime"], self.fmt)
+        self._add_frame(df.dropna(subset=["datetime"]).set_index("datetime"))
+
+    def _add_frame(self, df):
+        df = df.loc[df.index >= self.start]
+        df = df.select_dtypes("number").astype("float64").dropna(how="all")
+        if df.empty:
+            return
+        for level in self.levels:
+            level.add(df)
+
+    def read(self, level_name, start):
+        # Appends to the level files and the open buckets are safe to read while updating.
+        for level in self.levels:
+            if level.name == level_name:
+                return level.read(start)
+
+
+def choose_level(window_seconds, num_samples):
+    """Return the coarsest level that still gives num_samples points in the window, or None for raw data."""
+    for name, seconds in reversed(LEVELS.items()):
+        if window_seconds / seconds >= num_samples:
+            return name
+    return None
+
+
+def plot_frame(df, method):
+    """Turn a rollup frame into a frame with the original column names.
+
+    For the min/max method, both the minimum and the maximum of each bucket are kept so that spikes stay visible.
+    """
+    columns = [column[: -len("_mean")] for column in df.columns if column.endswith("_mean")]
+    if method == "minmax":
+        lows = df[[f"{column}_min" for column in columns]].set_axis(columns, axis=1)
+        highs = df[[f"{column}_max" for column in columns]].set_axis(columns, axis=1)
+        return pd.concat([lows, highs]).sort_index(kind="stable")
+    return df[[f"{column}_mean" for column in columns]].set_axis(columns, axis=1)
+
+
+class RollupManager():
+    """Background stage that keeps rollups of all measurement directories up to date."""
+
+    def __init__(
+        self, measurement_path, fmt=None, rollup_path=None, interval=ROLLUP_INTERVAL, prune_interval=PRUNE_INTERVAL
+    ):
+        self.measurement_path = Path(measurement_path)
+        self.rollup_path = Path(rollup_path or ROLLUP_PATH)
+        self.fmt = fmt
+        self.interval = interval
+        self.prune_interval = prune_interval
+        self.last_prune = None
+        self.rollups = {}
+        self.lock = threading.Lock()
+
+    def _get(self, data_dir):
+        data_dir = Path(data_dir)
+        with self.lock:
+            rollup = self.rollups.get(data_dir)
+            if rollup is None:
+                # Power data is stored without fractions of a second.
+                fmt = None if data_dir.name == "Power" else self.fmt
+                rollup_dir = self.rollup_path / data_dir.relative_to(self.measurement_path)
+                rollup = self.rollups[data_dir] = DirectoryRollup(data_dir, rollup_dir, fmt)
+        return rollup
+
+    def prune(self):
+        """Remove the rollups of measurement directories that don't exist anymore."""
+        for level_file in sorted(self.rollup_path.rglob(f"{next(iter(LEVELS))}.csv")):
+            rollup_dir = level_file.parent
+            data_dir = self.measurement_path / rollup_dir.relative_to(self.rollup_path)
+            if not data_dir.is_dir():
+                with self.lock:
+                    self.rollups.pop(data_dir, None)
+                shutil.rmtree(rollup_dir, ignore_errors=True)
+
+    def update(self):
+        if self.last_prune is None or time.monotonic() - self.last_prune >= self.prune_interval:
+            self.last_prune = time.monotonic()
+            self.prune()
+        for data_dir in manifest.find_measurement_dirs(self.measurement_path):
+            rollup = self._get(data_dir)
+            if not rollup.enabled:
+                continue
+            try:
+                rollup.update()
+            except Exception as e:
+                logging.error(f"Updating rollups of {data_dir} failed: {e}")
+
+    def run(self):
+        while True:
+            start = time.monotonic()
+            self.update()
+            time.sleep(max(0, self.interval - (time.monotonic() - start)))
+
+    def start(self):
+        thread = threading.Thread(target=self.run, daemon=True)
+        thread.start()
+        return thread
+
+    def read(self, data_dir, window_seconds, num_samples):
+        """Rollup frame for the window ending now, or None if raw data has to be used."""
+        level_name = choose_level(window_seconds, num_samples)
+        data_dir = Path(data_dir)
+        if level_name is None or data_dir not in self.rollups:
+            return None
+        rollup = self.rollups[data_dir]
+        if not rollup.enabled:
+            return None
+        return rollup.read(level_name, pd.Timestamp.now() - pd.Timedelta(seconds=window_seconds))
@@ -1,5 +1,13 @@
+import numpy as np
+import pandas as pd
 import plotly.graph_objects as go
 
+SMOOTHING_ALPHA = 0.2
+LONG_WINDOW = 10
+SHORT_WINDOW = 3
+# Time between the trigger and the decision point in seconds.
+EXPERIMENT_DURATION = {"aba": 200, "ros": 60}
+
 
 def is_stressed(data0, data1, sample, stress):
     if sample == "ros" and stress == "water":
@@ -16,53 +24,81 @@ def is_stressed(data0, data1, sample, stress):
         return concentration > 19.8, concentration
 
 
+def _window_all(mask, window, count):
+    """For each of the first count positions, whether mask is True in all of the next window elements."""
+    cumulative = np.concatenate(([0], np.cumsum(mask)))
+    return cumulative[window : window + count] - cumulative[:count] == window
+
+
+def _find_drops(derivatives, count):
+    # Derivatives in next LONG_WINDOW steps are all negative or very negative in SHORT_WINDOW.
+    return _window_all(derivatives < -0.01, LONG_WINDOW, count) | _window_all(derivatives < -0.1, SHORT_WINDOW, count)
+
+
+def _find_quiet(derivatives, count):
+    # No negative derivatives in the next LONG_WINDOW steps, which arms the detector again after a drop.
+    return _window_all(derivatives >= -0.01, LONG_WINDOW, count)
+
+
 def find_negative_drop(derivatives):
-    long_window = 10
-    short_window = 3
+    derivatives = np.asarray(derivatives, dtype=np.float64)
+    count = len(derivatives) - LONG_WINDOW
+    if count < 2:
+        return None
     # Find index for which derivatives in next long_window steps are all negative or very negative in short_window.
-    for i in range(1, len(derivatives) - long_window):
-        if all(derivatives.iloc[i : i + long_window] < -0.01) or all(derivatives.iloc[i : i + short_window] < -0.1):
-            return i - 1
+    drops = _find_drops(derivatives, count)
+    drops[0] = False
+    if not drops.any():
+        return None
+    return int(np.argmax(drops)) - 1
 
 
 def lp_filter(data, alpha):
-    smoothed = data.copy()
-    for i in range(1, len(data)):
-        smoothed.iloc[i] = alpha * data.iloc[i] + (1 - alpha) * smoothed.iloc[i - 1]
+    """First-order low-pass filter: smoothed[i] = alpha * data[i] + (1 - alpha) * smoothed[i - 1]."""
+    values = np.asarray(data, dtype=np.float64)
+    smoothed = values.copy()
+    n = len(values)
+    if n > 1 and alpha != 1:
+        decay = 1 - alpha
+        # The recursion is solved in closed form within blocks that are short enough for decay ** -block
+        # to stay far from overflowing. Only the state between blocks is carried over in a loop.
+        block = n - 1 if decay == 1 else int(min(n - 1, max(1, np.log(1e-20) / np.log(decay))))
+        num_blocks = -(-(n - 1) // block)
+        inputs = np.zeros(num_blocks * block)
+        inputs[: n - 1] = values[1:]
+        inputs = inputs.reshape(num_blocks, block)
+
+        steps = np.arange(block)
+        powers = decay**steps
+        # Response of each block to its own inputs, starting from a zero state.
+        response = np.cumsum(inputs * (alpha * decay**-steps), axis=1)
+        response *= powers
+        states = np.empty(num_blocks)
+        state = values[0]
+        carry = decay**block
+        for i in range(num_blocks):
+            states[i] = state
+            state = response[i, -1] + carry * state
+        response += states[:, np.newaxis] * (powers * decay)
+        smoothed[1:] = response.ravel()[: n - 1]
+
+    if isinstance(data, pd.Series):
+        return pd.Series(smoothed, index=data.index, name=data.name)
     return smoothed
 
 
-def analyze(timestamps, data, sample, stress):
-    sample = sample.lower()
-    stress = stress.lower()
-    timestamps = timestamps.to_series()
+def draw(events, minimum, sample, stress):
+    """Plot elements for a list of events, each a trigger and a decision point given as (time, value) or None.
 
-    smoothing_alpha = 0.2
-    experiment_duration = 200 if sample == "aba" else 60  # seconds
+    The status box shows the verdict of the latest decision.
+    """
     traces = []
     shapes = []
     annotations = []
+    status_box = None
 
-    # Smooth the data using a low-pass first-order filter.
-    smoothed = lp_filter(data, smoothing_alpha)
-    # traces.append(go.Scatter(x=timestamps, y=smoothed, mode="lines", name="Smooth"))
-
-    # Compute the derivative of the smoothed data.
-    derivative = smoothed.diff().fillna(0)
-    # traces.append(go.Scatter(x=timestamps, y=derivative, mode="lines", name="Derivative"))
-
-    # print(timestamps)
-    # print(data)
-
-    # Find the index of the sudden drop in the derivative.
-    if sample == "aba":
-        trigger_index = find_negative_drop(derivative)
-    else:
-        trigger_index = 0
-
-    if trigger_index is not None:
-        trigger_time = timestamps[trigger_index]
-        trigger_value = data[trigger_index]
+    for trigger, decision in events:
+        trigger_time, trigger_value = trigger
         shapes.append(
             dict(
                 type="line",
@@ -75,16 +111,10 @@ def analyze(timestamps, data, sample, stress):
             )
         )
 
-        target_time = trigger_time + experiment_duration
-
-        # Find the value corresponding to the target_time
-        future_index = timestamps.searchsorted(target_time)
-
-        if future_index < len(timestamps):
-            future_time = timestamps[future_index]
-            future_value = data[future_index]
+        if decision is not None:
+            future_time, future_value = decision
 
-            dec_point_min = trigger_value if sample == "aba" else min(data)
+            dec_point_min = trigger_value if sample == "aba" else minimum
             dec_point_max = future_value
             annotation_val = trigger_value - future_value if sample == "aba" else future_value
 
@@ -100,8 +130,6 @@ def analyze(timestamps, data, sample, stress):
                 )
             )
 
-            # print(trigger_index, trigger_time, trigger_value, target_time, future_index, future_time, future_value)
-
             annotations.append(
                 dict(
                     x=future_time,
@@ -124,20 +152,245 @@ def analyze(timestamps, data, sample, stress):
             else:
                 status = "GOOD"
                 color = "green"
-            annotations.append(
-                dict(
-                    x=1,
-                    y=1,
-                    xref="paper",
-                    yref="paper",
-                    text=status,
-                    showarrow=False,
-                    font=dict(size=32, color="white"),
-                    align="center",
-                    bgcolor=color,
-                    borderpad=10,
-                    opacity=0.5,
-                )
+            status_box = dict(
+                x=1,
+                y=1,
+                xref="paper",
+                yref="paper",
+                text=status,
+                showarrow=False,
+                font=dict(size=32, color="white"),
+                align="center",
+                bgcolor=color,
+                borderpad=10,
+                opacity=0.5,
             )
 
+    if status_box is not None:
+        annotations.append(status_box)
     return traces, shapes, annotations
+
+
+def evaluate(timestamps, data, sample):
+    """Return the trigger and the decision point of a recording, both as (time, value) or None."""
+    sample = sample.lower()
+    # Samples are addressed by position, the timestamps are elapsed seconds.
+    timestamps = np.asarray(timestamps)
+    data = np.asarray(data, dtype=np.float64)
+    if len(data) == 0:
+        return None, None
+
+    # Smooth the data using a low-pass first-order filter.
+    smoothed = lp_filter(data, SMOOTHING_ALPHA)
+
+    # Compute the derivative of the smoothed data.
+    derivative = np.diff(smoothed, prepend=smoothed[:1])
+    derivative[np.isnan(derivative)] = 0
+
+    # Find the index of the sudden drop in the derivative.
+    if sample == "aba":
+        trigger_index = find_negative_drop(derivative)
+    else:
+        trigger_index = 0
+    if trigger_index is None:
+        return None, None
+
+    trigger = (timestamps[trigger_index], data[trigger_index])
+    target_time = timestamps[trigger_index] + EXPERIMENT_DURATION[sample]
+
+    # Find the value corresponding to the target_time
+    future_index = timestamps.searchsorted(target_time)
+    if future_index < len(timestamps):
+        return trigger, (timestamps[future_index], data[future_index])
+    return trigger, None
+
+
+def find_events(timestamps, data, sample):
+    """Return all events of a recording with repeated measurements as a list of (trigger, decision).
+
+    After a decision, the derivative has to stay above the drop threshold for LONG_WINDOW steps before the next trigger
+    (hysteresis), so a drop that lasts longer than the experiment is not counted twice. ROS measurements are triggered only at the start.
+    """
+    sample = sample.lower()
+    timestamps = np.asarray(timestamps)
+    data = np.asarray(data, dtype=np.float64)
+    if sample != "aba":
+        trigger, decision = evaluate(timestamps, data, sample)
+        return [] if trigger is None else [(trigger, decision)]
+
+    smoothed = lp_filter(data, SMOOTHING_ALPHA)
+    derivative = np.diff(smoothed, prepend=smoothed[:1])
+    derivative[np.isnan(derivative)] = 0
+    count = len(derivative) - LONG_WINDOW
+    if count < 2:
+        return []
+    starts = np.flatnonzero(_find_drops(derivative, count))
+    quiet = np.flatnonzero(_find_quiet(derivative, count))
+
+    events = []
+    position = 1
+    while True:
+        k = starts.searchsorted(position)
+        if k == len(starts):
+            break
+        trigger_index = starts[k] - 1
+        trigger = (timestamps[trigger_index], data[trigger_index])
+        future_index = timestamps.searchsorted(timestamps[trigger_index] + EXPERIMENT_DURATION[sample])
+        if future_index >= len(timestamps):
+            events.append((trigger, None))
+            break
+        events.append((trigger, (timestamps[future_index], data[future_index])))
+
+        k = quiet.searchsorted(max(future_index, trigger_index + 1))
+        if k == len(quiet):
+            break
+        position = quiet[k]
+    return events
+
+
+def analyze(timestamps, data, sample, stress):
+    events = find_events(timestamps, data, sample)
+    minimum = np.min(data) if len(data) else None
+    return draw(events, minimum, sample.lower(), stress.lower())
+
+
+class StreamingAnalyzer():
+    """Incremental analyze() for one recording of a SAP sensor.
+
+    The filter state, the derivatives still needed for the drop search and the current event are kept between
+    calls, so each call only processes the samples that were added since the previous one. Events are found
+    exactly like in find_events() and each verdict is passed to notify as soon as the experiment duration has
+    passed after its trigger.
+    """
+
+    def __init__(self, sample, stress, notify=None):
+        self.sample = sample.lower()
+        self.stress = stress.lower()
+        self.notify = notify
+        self.count = 0
+        self.smoothed = None
+        self.minimum = np.inf
+        # Samples from index tail_start on that the searches might still refer to.
+        self.tail_start = 0
+        self.tail_times = np.empty(0)
+        self.tail_values = np.empty(0)
+        self.tail_derivatives = np.empty(0)
+        self.events = []
+        self.trigger = None
+        self.verdict = None
+        # Next index at which a drop could start and whether the drop condition has to clear first.
+        self.next_candidate = 1
+        self.quiet_needed = False
+        # Samples before this index were already searched for the decision point of the current trigger.
+        self.checked = 0
+
+    def update(self, timestamps, data):
+        """Process the samples after the ones seen so far. Both arguments contain the whole recording."""
+        timestamps = np.asarray(timestamps)[self.count :]
+        data = np.asarray(data, dtype=np.float64)[self.count :]
+        if len(data) == 0:
+            return
+        self.count += len(data)
+        self.minimum = min(self.minimum, data.min())
+
+        # Continue the filter and the derivative from the last smoothed value.
+        if self.smoothed is None:
+            smoothed = lp_filter(data, SMOOTHING_ALPHA)
+            previous = smoothed[0]
+        else:
+            smoothed = lp_filter(np.concatenate(([self.smoothed], data)), SMOOTHING_ALPHA)[1:]
+            previous = self.smoothed
+        derivative = np.diff(smoothed, prepend=previous)
+        derivative[np.isnan(derivative)] = 0
+        self.smoothed = smoothed[-1]
+
+        self.tail_times = np.concatenate((self.tail_times, timestamps))
+        self.tail_values = np.concatenate((self.tail_values, data))
+        self.tail_derivatives = np.concatenate((self.tail_derivatives, derivative))
+
+        if self.sample != "aba":
+            # Only one event, triggered at the start.
+            if not self.events and self.trigger is None:
+                self._set_trigger(0)
+            if self.trigger is not None:
+                self._find_decision()
+        else:
+            while (self.trigger is not None or self._find_trigger()) and self._find_decision():
+                pass
+
+        # Only the samples needed for the next searches are kept.
+        if self.trigger is not None:
+            self._trim(self.checked - 1)
+        else:
+            self._trim(self.next_candidate - 1)
+
+    def _set_trigger(self, index):
+        local = index - self.tail_start
+        self.trigger = (self.tail_times[local], self.tail_values[local])
+        self.checked = index
+
+    def _find_trigger(self):
+        count = self.count - LONG_WINDOW - self.next_candidate
+        if count <= 0:
+            return False
+        offset = self.next_candidate - self.tail_start
+        derivatives = self.tail_derivatives[offset:]
+        drops = _find_drops(derivatives, count)
+        first = 0
+        if self.quiet_needed:
+            quiet = np.flatnonzero(_find_quiet(derivatives, count))
+            if len(quiet) == 0:
+                self.next_candidate += count
+                return False
+            first = quiet[0]
+            self.quiet_needed = False
+        starts = np.flatnonzero(drops[first:])
+        if len(starts) == 0:
+            self.next_candidate += count
+            return False
+        candidate = self.next_candidate + first + starts[0]
+        self._set_trigger(candidate - 1)
+        self.next_candidate = candidate
+        return True
+
+    def _find_decision(self):
+        target_time = self.trigger[0] + EXPERIMENT_DURATION[self.sample]
+        times = self.tail_times[self.checked - self.tail_start :]
+        future_index = times.searchsorted(target_time)
+        if future_index == len(times):
+            self.checked = self.count
+            return False
+
+        future_index += self.checked
+        local = future_index - self.tail_start
+        decision = (self.tail_times[local], self.tail_values[local])
+        self.events.append((self.trigger, decision))
+        self._decide(self.trigger, decision)
+        self.trigger = None
+        # Hysteresis: the next drop has to start after the decision and after a quiet window.
+        self.next_candidate = max(future_index, self.next_candidate + 1)
+        self.quiet_needed = True
+        return True
+
+    def _trim(self, index):
+        index = max(index, self.tail_start)
+        cut = index - self.tail_start
+        self.tail_times = self.tail_times[cut:]
+        self.tail_values = self.tail_values[cut:]
+        self.tail_derivatives = self.tail_derivatives[cut:]
+        self.tail_start = index
+
+    def _decide(self, trigger, decision):
+        stressed, value = is_stressed(trigger[1], decision[1], self.sample, self.stress)
+        if stressed is None:
+            return
+        self.verdict = "STRESSED" if stressed else "GOOD"
+        if self.notify is not None:
+            self.notify(
+                f"{self.verdict} ({self.sample.upper()}, {self.stress}): value {value:.2f}, "
+                f"trigger at {trigger[0]:.0f} s, decision at {decision[0]:.0f} s."
+            )
+
+    def figure(self):
+        events = self.events + ([(self.trigger, None)] if self.trigger is not None else [])
+        return draw(events, self.minimum, self.sample, self.stress)
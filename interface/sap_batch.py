@@ -0,0 +1,104 @@
+import argparse
+import concurrent.futures
+import os
+import pathlib
+
+import pandas as pd
+
+import sap_analysis
+
+ELECTRODES = ("ABA", "ROS")
+STRESSES = ("ozone", "water")
+COLUMNS = [
+    "experiment",
+    "sensor",
+    "file",
+    "event",
+    "electrode",
+    "stress",
+    "trigger_time",
+    "trigger_value",
+    "decision_time",
+    "decision_value",
+    "value",
+    "stressed",
+]
+
+
+def find_sap_files(measurement_path):
+    """All recordings of SAP sensors: <measurements>/<experiment>/SAP/S*/*.csv"""
+    return sorted(pathlib.Path(measurement_path).glob("*/SAP/S*/*.csv"))
+
+
+def analyze_file(file_path):
+    """Return one result row per event, electrode type and stress source for a recording."""
+    df = pd.read_csv(file_path, on_bad_lines="skip").dropna()
+    if "elapsed" not in df or len(df.columns) < 2:
+        return []
+    # Same column as in the live plot: the first one after the elapsed time.
+    timestamps = df["elapsed"].to_numpy()
+    data = df.drop(columns="elapsed").iloc[:, 0].to_numpy(dtype="float64")
+
+    rows = []
+    for electrode in ELECTRODES:
+        sample = electrode.lower()
+        # Recordings without a trigger still get a row with empty results.
+        events = sap_analysis.find_events(timestamps, data, sample) or [(None, None)]
+        for event, (trigger, decision) in enumerate(events):
+            for stress in STRESSES:
+                stressed = value = None
+                if trigger is not None and decision is not None:
+                    stressed, value = sap_analysis.is_stressed(trigger[1], decision[1], sample, stress)
+                rows.append(
+                    [
+                        file_path.parents[2].name,
+                        file_path.parent.name,
+                        file_path.name,
+                        event,
+                        electrode,
+                        stress,
+                        *(trigger or (None, None)),
+                        *(decision or (None, None)),
+                        value,
+                        stressed,
+                    ]
+                )
+    return rows
+
+
+def analyze_all(measurement_path, jobs=None):
+    files = find_sap_files(measurement_path)
+    rows = []
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = {executor.submit(analyze_file, file_path): file_path for file_path in files}
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                rows.extend(future.result())
+            except Exception as e:
+                print(f"Analyzing {futures[future]} failed: {e}")
+    results = pd.DataFrame(rows, columns=COLUMNS)
+    return results.sort_values(["experiment", "sensor", "file", "electrode", "event", "stress"], ignore_index=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Analyze all recorded SAP measurements and store the verdicts.")
+    parser.add_argument(
+        "--dir", action="store", default=pathlib.Path.home() / "measurements", help="Directory with the measurements."
+    )
+    parser.add_argument(
+        "--output",
+        action="store",
+        default=pathlib.Path.home() / "OrangeBox/status/sap_results.csv",
+        help="CSV file for the results.",
+    )
+    parser.add_argument(
+        "--jobs", action="store", type=int, default=os.cpu_count(), help="Number of files analyzed in parallel."
+    )
+    args = parser.parse_args()
+
+    results = analyze_all(args.dir, args.jobs)
+    output = pathlib.Path(args.output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    results.to_csv(output, index=False)
+    num_recordings = len(results.drop_duplicates(["experiment", "sensor", "file"]))
+    print(f"Analyzed {num_recordings} recordings, results saved to {output}.")
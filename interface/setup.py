@@ -0,0 +1,3 @@
+from setuptools import setup
+
+setup(name='measurement_store', version='1.0', packages=['measurement_store'])
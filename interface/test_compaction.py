@@ -0,0 +1,115 @@
+import json
+import pathlib
+import tempfile
+import unittest
+import zipfile
+from unittest.mock import patch
+
+import pandas as pd
+
+import compaction
+import data_reader
+from measurement_store import columnar, export, manifest
+
+FMT = "%Y-%m-%d %H:%M:%S:%f"
+
+
+@unittest.skipUnless(columnar.available(), "pyarrow is not installed")
+class TestCompaction(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.root = pathlib.Path(self.tmp_dir.name)
+        self.measurements = self.root / "measurements"
+        self.data_dir = self.measurements / "OB_1" / "MU" / "CYB1"
+        self.data_dir.mkdir(parents=True)
+        self.patcher = patch.object(manifest, "MANIFEST_PATH", self.root / "manifests")
+        self.patcher.start()
+
+        start = pd.Timestamp("2024-01-01 00:00:00")
+        self.contents = {}
+        for i, name in enumerate(["CYB1_a.csv", "CYB1_b.csv", "CYB1_c.csv"]):
+            lines = ["datetime,temp_external,count,status"]
+            for j in range(1000):
+                timestamp = (start + pd.Timedelta(seconds=1000 * i + j)).strftime(FMT)
+                lines.append(f"{timestamp},{j / 4},{j % 3},ok")
+            self.contents[name] = "\n".join(lines) + "\n"
+            (self.data_dir / name).write_text(self.contents[name])
+
+    def tearDown(self):
+        self.patcher.stop()
+        manifest._manifests.clear()
+        self.tmp_dir.cleanup()
+
+    def test_compaction(self):
+        before = manifest.get(self.data_dir).files()
+        window_start = pd.Timestamp("2024-01-01 00:10:00")
+        expected = data_reader.WindowReader(data_reader.CsvTailCache()).read(self.data_dir, window_start, FMT)
+
+        compactor = compaction.Compactor(self.measurements, FMT, remove_delay=0)
+        compactor.update()
+        files = manifest.get(self.data_dir).files()
+        self.assertEqual([entry["name"] for entry in files], ["CYB1_a.parquet", "CYB1_b.parquet", "CYB1_c.csv"])
+        for old, new in zip(before[:2], files[:2]):
+            self.assertEqual({key: new[key] for key in ("header", "rows", "first", "last")},
+                             {key: old[key] for key in ("header", "rows", "first", "last")})
+        # The CSV files are removed in the next pass.
+        self.assertTrue((self.data_dir / "CYB1_a.csv").exists())
+        compactor.update()
+        self.assertFalse((self.data_dir / "CYB1_a.csv").exists())
+        self.assertTrue((self.data_dir / "CYB1_c.csv").exists())
+        self.assertEqual(list(self.data_dir.glob(".*.tmp")), [])
+
+        df = data_reader.WindowReader(data_reader.CsvTailCache()).read(self.data_dir, window_start, FMT)
+        pd.testing.assert_frame_equal(df, expected, check_dtype=False)
+        self.assertEqual(columnar.read_frame(self.data_dir / "CYB1_b.parquet", columns=["temp_external"]).columns.to_list(),
+                         ["datetime", "temp_external"])
+
+        export.export_measurements(self.measurements, self.root / "data.zip")
+        with zipfile.ZipFile(self.root / "data.zip") as zip_file:
+            merged = zip_file.read("OB_1/CYB1_a_merged_3.csv").decode()
+        # Integer columns come back as integers.
+        header = "datetime,temp_external,count,status\n"
+        self.assertEqual(merged, header + "".join(content[len(header):] for content in self.contents.values()))
+
+    def test_incremental_export(self):
+        with patch.object(export, "WATERMARK_PATH", self.root / "watermarks"):
+            stats = export.export_changes(self.measurements, self.root / "new.zip", "browser")
+            self.assertEqual(stats["files"], 4)
+            export.save_watermarks("browser", stats["watermarks"])
+
+            compactor = compaction.Compactor(self.measurements, FMT, remove_delay=0)
+            compactor.update()
+            compactor.update()
+            stats = export.export_changes(self.measurements, self.root / "new.zip", "browser")
+            with zipfile.ZipFile(self.root / "new.zip") as zip_file:
+                self.assertEqual(zip_file.namelist(), [export.MANIFEST_NAME])
+                self.assertEqual(json.loads(zip_file.read(export.MANIFEST_NAME))["files"], [])
+            # The watermarks of the removed CSV files are dropped.
+            self.assertEqual(
+                sorted(stats["watermarks"]),
+                ["OB_1/MU/CYB1/CYB1_a.parquet", "OB_1/MU/CYB1/CYB1_b.parquet", "OB_1/MU/CYB1/CYB1_c.csv"],
+            )
+
+    def test_lossy_conversion(self):
+        with open(self.data_dir / "CYB1_a.csv", "a") as f:
+            f.write("not a timestamp,1.0,2,ok\n")
+        compactor = compaction.Compactor(self.measurements, FMT, remove_delay=0)
+        compactor.update()
+        compactor.update()
+        names = [entry["name"] for entry in manifest.get(self.data_dir).files()]
+        self.assertEqual(names, ["CYB1_a.csv", "CYB1_b.parquet", "CYB1_c.csv"])
+        self.assertEqual((self.data_dir / "CYB1_a.csv").read_text(), self.contents["CYB1_a.csv"] + "not a timestamp,1.0,2,ok\n")
+        self.assertEqual(list(self.data_dir.glob(".*.tmp")), [])
+
+    def test_incomplete_parquet_keeps_csv(self):
+        entry = manifest.get(self.data_dir).files()[0]
+        columnar.convert(self.data_dir / "CYB1_a.csv", entry, FMT)
+        # The CSV file got more rows than the Parquet file has.
+        with open(self.data_dir / "CYB1_a.csv", "a") as f:
+            f.write(self.contents["CYB1_a.csv"].splitlines()[-1] + "\n")
+        compaction.Compactor(self.measurements, FMT, remove_delay=-1).remove_replaced(self.data_dir)
+        self.assertTrue((self.data_dir / "CYB1_a.csv").exists())
+
+
+if __name__ == "__main__":
+    unittest.main()
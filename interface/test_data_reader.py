@@ -0,0 +1,139 @@
+import pathlib
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+
+import data_reader
+from measurement_store import manifest
+from data_reader import CsvTailCache, WindowReader
+
+
+class TestCsvTailCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.data_dir = pathlib.Path(self.tmp_dir.name)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def write(self, file_name, text, mode="a"):
+        with open(self.data_dir / file_name, mode) as f:
+            f.write(text)
+
+    def test_incomplete_line_is_skipped(self):
+        self.write("a.csv", "datetime,x\n2024-01-01 00:00:00,1\n2024-01-01 00:00", mode="w")
+        cache = CsvTailCache()
+        self.assertEqual(len(cache.read(self.data_dir, "a.csv")), 1)
+
+        self.write("a.csv", ":01,2\n")
+        df = cache.read(self.data_dir, "a.csv")
+        self.assertEqual(df["x"].tolist(), [1, 2])
+        self.assertEqual(str(df["datetime"].iloc[1]), "2024-01-01 00:00:01")
+
+    def test_only_new_rows_are_parsed(self):
+        self.write("a.csv", "datetime,x\n2024-01-01 00:00:00,1\n", mode="w")
+        cache = CsvTailCache()
+        cache.read(self.data_dir, "a.csv")
+        offset = cache.entries[self.data_dir].offset
+
+        self.write("a.csv", "2024-01-01 00:00:01,2\n")
+        cache.read(self.data_dir, "a.csv")
+        self.assertGreater(cache.entries[self.data_dir].offset, offset)
+        self.assertEqual(len(cache.entries[self.data_dir].df), 2)
+
+    def test_empty_extra_columns(self):
+        # An interval without burst readings in the power log.
+        self.write("a.csv", "datetime,u,u_min\n2024-01-01 00:00:00,5,4.9\n2024-01-01 00:00:05,5.1,\n", mode="w")
+        df = CsvTailCache().read(self.data_dir, "a.csv")
+        self.assertEqual(df["u"].tolist(), [5, 5.1])
+        self.assertTrue(np.isnan(df["u_min"].iloc[1]))
+
+    def test_rollover(self):
+        self.write("a.csv", "datetime,x\n2024-01-01 00:00:00,1\n", mode="w")
+        self.write("b.csv", "datetime,x\n2024-01-01 12:00:00,5\n", mode="w")
+        cache = CsvTailCache()
+        cache.read(self.data_dir, "a.csv")
+        df = cache.read(self.data_dir, "b.csv")
+        self.assertEqual(df["x"].tolist(), [5])
+
+
+class TestWindowReader(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.data_dir = pathlib.Path(self.tmp_dir.name)
+        # Three files with one row per minute, 10 hours each.
+        start = pd.Timestamp("2024-01-01 00:00:00")
+        for i in range(3):
+            rows = ["datetime,x"]
+            for j in range(600):
+                rows.append(f"{start + pd.Timedelta(minutes=600 * i + j)},{600 * i + j}")
+            (self.data_dir / f"node_{i}.csv").write_text("\n".join(rows) + "\n")
+
+        self.manifest_dir = tempfile.TemporaryDirectory()
+        self.patcher = patch.object(manifest, "MANIFEST_PATH", pathlib.Path(self.manifest_dir.name))
+        self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+        manifest._manifests.clear()
+        self.manifest_dir.cleanup()
+        self.tmp_dir.cleanup()
+
+    def test_window_in_latest_file(self):
+        reader = WindowReader(CsvTailCache())
+        df = reader.read(self.data_dir, pd.Timestamp("2024-01-01 23:00:00"))
+        self.assertEqual(df["x"].tolist(), list(range(1381, 1800)))
+        self.assertEqual(len(reader.closed_files), 0)
+
+    def test_window_spans_files(self):
+        reader = WindowReader(CsvTailCache())
+        df = reader.read(self.data_dir, pd.Timestamp("2024-01-01 05:00:00"))
+        self.assertEqual(df["x"].tolist(), list(range(301, 1800)))
+        self.assertEqual(len(reader.closed_files), 2)
+
+        # Only the rows in the window are parsed from closed files.
+        self.assertLess(len(reader.closed_files[self.data_dir / "node_0.csv"][2]), 600)
+
+    def test_cached_closed_file_is_reused(self):
+        reader = WindowReader(CsvTailCache())
+        reader.read(self.data_dir, pd.Timestamp("2024-01-01 12:00:00"))
+        cached = reader.closed_files[self.data_dir / "node_1.csv"][2]
+        df = reader.read(self.data_dir, pd.Timestamp("2024-01-01 13:00:00"))
+        self.assertIs(reader.closed_files[self.data_dir / "node_1.csv"][2], cached)
+        self.assertEqual(df["x"].iloc[0], 781)
+
+
+class TestParsing(unittest.TestCase):
+    def test_parse_times_matches_strptime(self):
+        fmt = data_reader.FAST_TIME_FORMAT
+        rng = np.random.default_rng(0)
+        times = pd.Timestamp("2023-12-31 23:59:00") + pd.to_timedelta(rng.integers(0, 10**14, 1000), unit="us")
+        values = pd.Series(times.strftime(fmt))
+        values[[3, 5, 7, 9, 11, 13]] = [
+            "2024-02-30 00:00:00:000000",
+            "2024-01-01 00:00:00:00000",
+            "2024-01-01 00:00:00.000000",
+            "garbage",
+            None,
+            "2024-01-01 24:00:00:000000",
+        ]
+        expected = pd.to_datetime(values, format=fmt, errors="coerce").astype("datetime64[ns]")
+        pd.testing.assert_series_equal(data_reader.parse_times(values, fmt), expected)
+        self.assertEqual(data_reader.parse_times(values, fmt).isna().sum(), expected.isna().sum())
+
+    def test_read_csv_fields(self):
+        content = b"datetime,a,b,c\n2024-01-01 00:00:00,1,x,2\n2024-01-01 00:00:01,bad,y,3\n"
+        df = data_reader.read_csv(content, ["a", "c", "missing"])
+        self.assertEqual(df.columns.to_list(), ["datetime", "a", "c"])
+        self.assertEqual(df["a"].dtype, np.float32)
+        self.assertTrue(np.isnan(df["a"].iloc[1]))
+        self.assertEqual(df["c"].tolist(), [2, 3])
+        self.assertEqual(data_reader.fields_for(pathlib.Path("exp/MU/CYB1")), data_reader.SENSOR_FIELDS["MU"])
+        self.assertIsNone(data_reader.fields_for(pathlib.Path("measurements/Power")))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,46 @@
+import unittest
+
+import numpy as np
+
+import downsampling
+
+
+class TestDownsampling(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.x = np.arange(10_000).astype("datetime64[s]")
+        self.y = rng.normal(size=10_000)
+        self.y[1234] = 50
+        self.y[8765] = -50
+
+    def test_spikes_are_kept(self):
+        for method in ("lttb", "minmax"):
+            x, y = downsampling.downsample(self.x, self.y, 500, method)
+            self.assertLessEqual(len(y), 500)
+            self.assertEqual(y.max(), 50)
+            self.assertEqual(y.min(), -50)
+            self.assertEqual(x.dtype, self.x.dtype)
+            self.assertTrue(np.all(np.diff(x.astype(np.int64)) > 0))
+
+    def test_lttb_keeps_end_points(self):
+        x, y = downsampling.downsample(self.x, self.y, 100, "lttb")
+        self.assertEqual(len(x), 100)
+        self.assertEqual(x[0], self.x[0])
+        self.assertEqual(x[-1], self.x[-1])
+
+    def test_mean(self):
+        x, y = downsampling.downsample(np.arange(10.0), np.arange(10.0), 5, "mean")
+        np.testing.assert_array_equal(y, [0.5, 2.5, 4.5, 6.5, 8.5])
+
+    def test_short_series_and_nan(self):
+        y = np.array([1.0, np.nan, 3.0])
+        x, y = downsampling.downsample(np.arange(3.0), y, 500, "lttb")
+        np.testing.assert_array_equal(x, [0.0, 2.0])
+
+    def test_unknown_method(self):
+        with self.assertRaises(ValueError):
+            downsampling.downsample(self.x, self.y, 500, "median")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,131 @@
+import json
+import pathlib
+import tempfile
+import unittest
+import zipfile
+from unittest.mock import patch
+
+from measurement_store import export, manifest
+
+
+class TestExport(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.root = pathlib.Path(self.tmp_dir.name)
+        self.measurements = self.root / "measurements"
+        self.patcher = patch.object(manifest, "MANIFEST_PATH", self.root / "manifests")
+        self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+        manifest._manifests.clear()
+        self.tmp_dir.cleanup()
+
+    def write(self, path, text):
+        path = self.measurements / path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(text.encode())
+
+    def export(self):
+        export.export_measurements(self.measurements, self.root / "data.zip")
+        with zipfile.ZipFile(self.root / "data.zip") as zip_file:
+            return {name: zip_file.read(name).decode() for name in zip_file.namelist()}
+
+    def test_merge(self):
+        self.write("OB_1/MU/CYB1/CYB1_a.csv", "datetime,x\r\n1,2\r\n3,4\r\n")
+        self.write("OB_1/MU/CYB1/CYB1_b.csv", "datetime,x\r\n")
+        self.write("OB_1/MU/CYB1/CYB1_c.csv", "datetime,x\r\n5,6\r\n7")
+        self.write("Power/rpi1_a.csv", "datetime,u\n1,2\n")
+        self.write("Power/rpi1_b.csv", "datetime,u\n3,4\n")
+        self.write("Power/rpi2_a.csv", "datetime,u\n5,6\n")
+
+        files = self.export()
+        self.assertEqual(
+            sorted(files), ["OB_1/CYB1_a_merged_3.csv", "Power/rpi1_a_merged_2.csv", "Power/rpi2_a_merged_1.csv"]
+        )
+        # The incomplete last line of the file that is still being written is left out.
+        self.assertEqual(files["OB_1/CYB1_a_merged_3.csv"], "datetime,x\r\n1,2\r\n3,4\r\n5,6\r\n")
+        self.assertEqual(files["Power/rpi1_a_merged_2.csv"], "datetime,u\n1,2\n3,4\n")
+        self.assertFalse((self.root / ".data.zip.tmp").exists())
+
+    def test_changed_columns(self):
+        self.write("OB_1/MU/CYB1/CYB1_a.csv", "datetime,x\r\n1,2\r\n")
+        self.write("OB_1/MU/CYB1/CYB1_b.csv", "datetime,y,x\r\n3,4,5\r\n")
+
+        files = self.export()
+        self.assertEqual(files["OB_1/CYB1_a_merged_2.csv"], "datetime,x,y\r\n1,2,\r\n3,5,4\r\n")
+
+    def test_codecs(self):
+        for i in range(5):
+            self.write(f"OB_1/MU/CYB{i}/CYB{i}_a.csv", "datetime,x\r\n" + "".join(f"{j},{j * i}\r\n" for j in range(1000)))
+
+        expected = None
+        for codec, level in (("deflate", None), ("lzma", None), ("lzma", 0)):
+            stats = export.export_measurements(self.measurements, self.root / "data.zip", codec, level, jobs=3)
+            with zipfile.ZipFile(self.root / "data.zip") as zip_file:
+                self.assertIsNone(zip_file.testzip())
+                files = {name: zip_file.read(name) for name in zip_file.namelist()}
+            self.assertEqual(stats["files"], 5)
+            self.assertEqual(stats["size"], sum(len(data) for data in files.values()))
+            self.assertEqual(list(files), sorted(files))
+            expected = expected or files
+            self.assertEqual(files, expected)
+        self.assertFalse((self.root / ".data.zip.parts").exists())
+
+        with self.assertRaises(ValueError):
+            export.export_measurements(self.measurements, self.root / "data.zip", codec="rar")
+        with self.assertRaises(ValueError):
+            export.export_measurements(self.measurements, self.root / "data.zip", codec="lzma", level=10)
+
+    def test_zip64(self):
+        for i in range(4):
+            self.write(f"OB_1/MU/CYB{i}/CYB{i}_a.csv", "datetime,x\r\n1,2\r\n")
+
+        # The entries are smaller than the limit, but the later ones start beyond it.
+        with patch.object(export, "ZIP64_LIMIT", 120):
+            export.export_measurements(self.measurements, self.root / "data.zip")
+        with zipfile.ZipFile(self.root / "data.zip") as zip_file:
+            self.assertIsNone(zip_file.testzip())
+            infos = zip_file.infolist()
+            self.assertEqual(len(infos), 4)
+            self.assertGreater(infos[-1].header_offset, 120)
+            with open(self.root / "data.zip", "rb") as f:
+                for info in infos:
+                    f.seek(info.header_offset)
+                    local_header = f.read(30)
+                    self.assertEqual(local_header[:4], b"PK\x03\x04")
+                    # The local header needs the same version as the central directory.
+                    self.assertEqual(local_header[4], info.extract_version)
+                    self.assertEqual(info.extract_version, 45 if info.header_offset >= 120 else 20)
+
+    def test_incremental(self):
+        with patch.object(export, "WATERMARK_PATH", self.root / "watermarks"):
+            self.write("OB_1/MU/CYB1/CYB1_a.csv", "datetime,x\r\n1,2\r\n3,")
+            stats = export.export_changes(self.measurements, self.root / "new.zip", "browser")
+            with zipfile.ZipFile(self.root / "new.zip") as zip_file:
+                self.assertEqual(zip_file.read("OB_1/MU/CYB1/CYB1_a.csv"), b"datetime,x\r\n1,2\r\n")
+                parts = json.loads(zip_file.read(export.MANIFEST_NAME))["files"]
+            self.assertEqual(parts, [{"path": "OB_1/MU/CYB1/CYB1_a.csv", "offset": 0, "size": 17}])
+
+            # Without saved watermarks, everything is exported again.
+            self.assertEqual(export.export_changes(self.measurements, self.root / "new.zip", "browser")["files"], 2)
+            export.save_watermarks("browser", stats["watermarks"])
+
+            with open(self.measurements / "OB_1/MU/CYB1/CYB1_a.csv", "ab") as f:
+                f.write(b"4\r\n")
+            self.write("OB_1/MU/CYB1/CYB1_b.csv", "datetime,x\r\n5,6\r\n")
+            export.export_changes(self.measurements, self.root / "new.zip", "browser")
+            with zipfile.ZipFile(self.root / "new.zip") as zip_file:
+                self.assertEqual(zip_file.read("OB_1/MU/CYB1/CYB1_a.csv"), b"3,4\r\n")
+                self.assertEqual(zip_file.read("OB_1/MU/CYB1/CYB1_b.csv"), b"datetime,x\r\n5,6\r\n")
+                parts = json.loads(zip_file.read(export.MANIFEST_NAME))["files"]
+            self.assertEqual(parts[0], {"path": "OB_1/MU/CYB1/CYB1_a.csv", "offset": 17, "size": 5})
+
+            # Other clients have their own watermarks.
+            self.assertEqual(export.export_changes(self.measurements, self.root / "new.zip", "other")["files"], 3)
+            with self.assertRaises(ValueError):
+                export.load_watermarks("../browser")
+
+
+if __name__ == "__main__":
+    unittest.main()
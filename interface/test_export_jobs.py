@@ -0,0 +1,107 @@
+import pathlib
+import tempfile
+import threading
+import time
+import unittest
+import zipfile
+from unittest.mock import patch
+
+import export_jobs
+from measurement_store import export, manifest
+
+
+class TestExportJobManager(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.root = pathlib.Path(self.tmp_dir.name)
+        self.measurements = self.root / "measurements"
+        self.data_dir = self.measurements / "OB_1" / "MU" / "CYB1"
+        self.data_dir.mkdir(parents=True)
+        (self.data_dir / "CYB1_a.csv").write_text("datetime,x\n1,2\n")
+        self.patchers = [
+            patch.object(manifest, "MANIFEST_PATH", self.root / "manifests"),
+            patch.object(export, "WATERMARK_PATH", self.root / "watermarks"),
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+        self.manager = export_jobs.ExportJobManager(self.measurements, self.root / "exports")
+
+    def tearDown(self):
+        for patcher in self.patchers:
+            patcher.stop()
+        manifest._manifests.clear()
+        self.tmp_dir.cleanup()
+
+    def wait(self, job):
+        for _ in range(200):
+            if job.state != "running":
+                return job.state
+            time.sleep(0.01)
+        self.fail("Export did not finish")
+
+    def test_remove_old_archives(self):
+        exports = self.root / "exports"
+        exports.mkdir()
+        old = ["data_0123456789ab.zip", "data_new_browser_0123456789ab.zip", ".data_0123456789ab.zip.tmp"]
+        for name in old + ["notes.zip"]:
+            (exports / name).write_bytes(b"PK")
+        (exports / ".data_0123456789ab.zip.parts").mkdir()
+        (exports / ".data_0123456789ab.zip.parts" / "0").write_bytes(b"")
+
+        export_jobs.ExportJobManager(self.measurements, exports)
+        self.assertEqual([path.name for path in exports.iterdir()], ["notes.zip"])
+
+    def test_single_flight(self):
+        release = threading.Event()
+        original = export.merge_files
+
+        def slow_merge(parts, out):
+            release.wait(5)
+            original(parts, out)
+
+        with patch.object(export, "merge_files", slow_merge):
+            job = self.manager.submit()
+            self.assertIs(self.manager.submit(), job)
+            self.assertEqual(job.requests, 2)
+            release.set()
+            self.assertEqual(self.wait(job), "done")
+
+        # The finished archive is reused until the data changes.
+        self.assertIs(self.manager.submit(), job)
+        with zipfile.ZipFile(job.zip_file_path) as zip_file:
+            self.assertEqual(zip_file.namelist(), ["OB_1/CYB1_a_merged_1.csv"])
+
+        (self.data_dir / "CYB1_b.csv").write_text("datetime,x\n3,4\n")
+        new_job = self.manager.submit()
+        self.assertIsNot(new_job, job)
+        self.assertEqual(self.wait(new_job), "done")
+        self.assertFalse(job.zip_file_path.exists())
+        self.assertIsNone(self.manager.get(job.id))
+
+    def test_cancel(self):
+        release = threading.Event()
+        original = export.merge_files
+
+        def slow_merge(parts, out):
+            release.wait(5)
+            original(parts, out)
+
+        with patch.object(export, "merge_files", slow_merge):
+            job = self.manager.submit("browser")
+            self.manager.submit("browser")
+            self.manager.cancel(job.id)
+            self.assertFalse(job.cancelled.is_set())
+            self.manager.cancel(job.id)
+            self.assertTrue(job.cancelled.is_set())
+            release.set()
+            self.assertEqual(self.wait(job), "cancelled")
+
+        self.assertEqual(export.load_watermarks("browser"), {})
+        new_job = self.manager.submit("browser")
+        self.assertIsNot(new_job, job)
+        self.assertEqual(self.wait(new_job), "done")
+        self.assertIn("OB_1/MU/CYB1/CYB1_a.csv", export.load_watermarks("browser"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+import os
+import pathlib
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from measurement_store import manifest
+
+
+class TestDirectoryManifest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.root = pathlib.Path(self.tmp_dir.name)
+        self.data_dir = self.root / "OB-1_1" / "MU" / "CYB1"
+        self.data_dir.mkdir(parents=True)
+        self.patcher = patch.object(manifest, "MANIFEST_PATH", self.root / "manifests")
+        self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+        manifest._manifests.clear()
+        self.tmp_dir.cleanup()
+
+    def write(self, file_name, text, mode="a"):
+        with open(self.data_dir / file_name, mode) as f:
+            f.write(text)
+
+    def test_entries(self):
+        self.write("a.csv", "datetime,x\n2024-01-01 00:00:00,1\n2024-01-01 00:00:01,2\n", mode="w")
+        self.write("b.csv", "datetime,x\n2024-01-01 12:00:00,3\n2024-01-01 12", mode="w")
+        first, second = manifest.get(self.data_dir).files()
+
+        self.assertEqual(first["rows"], 2)
+        self.assertEqual(first["first"], "2024-01-01 00:00:00")
+        self.assertEqual(first["last"], "2024-01-01 00:00:01")
+        self.assertTrue(first["closed"])
+        self.assertEqual(second["rows"], 1)
+        self.assertEqual(second["last_row"], "2024-01-01 12:00:00,3")
+        self.assertFalse(second["closed"])
+
+    def test_incremental_update(self):
+        self.write("a.csv", "datetime,x\n2024-01-01 00:00:00,1\n", mode="w")
+        dir_manifest = manifest.get(self.data_dir)
+        self.write("a.csv", "2024-01-01 00:00:01,2\n")
+
+        with patch("measurement_store.manifest.os.listdir", side_effect=AssertionError("directory listed")):
+            entry = manifest.get(self.data_dir).latest()
+        self.assertIs(manifest.get(self.data_dir), dir_manifest)
+        self.assertEqual(entry["rows"], 2)
+        self.assertEqual(entry["last"], "2024-01-01 00:00:01")
+        self.assertEqual(entry["size"], os.path.getsize(self.data_dir / "a.csv"))
+
+    def test_stored_manifest_is_reused(self):
+        self.write("a.csv", "datetime,x\n2024-01-01 00:00:00,1\n", mode="w")
+        self.write("b.csv", "datetime,x\n2024-01-01 12:00:00,3\n", mode="w")
+        manifest.get(self.data_dir)
+        manifest._manifests.clear()
+
+        with patch("measurement_store.manifest.os.listdir", side_effect=AssertionError("directory listed")):
+            files = manifest.get(self.data_dir).files()
+        self.assertEqual([entry["name"] for entry in files], ["a.csv", "b.csv"])
+
+    def test_find_measurement_dirs(self):
+        self.write("a.csv", "datetime,x\n", mode="w")
+        (self.root / "Power").mkdir()
+        (self.root / "Power" / "host.csv").write_text("datetime,x\n")
+        (self.root / "empty").mkdir()
+
+        found = list(manifest.find_measurement_dirs(self.root))
+        self.assertEqual(found, [self.data_dir, self.root / "Power"])
+
+
+if __name__ == "__main__":
+    unittest.main()
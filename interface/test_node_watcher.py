@@ -0,0 +1,50 @@
+import pathlib
+import tempfile
+import time
+import unittest
+
+from node_watcher import NodeWatcher
+
+
+class TestNodeWatcher(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = pathlib.Path(self.tmp_dir.name)
+        (self.path / "MU" / "CYB1").mkdir(parents=True)
+        (self.path / "MU" / "CYB1" / "a.csv").write_text("datetime,x\n")
+        self.watcher = NodeWatcher(self.path)
+        self.watcher.start()
+
+    def tearDown(self):
+        self.watcher.stop()
+        self.tmp_dir.cleanup()
+
+    def wait_for(self, condition):
+        deadline = time.monotonic() + 5
+        while not condition():
+            if time.monotonic() > deadline:
+                self.fail("Timed out")
+            time.sleep(0.01)
+
+    def test_existing_and_new_nodes(self):
+        self.wait_for(lambda: self.watcher.active_nodes() == ["CYB1"])
+
+        node = self.path / "Zigbee" / "Z1"
+        node.mkdir(parents=True)
+        with open(node / "b.csv", "w") as f:
+            f.write("datetime,x\n")
+        self.wait_for(lambda: self.watcher.active_nodes() == ["CYB1", "Z1"])
+        self.assertEqual(self.watcher.latest_file(node), node / "b.csv")
+
+    def test_inactive_nodes(self):
+        self.wait_for(lambda: self.watcher.active_nodes() == ["CYB1"])
+        self.watcher.active_timeout = 0.1
+        self.wait_for(lambda: self.watcher.active_nodes() == [])
+
+        with open(self.path / "MU" / "CYB1" / "a.csv", "a") as f:
+            f.write("2024-01-01 00:00:00,1\n")
+        self.wait_for(lambda: self.watcher.active_nodes() == ["CYB1"])
+
+
+if __name__ == "__main__":
+    unittest.main()
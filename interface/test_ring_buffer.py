@@ -0,0 +1,83 @@
+import pathlib
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+
+from measurement_store import manifest
+from ring_buffer import RingBuffer, SensorBuffers
+
+
+class TestRingBuffer(unittest.TestCase):
+    def test_wrap_around(self):
+        buffer = RingBuffer(["x", "y"], capacity=5)
+        buffer.append(np.arange(3), np.array([[0, 1, 2], [0, 10, 20]]))
+        buffer.append(np.arange(3, 7), np.array([[3, 4, 5, 6], [30, 40, 50, 60]]))
+        self.assertEqual(buffer.size, 5)
+        self.assertEqual(buffer.oldest(), 2)
+        self.assertEqual(buffer.newest(), 6)
+
+        times, values = buffer.since(-1)
+        np.testing.assert_array_equal(times, [2, 3, 4, 5, 6])
+        np.testing.assert_array_equal(values[1], [20, 30, 40, 50, 60])
+
+        times, values = buffer.since(4)
+        np.testing.assert_array_equal(times, [5, 6])
+        np.testing.assert_array_equal(values[0], [5, 6])
+
+    def test_more_samples_than_capacity(self):
+        buffer = RingBuffer(["x"], capacity=3)
+        buffer.append(np.arange(10), np.arange(10.0)[np.newaxis])
+        times, values = buffer.since(-1)
+        np.testing.assert_array_equal(times, [7, 8, 9])
+
+
+class TestSensorBuffers(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.data_dir = pathlib.Path(self.tmp_dir.name) / "data"
+        self.data_dir.mkdir()
+        patcher = patch.object(manifest, "MANIFEST_PATH", pathlib.Path(self.tmp_dir.name) / "manifests")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.now = pd.Timestamp.now().floor("s")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def write(self, file_name, seconds, mode="a"):
+        with open(self.data_dir / file_name, mode) as f:
+            if mode == "w":
+                f.write("datetime,x\n")
+            for s in seconds:
+                f.write(f"{self.now + pd.Timedelta(seconds=s)},{s}\n")
+
+    def test_follows_appends_and_rollover(self):
+        # The first row is older than the buffered window.
+        self.write("a.csv", [-7200, -30, -20], mode="w")
+        buffers = SensorBuffers(hours=1)
+        df = buffers.read(self.data_dir, self.now - pd.Timedelta(minutes=1))
+        self.assertEqual(df["x"].tolist(), [-30, -20])
+        self.assertIsNone(buffers.read(self.data_dir, self.now - pd.Timedelta(hours=2)))
+
+        self.write("a.csv", [-10])
+        self.write("b.csv", [0, 10], mode="w")
+        buffers.update()
+        df = buffers.read(self.data_dir, self.now - pd.Timedelta(seconds=25))
+        self.assertEqual(df["x"].tolist(), [-20, -10, 0, 10])
+        self.assertEqual(df["datetime"].iloc[-1], self.now + pd.Timedelta(seconds=10))
+        self.assertIn("data", buffers.memory_usage())
+
+    def test_capacity_limits_covered_range(self):
+        self.write("a.csv", range(-100, 0), mode="w")
+        # Room for 10 samples of one column and the time axis.
+        buffers = SensorBuffers(hours=1, max_bytes=10 * 16)
+        self.assertIsNone(buffers.read(self.data_dir, self.now - pd.Timedelta(seconds=50)))
+        df = buffers.read(self.data_dir, self.now - pd.Timedelta(seconds=5))
+        self.assertEqual(df["x"].tolist(), [-4, -3, -2, -1])
+
+
+if __name__ == "__main__":
+    unittest.main()
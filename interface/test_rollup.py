@@ -0,0 +1,85 @@
+import pathlib
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import pandas as pd
+
+import rollup
+from measurement_store import manifest
+
+
+class TestRollupManager(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.root = pathlib.Path(self.tmp_dir.name)
+        self.measurements = self.root / "measurements"
+        self.rollups = self.root / "rollups"
+        self.patcher = patch.object(manifest, "MANIFEST_PATH", self.root / "manifests")
+        self.patcher.start()
+
+        # Two days of data every minute, in two files.
+        self.data_dir = self.measurements / "Power"
+        self.data_dir.mkdir(parents=True)
+        end = pd.Timestamp.now().floor("min")
+        times = pd.date_range(end=end, periods=2 * 24 * 60, freq="min")
+        for name, part in (("rpi_a.csv", times[: 24 * 60]), ("rpi_b.csv", times[24 * 60 :])):
+            df = pd.DataFrame({"datetime": part.strftime("%Y-%m-%d %H:%M:%S"), "current": 1.0})
+            df.to_csv(self.data_dir / name, index=False)
+
+    def tearDown(self):
+        self.patcher.stop()
+        manifest._manifests.clear()
+        self.tmp_dir.cleanup()
+
+    def test_first_start_covers_retention(self):
+        manager = rollup.RollupManager(self.measurements, rollup_path=self.rollups)
+        manager.update()
+        df = pd.read_csv(self.rollups / "Power" / "10min.csv", index_col="datetime", parse_dates=True)
+        retention_start = pd.Timestamp.now() - pd.Timedelta(seconds=rollup.ROLLUP_RETENTION)
+        self.assertGreaterEqual(df.index[0], retention_start.floor("10min"))
+        self.assertEqual(df["current_mean"].unique().tolist(), [1.0])
+
+    def test_prune(self):
+        manager = rollup.RollupManager(self.measurements, rollup_path=self.rollups)
+        manager.update()
+        self.assertTrue((self.rollups / "Power").is_dir())
+        for file_path in self.data_dir.iterdir():
+            file_path.unlink()
+        self.data_dir.rmdir()
+        # Directories are only checked every prune_interval.
+        manager.update()
+        self.assertTrue((self.rollups / "Power").is_dir())
+        manager.last_prune -= rollup.PRUNE_INTERVAL
+        manager.update()
+        self.assertFalse((self.rollups / "Power").exists())
+        self.assertEqual(manager.rollups, {})
+
+    def test_trim(self):
+        level = rollup._Level("1min", 60, self.rollups / "1min.csv")
+        times = pd.date_range(end=pd.Timestamp.now(), periods=3 * 24 * 60, freq="min")
+        level.add(pd.DataFrame({"current": 1.0}, index=times))
+        df = pd.read_csv(level.file_path, index_col="datetime", parse_dates=True)
+        retention_start = pd.Timestamp.now() - pd.Timedelta(seconds=rollup.ROLLUP_RETENTION)
+        self.assertLessEqual(df.index[0], retention_start)
+        self.assertGreater(df.index[0], retention_start - pd.Timedelta(hours=1))
+
+
+    def test_changed_columns(self):
+        level = rollup._Level("1min", 60, self.rollups / "1min.csv")
+        times = pd.date_range(end=pd.Timestamp.now().floor("min"), periods=90, freq="min")
+        level.add(pd.DataFrame({"current": 1.0}, index=times[:30]))
+        # Burst fields are added, and are empty in one interval.
+        burst = pd.DataFrame({"current": 1.0, "current_max": 2.0}, index=times[30:60])
+        burst.iloc[5, 1] = float("nan")
+        level.add(burst)
+        level.add(pd.DataFrame({"current": 1.0}, index=times[60:]))
+
+        df = rollup._Level("1min", 60, level.file_path).read(times[0] - pd.Timedelta(minutes=1))
+        self.assertEqual(len(df), 89)
+        self.assertEqual(df["current_mean"].unique().tolist(), [1.0])
+        self.assertEqual(df["current_max_max"].notna().sum(), 29)
+        self.assertTrue(df["current_max_mean"].iloc[:30].isna().all())
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,101 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+import sap_analysis
+
+
+def reference_lp_filter(data, alpha):
+    smoothed = data.copy()
+    for i in range(1, len(data)):
+        smoothed.iloc[i] = alpha * data.iloc[i] + (1 - alpha) * smoothed.iloc[i - 1]
+    return smoothed
+
+
+def reference_find_negative_drop(derivatives):
+    for i in range(1, len(derivatives) - 10):
+        if all(derivatives.iloc[i : i + 10] < -0.01) or all(derivatives.iloc[i : i + 3] < -0.1):
+            return i - 1
+
+
+class TestSapAnalysis(unittest.TestCase):
+    def setUp(self):
+        # A noisy baseline with a slow drop after 300 s, sampled at 10 Hz.
+        rng = np.random.default_rng(0)
+        elapsed = np.arange(0, 600, 0.1)
+        values = 50 + rng.normal(scale=0.02, size=len(elapsed)) - np.clip(elapsed - 300, 0, 20) * 0.5
+        self.data = pd.Series(values, index=pd.Index(elapsed, name="elapsed"))
+
+    def test_lp_filter_matches_reference(self):
+        for alpha in (0.2, 0.01, 0.9):
+            smoothed = sap_analysis.lp_filter(self.data, alpha)
+            np.testing.assert_allclose(smoothed, reference_lp_filter(self.data, alpha), rtol=1e-12)
+            self.assertTrue(smoothed.index.equals(self.data.index))
+
+    def test_find_negative_drop_matches_reference(self):
+        derivative = reference_lp_filter(self.data, 0.2).diff().fillna(0)
+        self.assertEqual(sap_analysis.find_negative_drop(derivative), reference_find_negative_drop(derivative))
+        self.assertIsNotNone(sap_analysis.find_negative_drop(derivative))
+
+        flat = pd.Series(np.zeros(100))
+        self.assertIsNone(sap_analysis.find_negative_drop(flat))
+        steep = pd.Series([0, 0, -1, -1, -1] + [0] * 20)
+        self.assertEqual(sap_analysis.find_negative_drop(steep), reference_find_negative_drop(steep))
+        self.assertIsNone(sap_analysis.find_negative_drop(pd.Series([-1.0] * 11)))
+
+    def test_analyze(self):
+        traces, shapes, annotations = sap_analysis.analyze(self.data.index, self.data, "ABA", "ozone")
+        self.assertEqual(len(shapes), 1)
+        self.assertAlmostEqual(shapes[0]["x0"], 299.6, delta=1)
+        self.assertEqual(annotations[-1]["text"], "GOOD")
+        self.assertEqual(annotations[0]["text"], "Value: 9.91")
+
+    def test_streaming_matches_batch(self):
+        for sample, chunk in (("ABA", 7), ("ABA", 1000), ("ROS", 50)):
+            messages = []
+            analyzer = sap_analysis.StreamingAnalyzer(sample, "ozone", notify=messages.append)
+            for end in range(chunk, len(self.data) + chunk, chunk):
+                analyzer.update(self.data.index[:end], self.data.iloc[:end])
+            self.assertEqual(analyzer.count, len(self.data))
+            self.assertEqual(analyzer.figure()[1:], sap_analysis.analyze(self.data.index, self.data, sample, "ozone")[1:])
+            self.assertEqual(len(messages), 1)
+
+    def test_streaming_waits_for_decision(self):
+        analyzer = sap_analysis.StreamingAnalyzer("ABA", "water")
+        analyzer.update(self.data.index[:4000], self.data.iloc[:4000])
+        self.assertIsNotNone(analyzer.trigger)
+        self.assertEqual(analyzer.events, [])
+        analyzer.update(self.data.index[:5100], self.data.iloc[:5100])
+        trigger, decision = analyzer.events[0]
+        target_time = trigger[0] + sap_analysis.EXPERIMENT_DURATION["aba"]
+        self.assertGreaterEqual(decision[0], target_time)
+        self.assertLess(decision[0] - 0.1, target_time)
+        self.assertEqual(analyzer.verdict, "GOOD")
+
+    def test_multiple_events(self):
+        # Three drops; the second one lasts longer than the experiment and must only be counted once.
+        rng = np.random.default_rng(1)
+        elapsed = np.arange(0, 3000, 0.1)
+        values = 50 + rng.normal(scale=0.02, size=len(elapsed))
+        for start, length, depth in ((300, 20, 10), (1000, 300, 60), (2200, 3, 0.5)):
+            values -= np.clip(elapsed - start, 0, length) / length * depth
+        data = pd.Series(values, index=pd.Index(elapsed, name="elapsed"))
+
+        events = sap_analysis.find_events(data.index, data, "ABA")
+        self.assertEqual([round(trigger[0] / 100) for trigger, _ in events], [3, 10, 22])
+        self.assertEqual(events[0], sap_analysis.evaluate(data.index, data, "ABA"))
+
+        messages = []
+        analyzer = sap_analysis.StreamingAnalyzer("ABA", "ozone", notify=messages.append)
+        for end in range(123, len(data) + 123, 123):
+            analyzer.update(data.index[:end], data.iloc[:end])
+        self.assertEqual(analyzer.events, events)
+        self.assertEqual(len(messages), 3)
+        traces, shapes, annotations = sap_analysis.analyze(data.index, data, "ABA", "ozone")
+        self.assertEqual(len(shapes), 3)
+        self.assertEqual(annotations[-1]["text"], "STRESSED")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,40 @@
+import pathlib
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+import sap_analysis
+import sap_batch
+
+
+class TestSapBatch(unittest.TestCase):
+    def test_analyze_all(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            elapsed = np.arange(0, 600, 0.1)
+            values = 50 - np.clip(elapsed - 300, 0, 20) * 0.5
+            for experiment in ("OB_1", "OB_2"):
+                sensor_dir = pathlib.Path(tmp_dir) / experiment / "SAP" / "S1"
+                sensor_dir.mkdir(parents=True)
+                pd.DataFrame({"elapsed": elapsed, "current": values}).to_csv(sensor_dir / "a.csv", index=False)
+            # Other sensor types are ignored.
+            (pathlib.Path(tmp_dir) / "OB_1" / "MU" / "CYB1").mkdir(parents=True)
+            (pathlib.Path(tmp_dir) / "OB_1" / "MU" / "CYB1" / "a.csv").write_text("datetime,x\n")
+
+            results = sap_batch.analyze_all(tmp_dir, jobs=2)
+
+        self.assertEqual(len(results), 8)
+        self.assertEqual(results["experiment"].unique().tolist(), ["OB_1", "OB_2"])
+        row = results.loc[(results["electrode"] == "ABA") & (results["stress"] == "ozone")].iloc[0]
+        trigger, decision = sap_analysis.evaluate(elapsed, values, "aba")
+        self.assertEqual(row["trigger_time"], trigger[0])
+        self.assertEqual(row["decision_value"], decision[1])
+        self.assertEqual(row["value"], abs(decision[1] - trigger[1]))
+        self.assertFalse(row["stressed"])
+        invalid = results.loc[(results["electrode"] == "ROS") & (results["stress"] == "water")]
+        self.assertTrue(invalid["stressed"].isna().all())
+
+
+if __name__ == "__main__":
+    unittest.main()
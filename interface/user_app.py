@@ -1,22 +1,29 @@
-import datetime
 import logging
-import os
 import pathlib
 import subprocess
 import time
 import threading
+import uuid
 
 import dash
 import dash_bootstrap_components as dbc
-import diskcache
 import pandas as pd
 import plotly.graph_objects as go
 from dash import dcc, html, ctx
-from dash.dependencies import Input, Output, State
-from dash.long_callback import DiskcacheLongCallbackManager
-
+from dash.dependencies import ClientsideFunction, Input, Output, State
+
+import compaction
+import data_reader
+import downsampling
+import export_jobs
+import figure_cache
+import live_stream
+import node_watcher
+import ring_buffer
+import rollup
 import utils
 import sap_analysis
+from measurement_store import manifest
 
 # Constants
 DEFAULT_DATA_FIELDS_FILE = (
@@ -29,8 +36,7 @@ WIFI_FILE = pathlib.Path.home() / "OrangeBox/config/orange_box.config"
 EXP_NUMBER_FILE = pathlib.Path.home() / "OrangeBox/status/experiment_number.txt"
 EXTRA_CONFIG_FILE = pathlib.Path.home() / "extra_config.sh"
 MEASUREMENT_PATH = pathlib.Path.home() / "measurements"
-TEMP_ZIP_PATH = pathlib.Path.home() / "merged_measurements"
-ZIP_FILE_PATH = pathlib.Path.home() / "data"
+EXPORT_PATH = pathlib.Path.home() / "exports"
 GIT_REPOS_PATHS = [
     pathlib.Path.home() / "OrangeBox",
     pathlib.Path.home() / "OrangeBox/drivers/mu_interface",
@@ -42,8 +48,38 @@ ENERGY_PATH = MEASUREMENT_PATH / "Power"
 DEFAULT_PLOT_WINDOW = 2
 DEFAULT_PLOT_SAMPLES = 500
 DEFAULT_PLOT_INTERVAL = 10 * 1000
+MEASUREMENT_TIME_FORMAT = "%Y-%m-%d %H:%M:%S:%f"
+# Recent samples of the plotted sensors are kept in memory, at most this many hours and bytes per sensor.
+SAMPLE_BUFFER_HOURS = DEFAULT_PLOT_WINDOW
+SAMPLE_BUFFER_MAX_BYTES = 4 << 20
+# Plots are redrawn completely after this many appended samples or seconds.
+MAX_APPENDED_SAMPLES = DEFAULT_PLOT_SAMPLES // 5
+FULL_REDRAW_INTERVAL = 10 * 60
+# Columns shown in the power plots, in the order of the traces.
+PLOT_FIELDS = {
+    "energy_plot": ["bus_voltage_battery", "bus_voltage_solar", "current_battery", "current_solar"],
+    "env_plot": ["temperature", "humidity"],
+}
+# Downsampling method for each plot, see downsampling.METHODS.
+PLOT_DOWNSAMPLING = {
+    "mu_plot": "lttb",
+    "energy_plot": "minmax",
+    "env_plot": "mean",
+}
 CALL_TRACKER = utils.TimestampMonitor(num_intervals=3, interval_len=10)
 CALL_TRACKER_LOCK = threading.Lock()
+DATA_CACHE = data_reader.CsvTailCache()
+WINDOW_READER = data_reader.WindowReader(DATA_CACHE)
+SAMPLE_BUFFERS = ring_buffer.SensorBuffers(hours=SAMPLE_BUFFER_HOURS, max_bytes=SAMPLE_BUFFER_MAX_BYTES)
+ROLLUPS = rollup.RollupManager(MEASUREMENT_PATH, fmt=MEASUREMENT_TIME_FORMAT)
+COMPACTOR = compaction.Compactor(MEASUREMENT_PATH, fmt=MEASUREMENT_TIME_FORMAT)
+FIGURE_CACHE = figure_cache.FigureCache()
+LIVE_STREAM = live_stream.LiveStream()
+BOT_NOTIFIER = utils.BotNotifier()
+EXPORT_JOBS = export_jobs.ExportJobManager(MEASUREMENT_PATH, EXPORT_PATH)
+# Streaming analysis of the current recording per SAP sensor and settings.
+SAP_ANALYZERS = {}
+SAP_ANALYZERS_LOCK = threading.Lock()
 
 infoPane = dbc.Col(
     [
@@ -367,6 +403,29 @@ liveDataSettingsPane = dbc.Row(
             ],
             width={"size": "auto", "offset": 2},
         ),
+        dbc.Col(
+            [
+                dbc.Button(
+                    "Download new data",
+                    id="download-new-btn",
+                    outline=True,
+                    color="info",
+                    ),
+            ],
+            width="auto",
+        ),
+        dbc.Col(
+            [
+                dbc.Button(
+                    "Cancel",
+                    id="download-cancel-btn",
+                    outline=True,
+                    color="secondary",
+                    style={"display": "none"},
+                    ),
+            ],
+            width="auto",
+        ),
         # Green label to show that the download is working
         dbc.Col(
             [html.Label(id="download-working", children="Working...", style={"color": "green"}, hidden=True)],
@@ -412,11 +471,9 @@ sapSensorConfigPane = dbc.Row(
 )
 
 # Set up the Dash app
-cache = diskcache.Cache("./cache")
-long_callback_manager = DiskcacheLongCallbackManager(cache)
-
-app = dash.Dash(__name__, external_stylesheets=[dbc.themes.FLATLY], long_callback_manager=long_callback_manager)
+app = dash.Dash(__name__, external_stylesheets=[dbc.themes.FLATLY])
 server = app.server
+LIVE_STREAM.register(server)
 
 # Define the layout
 app.layout = dbc.Container(
@@ -507,9 +564,21 @@ app.layout = dbc.Container(
             interval=10 * 1000,
             n_intervals=0,
         ),
+        dcc.Interval(
+            id="export-interval",
+            interval=1000,
+            n_intervals=0,
+            disabled=True,
+        ),
         # Storage elements
         dcc.Store(id="data-path-store", data=[]),
         dcc.Store(id="run-mode-store", data=[]),
+        dcc.Store(id="plot-state-store", data={}),
+        dcc.Store(id="stream-topics-store", data=["Power"]),
+        dcc.Store(id="live-topics-store", data={}),
+        # Identifies the browser for incremental downloads.
+        dcc.Store(id="export-client-store", storage_type="local"),
+        dcc.Store(id="export-job-store", data=None),
         # Notification modal
         dbc.Modal(
             [
@@ -628,22 +697,53 @@ def start_stop_experiment(start, stop, run_mode):
         return True, False, False, True
 
 
-@app.long_callback(
+@app.callback(
     Output("download-data", "data"),
+    Output("export-job-store", "data"),
+    Output("export-client-store", "data"),
+    Output("export-interval", "disabled"),
+    Output("download-working", "children"),
+    Output("download-working", "hidden"),
+    Output("download-btn", "disabled"),
+    Output("download-new-btn", "disabled"),
+    Output("download-cancel-btn", "style"),
     Input("download-btn", "n_clicks"),
-    running=[
-        (Output("download-btn", "disabled"), True, False),
-        (Output("download-working", "hidden"), False, True),
-    ],
+    Input("download-new-btn", "n_clicks"),
+    Input("download-cancel-btn", "n_clicks"),
+    Input("export-interval", "n_intervals"),
+    State("export-job-store", "data"),
+    State("export-client-store", "data"),
     prevent_initial_call=True
 )
-def download_data(n_clicks):
-    if n_clicks is None:
-        raise dash.exceptions.PreventUpdate
-
-    utils.merge_measurements(MEASUREMENT_PATH, TEMP_ZIP_PATH, ZIP_FILE_PATH)
-
-    return dcc.send_file(f"{ZIP_FILE_PATH}.zip")
+def download_data(n_all, n_new, n_cancel, n_intervals, job_id, client):
+    running = (False, "Working...", False, True, True, {})
+    idle = (None, client, True, dash.no_update, True, False, False, {"display": "none"})
+
+    if ctx.triggered_id == "download-btn":
+        job = EXPORT_JOBS.submit()
+        return dash.no_update, job.id, client, *running
+    if ctx.triggered_id == "download-new-btn":
+        client = client or uuid.uuid4().hex
+        job = EXPORT_JOBS.submit(client)
+        return dash.no_update, job.id, client, *running
+    if ctx.triggered_id == "download-cancel-btn":
+        EXPORT_JOBS.cancel(job_id)
+        return dash.no_update, *idle
+
+    job = EXPORT_JOBS.get(job_id) if job_id else None
+    if job is None:
+        return dash.no_update, *idle
+    if job.state == "running":
+        status = job.status()
+        progress = (
+            f"Exporting: {status['files']}/{status['total_files']} files, "
+            f"{status['bytes'] / 1e6:.0f}/{status['total_bytes'] / 1e6:.0f} MB"
+        )
+        return dash.no_update, job_id, client, False, progress, False, True, True, {}
+    if job.state == "done":
+        file_name = "data.zip" if job.client is None else "data_new.zip"
+        return dcc.send_file(job.zip_file_path, filename=file_name), *idle
+    return dash.no_update, None, client, True, f"Export {job.state}.", False, False, False, {"display": "none"}
 
 @app.callback(
     Output("orange_box-freq", "value"),
@@ -828,29 +928,20 @@ def toggle_warn_modal(n_clicks, is_open):
     Output("sensor-select", "value"),
     Input("plot-interval", "n_intervals"),
     Input("data-path-store", "data"),
-    State("sensor-select", "value")
+    State("sensor-select", "value"),
+    State("sensor-select", "options"),
 )
-def update_storages(n, data_path, old_value):
-    experiment_path = pathlib.Path(data_path)
-    filtered_nodes = []
-    try:
-        for node_type in experiment_path.iterdir():
-            for node in node_type.iterdir():
-                file_names = os.listdir(node)
-                if file_names:
-                    file_names.sort()
-                    latest_file = node / file_names[-1]
-                    last_modified = latest_file.stat().st_mtime
-                    if (datetime.datetime.now() - datetime.datetime.fromtimestamp(last_modified)).total_seconds() < 30:
-                        filtered_nodes.append(node.name)
-    except FileNotFoundError:
-        return [], ""
+def update_storages(n, data_path, old_value, old_options):
+    if not data_path:
+        raise dash.exceptions.PreventUpdate
+    # The active nodes are tracked in the background, this doesn't touch the file system.
+    filtered_nodes = node_watcher.get(data_path).active_nodes()
 
-    options = [{"label": entry, "value": entry} for entry in sorted(filtered_nodes)]
-    if options:
-        return options, old_value if old_value in filtered_nodes else ""
-    else:
-        return options, ""
+    options = [{"label": entry, "value": entry} for entry in filtered_nodes]
+    value = old_value if old_value in filtered_nodes else ""
+    if options == old_options and value == old_value:
+        raise dash.exceptions.PreventUpdate
+    return options, value
 
 
 @app.callback(
@@ -868,72 +959,108 @@ def update_connections(n, is_open):
     return is_open
 
 
-def read_dataframe(data_dir, time_column="datetime", time_window=None, fmt=None):
+def stream_topics(sensor_select):
+    """Topics whose live samples are appended to the plots: the power log and the selected sensor.
+
+    SAP measurements are plotted over the elapsed time and always redrawn completely.
+    """
+    topics = ["Power"]
+    if sensor_select:
+        sensor_type, _, x_axis_column, _, _ = get_plot_config(sensor_select)
+        if sensor_type and x_axis_column == "datetime":
+            topics.append(sensor_select)
+    return topics
+
+
+@app.callback(
+    Output("stream-topics-store", "data"),
+    Input("sensor-select", "value"),
+)
+def update_stream_topics(sensor_select):
+    return stream_topics(sensor_select)
+
+
+# Samples pushed by the live stream are appended directly in the browser, see assets/live_stream.js.
+app.clientside_callback(
+    ClientsideFunction(namespace="live_stream", function_name="update"),
+    Output("live-topics-store", "data"),
+    Input("stream-topics-store", "data"),
+    Input("plot-interval", "n_intervals"),
+    State("plot-state-store", "data"),
+)
+
+
+def read_dataframe(data_dir, time_column="datetime", time_window=None, fmt=None, start=None):
     try:
-        file_names = os.listdir(data_dir)
-        file_names.sort()
-        df = pd.read_csv(data_dir / file_names[-1], on_bad_lines="warn")
-        df.dropna(inplace=True)
+        if time_column == "datetime" and time_window is not None:
+            start = pd.Timestamp.now() - pd.Timedelta(**time_window)
+        # The window may span several files, e.g. right after a rollover or a driver restart.
+        if time_column == "datetime" and start is not None:
+            # Recent samples are sliced from memory, older ones are read from disk.
+            df = SAMPLE_BUFFERS.read(data_dir, start, fmt)
+            if df is not None:
+                return df
+            return WINDOW_READER.read(data_dir, start, fmt)
 
         # For experiments with elapsed time instead of datetime, don't filter by the given time window.
-        if time_column == "datetime":
-            df["datetime"] = pd.to_datetime(df["datetime"], format=fmt, errors="coerce")
-            if time_window is not None:
-                df = df.loc[df["datetime"] > pd.Timestamp.now() - pd.Timedelta(**time_window)]
-        return df
+        file_name = manifest.get(data_dir).files()[-1]["name"]
+        # The cached frame is shared between sessions, so it must not be modified in place.
+        return DATA_CACHE.read(data_dir, file_name, time_column, fmt).copy()
 
     except (FileNotFoundError, IndexError):
         logging.error("File for live plotting not found.")
         return None
 
 
-@app.callback(
-    Output("mu_plot", "figure"),
-    Output("energy_plot", "figure"),
-    Output("env_plot", "figure"),
-    Input("plot-interval", "n_intervals"),
-    Input("sensor-select", "value"),
-    State("time-select", "value"),
-    State("data-path-store", "data"),
-    State("sap-sensor-electrode", "value"),
-    State("sap-sensor-stress", "value"),
-)
-def update_plots(n, sensor_select, time_select, data_path, sap_sensor_electrode, sap_sensor_stress):
-    fig_data = dict()
-    fig_power = dict()
-    fig_env = dict()
+def read_plot_dataframe(data_dir, time_column, window_seconds, fmt=None):
+    """Return the data for a plot indexed by time and the bucket length if it comes from a rollup (else None)."""
+    # Long windows are plotted from pre-aggregated rollups once they are available.
+    if time_column == "datetime":
+        df = ROLLUPS.read(data_dir, window_seconds, DEFAULT_PLOT_SAMPLES)
+        if df is not None and not df.empty:
+            return df, rollup.LEVELS[rollup.choose_level(window_seconds, DEFAULT_PLOT_SAMPLES)]
 
-    if time_select is None:
-        raise dash.exceptions.PreventUpdate
+    df = read_dataframe(data_dir, time_column, {"seconds": window_seconds}, fmt=fmt)
+    if df is not None:
+        df.set_index(time_column, inplace=True)
+    return df, None
+
+
+def downsample_trace(df, field, method):
+    # With longer selected time windows, we need to downsample the data to keep the plot responsive.
+    if method is None or len(df) <= DEFAULT_PLOT_SAMPLES:
+        return dict(x=df.index, y=df[field])
+    x, y = downsampling.downsample(df.index.to_numpy(), df[field].to_numpy(), DEFAULT_PLOT_SAMPLES, method)
+    return dict(x=x, y=y)
 
+
+def get_sap_analyzer(data_dir, sample, stress):
+    """Return the analyzer of the current recording, which only processes the samples added since the last call."""
+    file_name = manifest.get(data_dir).latest()["name"]
+    key = (data_dir, sample, stress)
+    with SAP_ANALYZERS_LOCK:
+        entry = SAP_ANALYZERS.get(key)
+        if entry is None or entry[0] != file_name:
+            def notify(message):
+                BOT_NOTIFIER.send(f"SAP sensor {data_dir.name}: {message}")
+
+            entry = SAP_ANALYZERS[key] = (file_name, sap_analysis.StreamingAnalyzer(sample, stress, notify))
+    return entry[1]
+
+
+def get_plot_config(sensor_select):
     x_axis_column = "datetime"
     x_axis_name = "datetime"
     y_axis_name = "values"
     if sensor_select.startswith("CYB"):
         sensor_type = "MU"
-        data_fields = [
-            "temp_external",
-            "light_external",
-            "humidity_external",
-            "differential_potential_ch1",
-            "differential_potential_ch2",
-            "RMS_CH1",
-            "RMS_CH2",
-            "transpiration",
-        ]
+        data_fields = data_reader.SENSOR_FIELDS[sensor_type]
     elif sensor_select.startswith("P"):
         sensor_type = "BLE"
         data_fields = "all"
     elif sensor_select.startswith("Z"):
         sensor_type = "Zigbee"
-        data_fields = [
-            "temp_external",
-            "humidity_external",
-            "air_pressure",
-            "mag_X",
-            "mag_Y",
-            "mag_Z"
-        ]
+        data_fields = data_reader.SENSOR_FIELDS[sensor_type]
     elif sensor_select.startswith("S"):
         sensor_type = "SAP"
         data_fields = "all"
@@ -944,17 +1071,178 @@ def update_plots(n, sensor_select, time_select, data_path, sap_sensor_electrode,
         sensor_type = ""
         data_fields = []
 
-    # With longer selected time windows, we need to downsample the data to keep the plot responsive.
-    resample = f"{round(time_select * 3600 / DEFAULT_PLOT_SAMPLES)}s"
+    return sensor_type, data_fields, x_axis_column, x_axis_name, y_axis_name
+
+
+def source_version(data_dir):
+    # The latest file and its size change whenever new samples are written.
+    try:
+        latest_file = manifest.get(data_dir).latest()
+    except FileNotFoundError:
+        return None
+    return None if latest_file is None else (latest_file["name"], latest_file["offset"])
+
+
+def get_plot_state(key, figures):
+    """Remember which columns each plot shows, the newest sample it contains and how many points it has."""
+    plots = {}
+    for plot_id, fig in zip(["mu_plot", "energy_plot", "env_plot"], figures):
+        if not fig or not fig["data"]:
+            continue
+        fields = PLOT_FIELDS.get(plot_id, [trace.name for trace in fig["data"]])
+        traces = fig["data"][: len(fields)]
+        last = max(pd.to_datetime(pd.Series(trace.x)).max() for trace in traces)
+        bucket_seconds = (fig["layout"].meta or {}).get("bucket_seconds")
+        if bucket_seconds:
+            # The last bucket of a rollup covers the samples up to its end, only newer ones are appended.
+            last += pd.Timedelta(seconds=bucket_seconds)
+        plots[plot_id] = {
+            "fields": fields,
+            "last": last.isoformat(),
+            "drawn_last": last.isoformat(),
+            "points": [len(trace.x) for trace in traces],
+            "max_points": [len(trace.x) for trace in traces],
+            "appended": 0,
+            # Samples the browser appended from the live stream, as last reported.
+            "live_appended": 0,
+        }
+    return {"key": key, "window": key[1] * 3600, "appended": 0, "drawn": time.time(), "plots": plots}
+
+
+def plot_max_points(state, window_seconds):
+    """Number of points each trace may keep so that the plot doesn't grow past the selected window.
+
+    The points drawn at the last redraw are assumed to be spread evenly over the window, the ones older than the
+    window are dropped as new samples arrive.
+    """
+    elapsed = (pd.Timestamp(state["last"]) - pd.Timestamp(state["drawn_last"])).total_seconds()
+    if elapsed <= 0:
+        return [points + state["appended"] for points in state["points"]]
+    keep = max(0.0, 1 - elapsed / window_seconds)
+    appended = state["appended"] * min(1.0, window_seconds / elapsed)
+    return [max(1, round(points * keep + appended)) for points in state["points"]]
+
+
+def extend_plots(plot_state, data_dir, sensor_select, live):
+    """Return the samples added since the last update in the format of the extendData property of the plots.
+
+    live is reported by the browser (see assets/live_stream.js): the topics that currently deliver samples, and the
+    newest sample and number of samples appended to each plot from the stream. Plots of these topics are skipped,
+    later appends continue after the samples they already got.
+    Returns None if the plots have to be redrawn completely.
+    """
+    sources = {
+        "mu_plot": (data_dir, MEASUREMENT_TIME_FORMAT, sensor_select),
+        "energy_plot": (ENERGY_PATH, None, "Power"),
+        "env_plot": (ENERGY_PATH, None, "Power"),
+    }
+    # Reports from before the last redraw are about plots that were replaced.
+    live_plots = (live.get("plots") or {}) if live.get("drawn") == plot_state["drawn"] else {}
+    extensions = []
+    appended = 0
+    for plot_id, (source_dir, fmt, topic) in sources.items():
+        state = plot_state["plots"].get(plot_id)
+        if state is None:
+            extensions.append(dash.no_update)
+            continue
+
+        drawn = live_plots.get(plot_id)
+        if drawn:
+            live_appended = max(0, drawn["appended"] - state["live_appended"])
+            state["live_appended"] = drawn["appended"]
+            state["appended"] += live_appended
+            appended = max(appended, live_appended)
+            drawn_last = data_reader.parse_timestamp(drawn["last"], fmt)
+            if drawn_last is not None and drawn_last > pd.Timestamp(state["last"]):
+                state["last"] = drawn_last.isoformat()
+        if topic in (live.get("topics") or []):
+            state["max_points"] = plot_max_points(state, plot_state["window"])
+            extensions.append(dash.no_update)
+            continue
+
+        df = read_dataframe(source_dir, time_window=None, fmt=fmt, start=pd.Timestamp(state["last"]))
+        if df is None or df.empty:
+            extensions.append(dash.no_update)
+            continue
+        if any(field not in df for field in state["fields"]):
+            return None
+
+        x = df["datetime"].dt.strftime("%Y-%m-%d %H:%M:%S.%f").tolist()
+        update = dict(x=[x] * len(state["fields"]), y=[df[field].tolist() for field in state["fields"]])
+        state["last"] = df["datetime"].max().isoformat()
+        state["appended"] += len(df)
+        max_points = state["max_points"] = plot_max_points(state, plot_state["window"])
+        extensions.append([update, list(range(len(state["fields"]))), dict(x=max_points, y=max_points)])
+        appended = max(appended, len(df))
+
+    plot_state["appended"] += appended
+    return extensions
+
+
+@app.callback(
+    Output("mu_plot", "figure"),
+    Output("energy_plot", "figure"),
+    Output("env_plot", "figure"),
+    Output("mu_plot", "extendData"),
+    Output("energy_plot", "extendData"),
+    Output("env_plot", "extendData"),
+    Output("plot-state-store", "data"),
+    Input("plot-interval", "n_intervals"),
+    Input("sensor-select", "value"),
+    State("time-select", "value"),
+    State("data-path-store", "data"),
+    State("sap-sensor-electrode", "value"),
+    State("sap-sensor-stress", "value"),
+    State("plot-state-store", "data"),
+    State("live-topics-store", "data"),
+)
+def update_plots(
+    n, sensor_select, time_select, data_path, sap_sensor_electrode, sap_sensor_stress, plot_state, live
+):
+    if time_select is None:
+        raise dash.exceptions.PreventUpdate
+
+    sensor_type = get_plot_config(sensor_select)[0]
+    data_dir = pathlib.Path(data_path) / sensor_type / sensor_select
+    key = [sensor_select, time_select, data_path, sap_sensor_electrode, sap_sensor_stress]
+
+    # On a regular refresh with unchanged settings, only the new samples are sent to the browser.
+    # SAP plots are always redrawn together with the markers of the analysis.
+    if (
+        ctx.triggered_id == "plot-interval"
+        and plot_state
+        and plot_state["key"] == key
+        and sensor_type != "SAP"
+        and plot_state["appended"] < MAX_APPENDED_SAMPLES
+        and time.time() - plot_state["drawn"] < FULL_REDRAW_INTERVAL
+    ):
+        extensions = extend_plots(plot_state, data_dir, sensor_select, live or {})
+        if extensions is not None:
+            return (dash.no_update,) * 3 + tuple(extensions) + (plot_state,)
+
+    # All sessions showing the same data share one computation per new batch of samples.
+    sensor_version = source_version(data_dir) if sensor_type else None
+    version = (sensor_version, source_version(ENERGY_PATH))
+    figures = FIGURE_CACHE.get(tuple(key), version, lambda: build_plots(*key))
+    return tuple(figures) + (dash.no_update,) * 3 + (get_plot_state(key, figures),)
+
+
+def build_plots(sensor_select, time_select, data_path, sap_sensor_electrode, sap_sensor_stress):
+    fig_data = dict()
+    fig_power = dict()
+    fig_env = dict()
+
+    sensor_type, data_fields, x_axis_column, x_axis_name, y_axis_name = get_plot_config(sensor_select)
+    window_seconds = int(time_select * 3600)
 
     # MEASUREMENT DATA PLOT
     if sensor_type:
         data_dir = pathlib.Path(data_path) / sensor_type / sensor_select
-        df = read_dataframe(data_dir, x_axis_column, {"seconds": int(time_select*3600)}, fmt="%Y-%m-%d %H:%M:%S:%f")
+        df, bucket_seconds = read_plot_dataframe(data_dir, x_axis_column, window_seconds, fmt=MEASUREMENT_TIME_FORMAT)
         if df is not None:
-            df.set_index(x_axis_column, inplace=True)
-            if sensor_type != "SAP" and len(df) > DEFAULT_PLOT_SAMPLES:
-                df = df.resample(resample).mean().dropna()
+            method = PLOT_DOWNSAMPLING["mu_plot"] if sensor_type != "SAP" else None
+            if bucket_seconds:
+                df = rollup.plot_frame(df, method)
             if data_fields == "all":
                 data_fields = df.columns.to_list()
 
@@ -962,19 +1250,22 @@ def update_plots(n, sensor_select, time_select, data_path, sap_sensor_electrode,
             shapes = []
             annotations = []
             if sensor_type == "SAP":
-                traces, shapes, annotations = sap_analysis.analyze(df.index, df[data_fields[0]], sap_sensor_electrode, sap_sensor_stress)
+                analyzer = get_sap_analyzer(data_dir, sap_sensor_electrode, sap_sensor_stress)
+                analyzer.update(df.index, df[data_fields[0]])
+                traces, shapes, annotations = analyzer.figure()
 
             fig_data = dict(
                 data=[
                     go.Scatter(
-                        x=df.index,
-                        y=df[field],
+                        **downsample_trace(df, field, method),
                         name=field,
                         mode="lines",
                     )
                     for field in data_fields if field in df
                 ] + traces,
                 layout=go.Layout(
+                    # Newer samples are appended after the end of the last rollup bucket, see get_plot_state.
+                    meta=dict(bucket_seconds=bucket_seconds),
                     shapes=shapes,
                     annotations=annotations,
                     title_text="Measurement Data",
@@ -988,39 +1279,36 @@ def update_plots(n, sensor_select, time_select, data_path, sap_sensor_electrode,
             )
 
     # ENERGY DATA PLOT
-    df = read_dataframe(ENERGY_PATH, time_window={"seconds": int(time_select*3600)})
+    energy_df, bucket_seconds = read_plot_dataframe(ENERGY_PATH, "datetime", window_seconds)
+    df = energy_df
     if df is not None:
-        df.set_index("datetime", inplace=True)
-        if len(df) > DEFAULT_PLOT_SAMPLES:
-            df = df.resample(resample).mean().dropna()
+        method = PLOT_DOWNSAMPLING["energy_plot"]
+        if bucket_seconds:
+            df = rollup.plot_frame(energy_df, method)
         fig_power = dict(
             data=[
                 go.Scatter(
-                    x=df.index,
-                    y=df["bus_voltage_battery"],
+                    **downsample_trace(df, "bus_voltage_battery", method),
                     name="Voltage battery",
                     mode="lines",
                     line_color="red",
                 ),
                 go.Scatter(
-                    x=df.index,
-                    y=df["bus_voltage_solar"],
+                    **downsample_trace(df, "bus_voltage_solar", method),
                     name="Voltage solar",
                     mode="lines",
                     line_color="red",
                     line=dict(dash="dash"),
                 ),
                 go.Scatter(
-                    x=df.index,
-                    y=df["current_battery"],
+                    **downsample_trace(df, "current_battery", method),
                     name="Current battery",
                     mode="lines",
                     line_color="blue",
                     yaxis="y2",
                 ),
                 go.Scatter(
-                    x=df.index,
-                    y=df["current_solar"],
+                    **downsample_trace(df, "current_solar", method),
                     name="Current solar",
                     mode="lines",
                     line_color="blue",
@@ -1029,6 +1317,7 @@ def update_plots(n, sensor_select, time_select, data_path, sap_sensor_electrode,
                 ),
             ],
             layout=go.Layout(
+                meta=dict(bucket_seconds=bucket_seconds),
                 title_text="Energy Consumption",
                 xaxis=dict(title="datetime"),
                 yaxis=dict(
@@ -1055,18 +1344,19 @@ def update_plots(n, sensor_select, time_select, data_path, sap_sensor_electrode,
 
     # TEMP & HUMIDITY PLOT
     if df is not None and "temperature" in df.columns and "humidity" in df.columns:
+        method = PLOT_DOWNSAMPLING["env_plot"]
+        if bucket_seconds:
+            df = rollup.plot_frame(energy_df, method)
         fig_env = dict(
             data=[
                 go.Scatter(
-                    x=df.index,
-                    y=df["temperature"],
+                    **downsample_trace(df, "temperature", method),
                     name="temperature",
                     mode="lines",
                     line_color="red",
                 ),
                 go.Scatter(
-                    x=df.index,
-                    y=df["humidity"],
+                    **downsample_trace(df, "humidity", method),
                     name="humidity",
                     mode="lines",
                     line_color="blue",
@@ -1074,6 +1364,7 @@ def update_plots(n, sensor_select, time_select, data_path, sap_sensor_electrode,
                 ),
             ],
             layout=go.Layout(
+                meta=dict(bucket_seconds=bucket_seconds),
                 title_text="Temp. & Humidity inside the box",
                 xaxis=dict(title="datetime"),
                 yaxis=dict(
@@ -1106,6 +1397,11 @@ def update_plots(n, sensor_select, time_select, data_path, sap_sensor_electrode,
 if __name__ == "__main__":
     logging.getLogger('werkzeug').setLevel(logging.ERROR)
     utils.setup_logger('user_app', level=logging.INFO)
+    ROLLUPS.start()
+    COMPACTOR.start()
+    SAMPLE_BUFFERS.start()
+    LIVE_STREAM.start()
+    BOT_NOTIFIER.connect()
 
     app.run_server(host="0.0.0.0", debug=False)
     # app.run_server(host='0.0.0.0', port=8050)
@@ -1,15 +1,15 @@
 import collections
 import logging
 import os
-import shutil
 import socket
 import subprocess
 import sys
+import threading
 import time
 from datetime import datetime
 from pathlib import Path
 
-import pandas as pd
+import zmq
 
 try:
     import ruamel.yaml
@@ -106,75 +106,6 @@ def get_git_versions(paths):
     return list(reversed(out))
 
 
-def merge_measurements(measurements_path, output_path, zip_file_path):
-    def load_and_validate_csv(file_path):
-        try:
-            df = pd.read_csv(file_path)
-        except pd.errors.EmptyDataError:
-            return None
-        if df.empty:
-            return None
-        return df
-
-    def _merge_measurements(measurements_path, output_path):
-        for path in measurements_path.iterdir():
-            if path.is_dir() and path.name == 'Power':
-                df_dict = {}
-                filename_dict = {}
-                for csv_file in sorted(path.glob('*.csv')):
-                    prefix = csv_file.stem.split('_')[0]
-                    df = load_and_validate_csv(csv_file)
-
-                    if df is not None:
-                        if prefix in df_dict:
-                            df_dict[prefix] = pd.concat([df_dict[prefix], df], ignore_index=True)
-                            filename_dict[prefix].append(csv_file)
-                        else:
-                            df_dict[prefix] = df
-                            filename_dict[prefix] = [csv_file]
-
-                for key in df_dict:
-                    # print('\n\t'.join(['Merging files:'] + [str(f) for f in merged_df]))
-                    sorted_files = sorted(filename_dict[key], key=lambda x: x.stem)
-                    base_file_name = sorted_files[0].stem
-                    out_dir_structure = 'Power'
-                    merged_file_path = output_path / out_dir_structure / f"{base_file_name}_merged_{len(sorted_files)}.csv"
-                    merged_file_path.parent.mkdir(parents=True, exist_ok=True)
-                    df_dict[key].to_csv(merged_file_path, index=False)
-                    # print(f"Merging to {merged_file_path}")
-
-            elif path.suffix == '.csv':
-                csv_files = sorted(measurements_path.glob('*.csv'))
-                # print('\n\t'.join(['Merging files:'] + [str(f) for f in csv_files]))
-                if csv_files:
-                    base_file_name = csv_files[0].stem
-                    out_dir_structure = path.relative_to(path.parents[3]).parents[2]
-                    merged_file_path = output_path / out_dir_structure / f'{base_file_name}_merged_{len(csv_files)}.csv'
-                    merged_file_path.parent.mkdir(parents=True, exist_ok=True)
-
-                    df_list = []
-                    for f in csv_files:
-                        df = load_and_validate_csv(f)
-                        if df is not None:
-                            df_list.append(df)
-                    if df_list:
-                        merged_df = pd.concat(df_list, ignore_index=True)
-                        merged_df.to_csv(merged_file_path, index=False)
-                    # print(f'Merged CSV files in {measurements_path} and saved as {merged_file_path}')
-                    return
-            else:
-                # print(f'Processing {path.resolve()}')
-                _merge_measurements(path, output_path)
-
-    measurements_path = Path(measurements_path)
-    output_path = Path(output_path)
-    _merge_measurements(measurements_path, output_path)
-
-    # Zip output directory and then delete it.
-    shutil.make_archive(str(zip_file_path.resolve()), 'zip', output_path.resolve())
-    shutil.rmtree(output_path.resolve())
-
-
 class TimestampMonitor():
     def __init__(self, interval_len, num_intervals):
         self.interval_len = interval_len
@@ -199,6 +130,28 @@ class TimestampMonitor():
         self.timestamps.clear()
 
 
+class BotNotifier():
+    """Send messages to the Telegram bot, which broadcasts them to its subscribers (same as i2c_sensors.py)."""
+
+    def __init__(self, address="tcp://127.0.0.1:5556"):
+        self.address = address
+        self.socket = None
+        self.lock = threading.Lock()
+
+    def connect(self):
+        with self.lock:
+            if self.socket is None:
+                self.socket = zmq.Context.instance().socket(zmq.PUB)
+                self.socket.connect(self.address)
+                # Messages sent before the connection is established are dropped.
+                time.sleep(1)
+
+    def send(self, message):
+        self.connect()
+        with self.lock:
+            self.socket.send_string(message)
+
+
 class ColoredFormatter(logging.Formatter):
     #These are the sequences need to get colored ouput
     RESET_SEQ = "\033[0m"
@@ -0,0 +1,124 @@
+import threading
+import time
+
+CHANNELS = ("solar", "battery")
+# Columns stored besides the mean voltage and current of each channel.
+BURST_FIELDS = [
+    f"{quantity}_{channel}_{statistic}"
+    for channel in CHANNELS
+    for quantity in ("bus_voltage", "current")
+    for statistic in ("min", "max")
+] + [f"energy_{channel}" for channel in CHANNELS]
+
+
+class ChannelStats():
+    """Voltage and current statistics of one INA219 channel over an interval, and the energy in it."""
+
+    def __init__(self):
+        self.count = 0
+        self.voltage_sum = 0.0
+        self.current_sum = 0.0
+        self.voltage_min = self.voltage_max = None
+        self.current_min = self.current_max = None
+        self.energy = 0.0   # in mJ (V * mA * s)
+
+    def add(self, voltage, current):
+        self.count += 1
+        self.voltage_sum += voltage
+        self.current_sum += current
+        if self.count == 1:
+            self.voltage_min = self.voltage_max = voltage
+            self.current_min = self.current_max = current
+        else:
+            self.voltage_min = min(self.voltage_min, voltage)
+            self.voltage_max = max(self.voltage_max, voltage)
+            self.current_min = min(self.current_min, current)
+            self.current_max = max(self.current_max, current)
+
+    def summary(self, channel):
+        return {
+            f"bus_voltage_{channel}": round(self.voltage_sum / self.count, 2),
+            f"current_{channel}": round(self.current_sum / self.count, 1),
+            f"bus_voltage_{channel}_min": round(self.voltage_min, 2),
+            f"bus_voltage_{channel}_max": round(self.voltage_max, 2),
+            f"current_{channel}_min": round(self.current_min, 1),
+            f"current_{channel}_max": round(self.current_max, 1),
+            f"energy_{channel}": round(self.energy / 3600, 4),   # in mWh
+        }
+
+
+class BurstSampler():
+    """Background stage that reads the INA219 channels at a high rate and aggregates them per interval.
+
+    read() returns {channel: (bus voltage in V, current in mA)}. The energy is integrated by holding the power of
+    a sample until the next one, so it doesn't depend on the rate and nothing is lost between intervals.
+    """
+
+    def __init__(self, read, rate, clock=time.monotonic):
+        self.read = read
+        self.period = 1 / rate
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.stats = {channel: ChannelStats() for channel in CHANNELS}
+        self.last_power = None
+        self.last_time = None
+        self.errors = 0
+        # Error of the failing reads, printed once until a read succeeds again.
+        self.failure = None
+
+    def sample(self):
+        try:
+            values = self.read()
+        except OSError:
+            # A failed I2C transfer loses one sample, the energy is bridged by the previous power.
+            self.errors += 1
+            return
+        now = self.clock()
+        with self.lock:
+            for channel, (voltage, current) in values.items():
+                stats = self.stats[channel]
+                stats.add(voltage, current)
+                if self.last_power is not None:
+                    stats.energy += self.last_power[channel] * (now - self.last_time)
+            self.last_power = {channel: voltage * current for channel, (voltage, current) in values.items()}
+            self.last_time = now
+
+    def collect(self):
+        """Return the aggregates since the last call, or None if there were no samples."""
+        with self.lock:
+            stats = self.stats
+            self.stats = {channel: ChannelStats() for channel in CHANNELS}
+        if any(channel_stats.count == 0 for channel_stats in stats.values()):
+            return None
+        result = {}
+        for channel, channel_stats in stats.items():
+            result.update(channel_stats.summary(channel))
+        return result
+
+    def run(self):
+        deadline = self.clock()
+        while True:
+            try:
+                self.sample()
+            except Exception as e:
+                # Other driver errors must not end the thread, the interval aggregates would be empty from then on.
+                self.errors += 1
+                if self.failure is None:
+                    print(f"Burst sampling failed, retrying: {e!r}")
+                self.failure = e
+            else:
+                if self.failure is not None:
+                    print("Burst sampling recovered.")
+                self.failure = None
+            deadline += self.period
+            delay = deadline - self.clock()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                # Behind (e.g. a slow bus), continue from now instead of catching up with a burst of reads.
+                deadline = self.clock()
+
+    def start(self):
+        thread = threading.Thread(target=self.run, daemon=True)
+        thread.start()
+        return thread
@@ -2,6 +2,7 @@ import os
 import subprocess
 from pathlib import Path
 
+from measurement_store import manifest
 from telegram_bot.telegram_bot import broadcast_message
 
 
@@ -19,26 +20,18 @@ LOGS = [
 
 
 def cleanup_files(measurements_path):
-    def _cleanup_files(measurements_path):
-        cleaned_dirs = []
-        for path in measurements_path.iterdir():
-            if path.suffix == '.csv':
-                csv_files = sorted(measurements_path.glob('*.csv'))
-                # print('\n\t'.join(['Available files:'] + [str(f) for f in csv_files]))
-                if len(csv_files) >= NUM_FILES_TO_KEEP + NUM_FILES_TO_DELETE:
-                    files_to_delete = csv_files[:NUM_FILES_TO_DELETE]
-                    # print('\n\t'.join(['Deleting files:'] + [str(f) for f in files_to_delete]))
-                    for f in files_to_delete:
-                        os.remove(f)
-                    return [measurements_path.stem]
-            else:
-                # print(f'Processing {path.resolve()}')
-                cleaned_dirs.extend(_cleanup_files(path))
-
-        return cleaned_dirs
+    cleaned_dirs = []
+    for data_dir in manifest.find_measurement_dirs(measurements_path):
+        csv_files = [data_dir / entry["name"] for entry in manifest.get(data_dir).files()]
+        # print('\n\t'.join(['Available files:'] + [str(f) for f in csv_files]))
+        if len(csv_files) >= NUM_FILES_TO_KEEP + NUM_FILES_TO_DELETE:
+            files_to_delete = csv_files[:NUM_FILES_TO_DELETE]
+            # print('\n\t'.join(['Deleting files:'] + [str(f) for f in files_to_delete]))
+            for f in files_to_delete:
+                os.remove(f)
+            cleaned_dirs.append(data_dir.stem)
 
-    measurements_path = Path(measurements_path)
-    return _cleanup_files(measurements_path)
+    return cleaned_dirs
 
 
 def cleanup_logs():
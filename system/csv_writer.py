@@ -0,0 +1,124 @@
+import csv
+import os
+import pathlib
+import time
+from datetime import datetime
+
+# Rows are kept in memory until this many are collected or the oldest one is this many seconds old.
+FLUSH_ROWS = 12
+FLUSH_INTERVAL = 60
+# When buffered rows are forced to the storage with fsync: after every flush, only when the file is closed,
+# or never (left to the kernel, which writes dirty pages back within about 30 s).
+FSYNC_POLICIES = ("flush", "close", "never")
+
+
+def fix_ownership(full_path):
+    """Change the owner of the file and the measurement directories above it to SUDO_UID"""
+    uid = os.environ.get("SUDO_UID")
+    gid = os.environ.get("SUDO_GID")
+    if uid is not None and gid is not None:
+        full_path = pathlib.Path(full_path)
+        os.chown(full_path, int(uid), int(gid))
+        for p in list(full_path.parents)[:-3]:
+            os.chown(p, int(uid), int(gid))
+
+
+class CsvWriter:
+    """Appends rows to a CSV file through a handle that stays open.
+
+    Rows are buffered and written in batches, so the file is written (and its metadata updated) once per batch
+    instead of once per sample. At most flush_rows rows or flush_interval seconds of data are lost on a crash,
+    plus whatever the kernel didn't write back yet unless fsync is "flush".
+    """
+
+    def __init__(
+        self,
+        file_path,
+        file_name,
+        flush_rows=FLUSH_ROWS,
+        flush_interval=FLUSH_INTERVAL,
+        fsync="flush",
+        extra_fields=(),
+    ):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy {fsync}, use one of {FSYNC_POLICIES}.")
+        self.file_path = pathlib.Path(file_path)
+        self.file_path.mkdir(parents=True, exist_ok=True)
+        self.file_name = file_name
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.rows = []
+        self.first_row_time = None
+        self.created = datetime.now()
+        self.row_count = 0
+        self.first_timestamp = None
+        self.last_row = None
+
+        self.header = [
+            "bus_voltage_solar",
+            "current_solar",
+            "bus_voltage_battery",
+            "current_battery",
+            "temperature",
+            "humidity",
+        ] + list(extra_fields)
+
+        self.csvfile = open(self.file_path / self.file_name, "w", newline="")
+        self.csvwriter = csv.writer(self.csvfile)
+        # The header is written right away, readers recognize the new file by it.
+        self.csvwriter.writerow(["datetime"] + self.header)
+        self.csvfile.flush()
+
+    def fix_ownership(self):
+        fix_ownership(self.file_path / self.file_name)
+
+    def size(self):
+        """Bytes written to the file, without the buffered rows."""
+        return self.csvfile.tell()
+
+    def summary(self):
+        """Fields of the file for the index and the manifest."""
+        return {
+            "header": ",".join(["datetime"] + self.header),
+            "first": None if self.first_timestamp is None else str(self.first_timestamp),
+            "last": None if self.last_row is None else self.last_row.split(",", 1)[0],
+            "last_row": self.last_row,
+            "rows": self.row_count,
+        }
+
+    def write(self, data):
+        wrong_values = ""
+        timestamp = datetime.fromtimestamp(data[0])
+        filtered_data = data[1:]
+
+        data4csv = [timestamp] + filtered_data
+        self.rows.append(data4csv)
+        self.row_count += 1
+        if self.first_timestamp is None:
+            self.first_timestamp = timestamp
+        self.last_row = ",".join(str(value) for value in data4csv)
+        if self.first_row_time is None:
+            self.first_row_time = time.monotonic()
+        if len(self.rows) >= self.flush_rows or time.monotonic() - self.first_row_time >= self.flush_interval:
+            self.flush()
+
+        return wrong_values
+
+    def flush(self):
+        if self.rows:
+            # The buffer is swapped out first, so that an interrupted write is not repeated by close().
+            rows, self.rows = self.rows, []
+            self.first_row_time = None
+            self.csvwriter.writerows(rows)
+        self.csvfile.flush()
+        if self.fsync == "flush":
+            os.fsync(self.csvfile.fileno())
+
+    def close(self):
+        if self.csvfile.closed:
+            return
+        self.flush()
+        if self.fsync == "close":
+            os.fsync(self.csvfile.fileno())
+        self.csvfile.close()
@@ -0,0 +1,122 @@
+import json
+import os
+import pathlib
+import threading
+
+from csv_writer import fix_ownership
+
+INDEX_FILE_NAME = "index.json"
+
+
+class HalfDayRotation:
+    """Start a new file at midnight and noon."""
+
+    def __init__(self, limit=None):
+        pass
+
+    def due(self, writer, now):
+        return now.hour in {0, 12} and now.hour != writer.created.hour
+
+
+class SizeRotation:
+    """Start a new file when the current one has limit bytes."""
+
+    def __init__(self, limit):
+        self.limit = limit
+
+    def due(self, writer, now):
+        return writer.size() >= self.limit
+
+
+class DurationRotation:
+    """Start a new file when the current one is limit seconds old."""
+
+    def __init__(self, limit):
+        self.limit = limit
+
+    def due(self, writer, now):
+        return (now - writer.created).total_seconds() >= self.limit
+
+
+class RowRotation:
+    """Start a new file when the current one has limit rows."""
+
+    def __init__(self, limit):
+        self.limit = limit
+
+    def due(self, writer, now):
+        return writer.row_count >= self.limit
+
+
+ROTATION_POLICIES = {
+    "half-day": HalfDayRotation,
+    "size": SizeRotation,
+    "duration": DurationRotation,
+    "rows": RowRotation,
+}
+
+
+class FileIndex:
+    """Sidecar index next to the measurement files with the time range, rows and size of each file.
+
+    It travels with the data (e.g. when the directory is synced), so a file can be picked without opening it.
+    Entries of files that were deleted (e.g. by clean_memory) are dropped with the next update.
+    """
+
+    def __init__(self, index_path):
+        self.index_path = pathlib.Path(index_path)
+        self.lock = threading.Lock()
+        try:
+            with open(self.index_path, "r") as f:
+                self.files = json.load(f)
+        except (FileNotFoundError, ValueError):
+            self.files = {}
+
+    def update(self, key, **fields):
+        with self.lock:
+            self.files.setdefault(key, {}).update(fields)
+            self.files = {
+                name: entry
+                for name, entry in self.files.items()
+                if (self.index_path.parent / entry.get("file", "")).is_file()
+            }
+            tmp_path = self.index_path.with_name(f".{self.index_path.name}.tmp")
+            with open(tmp_path, "w") as f:
+                json.dump(self.files, f, indent=1)
+            os.replace(tmp_path, self.index_path)
+        fix_ownership(self.index_path)
+
+
+def close_file(writer, index, compress):
+    """Close a file, record it in the index and convert it to Parquet in the background if requested."""
+    writer.close()
+    csv_path = writer.file_path / writer.file_name
+    summary = writer.summary()
+    index.update(
+        csv_path.stem,
+        file=csv_path.name,
+        first=summary["first"],
+        last=summary["last"],
+        rows=summary["rows"],
+        bytes=csv_path.stat().st_size,
+    )
+    if compress and summary["rows"] > 0:
+        threading.Thread(target=compress_file, args=(csv_path, summary, index), daemon=True).start()
+
+
+def compress_file(csv_path, summary, index):
+    from measurement_store import columnar
+
+    try:
+        parquet_path = columnar.convert(csv_path, summary)
+    except Exception as e:
+        print(f"Compressing {csv_path} failed: {e}")
+        return
+    if parquet_path is None:
+        return
+    fix_ownership(parquet_path)
+    index.update(csv_path.stem, file=parquet_path.name, bytes=parquet_path.stat().st_size)
+    # Readers that listed the CSV file before the Parquet file existed may still need it for a while.
+    timer = threading.Timer(columnar.REMOVE_DELAY, csv_path.unlink, kwargs={"missing_ok": True})
+    timer.daemon = True
+    timer.start()
@@ -1,9 +1,10 @@
 import argparse
-import csv
-import os
+import json
 import pathlib
+import signal
 import socket
 import subprocess
+import threading
 import time
 from datetime import datetime
 
@@ -20,48 +21,21 @@ from safety_monitor import (
     ChargingState,
     TemperatureCheck,
 )
+from burst_sampler import BURST_FIELDS, BurstSampler
+from csv_writer import FLUSH_INTERVAL, FLUSH_ROWS, FSYNC_POLICIES, CsvWriter
+from file_rotation import INDEX_FILE_NAME, ROTATION_POLICIES, FileIndex, close_file
+from scheduler import Scheduler
+import telemetry
 
+# Seconds between the sampling statistics in the log.
+REPORT_INTERVAL = 3600
 
-class CsvWriter:
-    def __init__(self, file_path, file_name):
-        self.file_path = pathlib.Path(file_path)
-        self.file_path.mkdir(parents=True, exist_ok=True)
-        self.file_name = file_name
-
-        self.header = [
-            "bus_voltage_solar",
-            "current_solar",
-            "bus_voltage_battery",
-            "current_battery",
-            "temperature",
-            "humidity",
-        ]
-
-        with open(self.file_path / self.file_name, "w", newline="") as csvfile:
-            csvwriter = csv.writer(csvfile)
-            csvwriter.writerow(["datetime"] + self.header)
-
-    def fix_ownership(self):
-        """Change the owner of the file to SUDO_UID"""
-        uid = os.environ.get("SUDO_UID")
-        gid = os.environ.get("SUDO_GID")
-        if uid is not None and gid is not None:
-            full_path = self.file_path / self.file_name
-            os.chown(full_path, int(uid), int(gid))
-            for p in list(full_path.parents)[:-3]:
-                os.chown(p, int(uid), int(gid))
-
-    def write(self, data):
-        wrong_values = ""
-        timestamp = datetime.fromtimestamp(data[0])
-        filtered_data = data[1:]
-
-        data4csv = [timestamp] + filtered_data
-        with open(self.file_path / self.file_name, "a", newline="") as csvfile:
-            csvwriter = csv.writer(csvfile)
-            csvwriter.writerow(data4csv)
-
-        return wrong_values
+# Set by SIGTERM. The loop finishes its sample and stops, an exception raised in the handler could interrupt a write.
+stop_requested = threading.Event()
+
+
+def handle_sigterm(signum, frame):
+    stop_requested.set()
 
 
 if __name__ == "__main__":
@@ -74,12 +48,76 @@ if __name__ == "__main__":
         "--addr",
         action="store",
         default="localhost",
-        help="Address of the MQTT subscriber. Can be IP, localhost, *.local, etc.",
+        help="Address of the sink that receives the telemetry. Can be IP, localhost, *.local, etc.",
     )
     parser.add_argument(
         "--dir", action="store", default=pathlib.Path.home() / "measurements/", help="Directory where measurement data is saved."
     )
+    parser.add_argument(
+        "--flush-rows", action="store", type=int, default=FLUSH_ROWS, help="Write buffered rows to the file after this many."
+    )
+    parser.add_argument(
+        "--flush-interval",
+        action="store",
+        type=float,
+        default=FLUSH_INTERVAL,
+        help="Write buffered rows to the file when the oldest one is this old (in seconds).",
+    )
+    parser.add_argument(
+        "--fsync", action="store", choices=FSYNC_POLICIES, default="flush", help="When to force data to the storage."
+    )
+    parser.add_argument(
+        "--rotate",
+        action="store",
+        choices=ROTATION_POLICIES,
+        default="half-day",
+        help="When to start a new file: at midnight and noon, or when the file reaches --rotate-limit.",
+    )
+    parser.add_argument(
+        "--rotate-limit",
+        action="store",
+        type=float,
+        help="Limit for the rotation policy: bytes for size, seconds for duration, rows for rows.",
+    )
+    parser.add_argument(
+        "--compress",
+        action="store_true",
+        help="Convert closed files to compressed Parquet files (needs pyarrow).",
+    )
+    parser.add_argument(
+        "--burst-rate",
+        action="store",
+        type=float,
+        help="Sample the INA219s at this rate (in Hz) and store min/max/mean and energy of each interval.",
+    )
+    parser.add_argument(
+        "--telemetry-batch",
+        action="store",
+        type=int,
+        default=telemetry.BATCH_ROWS,
+        help="Samples per telemetry message to the sink.",
+    )
     args = parser.parse_args()
+    if args.rotate != "half-day" and args.rotate_limit is None:
+        parser.error(f"--rotate {args.rotate} needs --rotate-limit.")
+    if args.compress:
+        # Only needed for --compress, the logger runs without pandas and pyarrow otherwise.
+        try:
+            from measurement_store import columnar
+        except ImportError as e:
+            parser.error(f"--compress needs the measurement_store package: {e}")
+        if not columnar.available():
+            parser.error("--compress needs pyarrow.")
+    rotation = ROTATION_POLICIES[args.rotate](args.rotate_limit)
+    writer_options = dict(
+        flush_rows=args.flush_rows,
+        flush_interval=args.flush_interval,
+        fsync=args.fsync,
+        extra_fields=BURST_FIELDS if args.burst_rate else (),
+    )
+
+    # Stopping the service sends SIGTERM, the loop stops and buffered rows are written like after Ctrl+C.
+    signal.signal(signal.SIGTERM, handle_sigterm)
 
     hostname = socket.gethostname()
 
@@ -104,15 +142,28 @@ if __name__ == "__main__":
     # optional : change voltage range to 16V
     ina219_battery.bus_voltage_range = BusVoltageRange.RANGE_16V
 
+    burst_sampler = None
+    if args.burst_rate:
+        # With 32 samples averaging a conversion takes about 17 ms, so up to ~50 Hz the readings cover the whole
+        # interval and the energy includes short spikes.
+        burst_sampler = BurstSampler(
+            lambda: {
+                "solar": (ina219_solar.bus_voltage, ina219_solar.current),
+                "battery": (ina219_battery.bus_voltage, ina219_battery.current),
+            },
+            args.burst_rate,
+        )
+        burst_sampler.start()
+
     ## Set up csv storing.
     file_path = pathlib.Path(args.dir)
     start_time = datetime.now()
     print("Measurement started at {}.".format(start_time.strftime(TimeFormat.log)))
     print(f"Saving data to: {file_path}")
     file_name = f"{hostname}_{start_time.strftime(TimeFormat.file)}.csv"
-    csv_object = CsvWriter(file_path, file_name)
+    csv_object = CsvWriter(file_path, file_name, **writer_options)
     csv_object.fix_ownership()
-    last_time = datetime.now()
+    file_index = FileIndex(file_path / INDEX_FILE_NAME)
 
     ## Monitoring and checking.
     voltage_monitor = BatteryVoltageCheck()
@@ -125,49 +176,72 @@ if __name__ == "__main__":
     zmq_context = zmq.Context()
     zmq_socket = zmq_context.socket(zmq.PUB)
     zmq_socket.connect("tcp://127.0.0.1:5556")
+    # Samples for the live plots go to the dashboard on a separate port so that the bot doesn't forward them.
+    live_socket = zmq_context.socket(zmq.PUB)
+    live_socket.connect("tcp://127.0.0.1:5557")
+    # Measured rows go to the sink in batches, they are kept here while it is unreachable.
+    telemetry_socket = telemetry.connect(zmq_context, args.addr)
+    publisher = telemetry.TelemetryPublisher(
+        telemetry_socket, hostname, csv_object.header, batch_rows=args.telemetry_batch
+    )
     time.sleep(1)
 
     ## Measure and display loop
+    scheduler = Scheduler(args.int)
+    last_report = time.monotonic()
     try:
-        while True:
+        while not stop_requested.is_set():
+            timestamp = scheduler.wait()
+            if stop_requested.is_set():
+                break
+
             # Read data from sensor.
-            bus_voltage_solar = round(ina219_solar.bus_voltage, 2)        # voltage on V- (load side)
-            current_solar = round(ina219_solar.current, 1)                # current in mA
-            bus_voltage_battery = round(ina219_battery.bus_voltage, 2)    # voltage on V- (load side)
-            current_battery = round(ina219_battery.current, 1)            # current in mA
-
-            voltage_monitor.update(bus_voltage_battery)
-            state_changed, battery_level = voltage_monitor.check()
-            if state_changed:
-                if battery_level == BatteryLevel.CRIT:
-                    zmq_socket.send_string("Battery Voltage Is Critically Low. Shutting Down!")
-                    subprocess.run(str(shutdown_script.resolve()), shell=True)
-                elif battery_level == BatteryLevel.LOW1:
-                    zmq_socket.send_string(f"Battery Voltage Is Low (<= {BatteryLevel.LOW1.value} V).")
-                elif battery_level == BatteryLevel.LOW2:
-                    zmq_socket.send_string(f"Battery Voltage Is Low (<= {BatteryLevel.LOW2.value} V).")
-
-            current_monitor.update(current_battery)
-            charging_state = current_monitor.check()
-            if charging_state == ChargingState.DANGER:
-                zmq_socket.send_string("Battery Charging Current Is Unexpectedly High!")
-
-            temperature = 0
-            humidity = 0
-            if temp_is_available:
-                try:
-                    temperature = round(shtc3.temperature, 2)       # temperature in degrees Celsius
-                    humidity = round(shtc3.relative_humidity, 2)    # relative humidity in %
-                    print(f"Temperature: {temperature} °C, Humidity: {humidity} %")
-                except Exception as e:
-                    print(f"Error reading temperature and humidity: {e}")
+            with scheduler.stage("read"):
+                burst = burst_sampler.collect() if burst_sampler is not None else None
+                if burst is not None:
+                    bus_voltage_solar = burst["bus_voltage_solar"]
+                    current_solar = burst["current_solar"]
+                    bus_voltage_battery = burst["bus_voltage_battery"]
+                    current_battery = burst["current_battery"]
+                else:
+                    bus_voltage_solar = round(ina219_solar.bus_voltage, 2)        # voltage on V- (load side)
+                    current_solar = round(ina219_solar.current, 1)                # current in mA
+                    bus_voltage_battery = round(ina219_battery.bus_voltage, 2)    # voltage on V- (load side)
+                    current_battery = round(ina219_battery.current, 1)            # current in mA
+
+                temperature = 0
+                humidity = 0
+                if temp_is_available:
+                    try:
+                        temperature = round(shtc3.temperature, 2)       # temperature in degrees Celsius
+                        humidity = round(shtc3.relative_humidity, 2)    # relative humidity in %
+                        print(f"Temperature: {temperature} °C, Humidity: {humidity} %")
+                    except Exception as e:
+                        print(f"Error reading temperature and humidity: {e}")
+
+            with scheduler.stage("checks"):
+                voltage_monitor.update(bus_voltage_battery)
+                state_changed, battery_level = voltage_monitor.check()
+                if state_changed:
+                    if battery_level == BatteryLevel.CRIT:
+                        zmq_socket.send_string("Battery Voltage Is Critically Low. Shutting Down!")
+                        subprocess.run(str(shutdown_script.resolve()), shell=True)
+                    elif battery_level == BatteryLevel.LOW1:
+                        zmq_socket.send_string(f"Battery Voltage Is Low (<= {BatteryLevel.LOW1.value} V).")
+                    elif battery_level == BatteryLevel.LOW2:
+                        zmq_socket.send_string(f"Battery Voltage Is Low (<= {BatteryLevel.LOW2.value} V).")
 
-                if not temperature_monitor.check(temperature):
+                current_monitor.update(current_battery)
+                charging_state = current_monitor.check()
+                if charging_state == ChargingState.DANGER:
+                    zmq_socket.send_string("Battery Charging Current Is Unexpectedly High!")
+
+                if temp_is_available and not temperature_monitor.check(temperature):
                     zmq_socket.send_string(f"Temperature Inside The Box Is High! ({temperature} °C)")
 
             # Publish data over ZMQ.
             payload = [
-                int(datetime.now().timestamp()),
+                int(round(timestamp)),
                 bus_voltage_solar,
                 current_solar,
                 bus_voltage_battery,
@@ -175,26 +249,44 @@ if __name__ == "__main__":
                 temperature,
                 humidity,
             ]
+            if burst_sampler is not None:
+                # Left empty if the burst sampler had no readings in this interval.
+                payload += [burst[field] if burst is not None else "" for field in BURST_FIELDS]
+
+            with scheduler.stage("publish"):
+                sample = dict(zip(csv_object.header, payload[1:]))
+                sample["datetime"] = datetime.fromtimestamp(payload[0]).strftime("%Y-%m-%d %H:%M:%S")
+                live_socket.send_multipart([b"Power", json.dumps(sample).encode()])
+                publisher.add(payload)
 
-            # Create a new csv file after the specified interval.
-            current_time = datetime.now()
-            if current_time.hour in {0, 12} and current_time.hour != last_time.hour:
-                print("Creating a new csv file.")
-                file_name = f"{hostname}_{current_time.strftime(TimeFormat.file)}.csv"
-                csv_object = CsvWriter(file_path, file_name)
-                csv_object.fix_ownership()
-                last_time = current_time
+            with scheduler.stage("write"):
+                # Create a new csv file according to the rotation policy.
+                current_time = datetime.fromtimestamp(payload[0])
+                if rotation.due(csv_object, current_time):
+                    print("Creating a new csv file.")
+                    close_file(csv_object, file_index, args.compress)
+                    file_name = f"{hostname}_{current_time.strftime(TimeFormat.file)}.csv"
+                    csv_object = CsvWriter(file_path, file_name, **writer_options)
+                    csv_object.fix_ownership()
 
-            # Store data to csv file locally.
-            try:
-                csv_object.write(payload)
-            except Exception as e:
-                print(f"Writing to csv file failed with error:\n{e}\n\nContinuing because this is not a fatal error.")
+                # Store data to csv file locally.
+                try:
+                    csv_object.write(payload)
+                except Exception as e:
+                    print(f"Writing to csv file failed with error:\n{e}\n\nContinuing because this is not a fatal error.")
 
-            time.sleep(args.int)
+            if time.monotonic() - last_report >= REPORT_INTERVAL:
+                print(scheduler.report())
+                last_report = time.monotonic()
 
     except KeyboardInterrupt:
         pass
     finally:
+        print(scheduler.report())
+        # The last file is left for the dashboard's compaction, a conversion started now wouldn't finish.
+        close_file(csv_object, file_index, compress=False)
+        publisher.send()
         zmq_socket.close()
+        live_socket.close()
+        telemetry_socket.close()
         zmq_context.term()
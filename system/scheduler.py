@@ -0,0 +1,85 @@
+import time
+from contextlib import contextmanager
+
+
+class StageStats():
+    """Latency of one stage of the sampling loop."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def summary(self):
+        mean = self.total / self.count if self.count else 0.0
+        return {"count": self.count, "mean": mean, "max": self.max}
+
+
+class Scheduler():
+    """Runs a loop with a fixed period on absolute deadlines of the monotonic clock.
+
+    The n-th sample is due at start + n * period, so the time spent on the work doesn't add up to drift. When the
+    loop falls behind by whole periods, the missed samples are counted and skipped instead of run back to back.
+    The timestamps of the samples are start + n * period on the wall clock, re-anchored if the wall clock jumps
+    (e.g. when NTP sets it after boot).
+    """
+
+    def __init__(self, period, clock=time.monotonic, wall_clock=time.time, sleep=time.sleep):
+        self.period = period
+        self.clock = clock
+        self.wall_clock = wall_clock
+        self.sleep = sleep
+        self.start = None
+        self.wall_start = None
+        self.tick = 0
+        self.missed = 0
+        self.stages = {}
+
+    def wait(self):
+        """Sleep until the next deadline and return the timestamp of the sample."""
+        if self.start is None:
+            # Start on a whole second of the wall clock, so that timestamps of whole-second periods are exact.
+            wall_now = self.wall_clock()
+            self.sleep(-wall_now % 1)
+            self.start = self.clock()
+            self.wall_start = self.wall_clock()
+            return self.wall_start
+
+        self.tick += 1
+        now = self.clock()
+        deadline = self.start + self.tick * self.period
+        if now - deadline >= self.period:
+            late = int((now - deadline) // self.period)
+            self.missed += late
+            self.tick += late
+            deadline += late * self.period
+            print(f"Sampling is {late * self.period:.1f} s behind, skipped {late} sample(s).")
+        if deadline > now:
+            self.sleep(deadline - now)
+
+        # The wall clock moved against the monotonic one.
+        jump = (self.wall_clock() - self.clock()) - (self.wall_start - self.start)
+        if abs(jump) > 1:
+            self.wall_start += jump
+        return self.wall_start + self.tick * self.period
+
+    @contextmanager
+    def stage(self, name):
+        """Measure the duration of a stage of the loop: with scheduler.stage("read"): ..."""
+        start = self.clock()
+        try:
+            yield
+        finally:
+            self.stages.setdefault(name, StageStats()).add(self.clock() - start)
+
+    def report(self):
+        lines = [f"Samples: {self.tick + 1 - self.missed}, missed: {self.missed}"]
+        for name, stats in self.stages.items():
+            summary = stats.summary()
+            lines.append(f"{name}: mean {summary['mean'] * 1000:.1f} ms, max {summary['max'] * 1000:.1f} ms")
+        return "\n".join(lines)
@@ -1,7 +1,6 @@
 import csv
 import os
 import pathlib
-import shutil
 import socket
 import subprocess
 import threading
@@ -11,6 +10,7 @@ from time import sleep
 import telebot
 import yaml
 import zmq
+from measurement_store import export, manifest
 
 
 ## Helpers
@@ -47,7 +47,8 @@ welcome_message = """
 
     Here are the available commands:
     /start - Start the bot and get a welcome message.
-    /meas_files - Get .zip folder of all measurements.
+    /meas_files - Get .zip folder of all measurements, merged into one CSV file per sensor node.
+    /meas_new - Get .zip folder of the new data in each measurement file since your last /meas_new.
     /power_plot - Generate a plot based on the data.
     /subscribe - Recieve update messages from the bot.
     /unsubscribe - Unsubscribe from update messages.
@@ -186,12 +187,11 @@ def handle_status(message):
 
     # Current battery level
     try:
-        csv_files = sorted(pathlib.Path("/home/rock/measurements/Power").glob("*.csv"))
-        with open(csv_files[-1], "r") as f:
-            reader = csv.reader(f)
-            last_line = None
-            for row in reader:
-                last_line = row
+        # The manifest keeps the last row of the latest file, so the file doesn't have to be read.
+        latest_file = manifest.get(pathlib.Path("/home/rock/measurements/Power")).latest()
+        last_line = None
+        if latest_file is not None and latest_file["last_row"]:
+            last_line = next(csv.reader([latest_file["last_row"]]))
 
         battery_voltage = last_line[3] if last_line else "N/A"
         battery_current = last_line[4] if last_line else "N/A"
@@ -229,9 +229,11 @@ def handle_status(message):
 
 @bot.message_handler(commands=["meas_files"])
 def handle_file(message):
+    # Same archive as "Download all data" in the dashboard: the files of each sensor node (and of each Power prefix)
+    # merged into one CSV file, also the ones already compacted to Parquet.
     folder_path = "/home/rock/measurements/"
     try:
-        shutil.make_archive("measurements", "zip", folder_path)
+        export.export_measurements(folder_path, "measurements.zip")
         with open("measurements.zip", "rb") as file:
             bot.send_document(message.chat.id, file)
         os.remove("measurements.zip")
@@ -239,6 +241,21 @@ def handle_file(message):
         print(f"Error: {e}")
 
 
+@bot.message_handler(commands=["meas_new"])
+def handle_new_files(message):
+    folder_path = "/home/rock/measurements/"
+    client = f"telegram_{message.chat.id}"
+    try:
+        stats = export.export_changes(folder_path, "measurements_new.zip", client)
+        with open("measurements_new.zip", "rb") as file:
+            bot.send_document(message.chat.id, file)
+        # Only data that was actually sent counts as delivered.
+        export.save_watermarks(client, stats["watermarks"])
+        os.remove("measurements_new.zip")
+    except Exception as e:
+        print(f"Error: {e}")
+
+
 @bot.message_handler(commands=["power_plot"])
 def send_plot(message):
     # try:
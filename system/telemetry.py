@@ -0,0 +1,99 @@
+import math
+import struct
+from collections import deque
+
+import zmq
+
+TELEMETRY_PORT = 5558
+TOPIC = b"power"
+VERSION = 1
+BATCH_ROWS = 12
+# Rows kept while the sink is unreachable, a day of samples every 5 s.
+BUFFER_ROWS = 17280
+# Messages queued in the socket, the rest stays in the local buffer. Queued messages are lost with the connection.
+SEND_HWM = 10
+# A sink that stops answering heartbeats (e.g. dropped off the Wi-Fi) is disconnected after the timeout (in ms).
+HEARTBEAT_INTERVAL = 5000
+HEARTBEAT_TIMEOUT = 15000
+
+# Version, length of the field names, number of rows.
+_HEADER = struct.Struct("<BHH")
+
+
+def encode(fields, rows):
+    """Pack rows of [unix timestamp, value, ...] into a message body.
+
+    The body is the header, the comma separated field names and one record per row: the timestamp as uint32 and
+    the values as float32. Missing values ("" or None) are stored as NaN.
+    """
+    names = ",".join(fields).encode()
+    record = struct.Struct(f"<I{len(fields)}f")
+    body = [_HEADER.pack(VERSION, len(names), len(rows)), names]
+    for row in rows:
+        values = [math.nan if value in ("", None) else float(value) for value in row[1:]]
+        body.append(record.pack(int(row[0]), *values))
+    return b"".join(body)
+
+
+def decode(body):
+    """Return the field names and rows of a message body, the inverse of encode."""
+    version, names_length, n_rows = _HEADER.unpack_from(body)
+    if version != VERSION:
+        raise ValueError(f"Unknown telemetry version {version}.")
+    offset = _HEADER.size
+    fields = body[offset:offset + names_length].decode().split(",")
+    offset += names_length
+    record = struct.Struct(f"<I{len(fields)}f")
+    rows = [list(values) for values in record.iter_unpack(body[offset:offset + n_rows * record.size])]
+    return fields, rows
+
+
+def connect(zmq_context, address, port=TELEMETRY_PORT):
+    """PUSH socket to the sink that refuses messages while it is not connected, so that they stay buffered here.
+
+    Without heartbeats a sink that vanished without closing the connection would look connected until TCP gives up.
+    """
+    zmq_socket = zmq_context.socket(zmq.PUSH)
+    zmq_socket.setsockopt(zmq.IMMEDIATE, 1)
+    zmq_socket.setsockopt(zmq.LINGER, 1000)
+    zmq_socket.setsockopt(zmq.SNDHWM, SEND_HWM)
+    zmq_socket.setsockopt(zmq.HEARTBEAT_IVL, HEARTBEAT_INTERVAL)
+    zmq_socket.setsockopt(zmq.HEARTBEAT_TIMEOUT, HEARTBEAT_TIMEOUT)
+    zmq_socket.connect(f"tcp://{address}:{port}")
+    return zmq_socket
+
+
+class TelemetryPublisher():
+    """Sends the measured rows to the sink in batches of batch_rows as [topic, hostname, body] messages.
+
+    Rows that can't be sent are kept, up to buffer_rows of them (the oldest are dropped), and sent with the next
+    batch once the sink is reachable again.
+    """
+
+    def __init__(self, zmq_socket, hostname, fields, batch_rows=BATCH_ROWS, buffer_rows=BUFFER_ROWS):
+        self.zmq_socket = zmq_socket
+        self.hostname = hostname.encode()
+        self.fields = list(fields)
+        self.batch_rows = batch_rows
+        self.rows = deque(maxlen=buffer_rows)
+        self.unsent = 0
+
+    def add(self, row):
+        self.rows.append(row)
+        self.unsent += 1
+        if self.unsent >= self.batch_rows:
+            self.send()
+
+    def send(self):
+        """Send all buffered rows, return False if the sink didn't take them."""
+        # Retried after the next batch_rows rows.
+        self.unsent = 0
+        while self.rows:
+            batch = [self.rows[i] for i in range(min(self.batch_rows, len(self.rows)))]
+            try:
+                self.zmq_socket.send_multipart([TOPIC, self.hostname, encode(self.fields, batch)], zmq.NOBLOCK)
+            except zmq.Again:
+                return False
+            for _ in batch:
+                self.rows.popleft()
+        return True
@@ -0,0 +1,68 @@
+import unittest
+
+from burst_sampler import BURST_FIELDS, BurstSampler
+
+
+class TestBurstSampler(unittest.TestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.values = []
+        self.sampler = BurstSampler(lambda: self.values.pop(0), rate=10, clock=lambda: self.now)
+
+    def add(self, solar, battery, dt=0.1):
+        self.values.append({"solar": solar, "battery": battery})
+        self.sampler.sample()
+        self.now += dt
+
+    def test_aggregates(self):
+        self.add((5.0, 100.0), (4.0, -10.0))
+        self.add((5.2, 300.0), (4.0, -30.0))
+        result = self.sampler.collect()
+        self.assertEqual(set(BURST_FIELDS) - set(result), set())
+        self.assertEqual(result["current_solar"], 200.0)
+        self.assertEqual(result["current_solar_min"], 100.0)
+        self.assertEqual(result["current_solar_max"], 300.0)
+        self.assertEqual(result["bus_voltage_solar_max"], 5.2)
+        # 5 V * 100 mA for 0.1 s = 50 mJ
+        self.assertAlmostEqual(result["energy_solar"], 50 / 3600, places=4)
+
+    def test_energy_spans_intervals(self):
+        self.add((5.0, 100.0), (4.0, 0.0), dt=1.0)
+        self.sampler.collect()
+        self.add((5.0, 100.0), (4.0, 0.0))
+        result = self.sampler.collect()
+        self.assertAlmostEqual(result["energy_solar"], 500 / 3600, places=4)
+
+    def test_no_samples(self):
+        self.assertIsNone(self.sampler.collect())
+
+    def test_read_error(self):
+        def fail():
+            raise OSError("I2C")
+        self.sampler.read = fail
+        self.sampler.sample()
+        self.assertEqual(self.sampler.errors, 1)
+        self.assertIsNone(self.sampler.collect())
+
+
+    def test_unexpected_error(self):
+        class Stop(BaseException):
+            pass
+
+        reads = [ValueError("driver"), {"solar": (5.0, 100.0), "battery": (4.0, -10.0)}, Stop()]
+
+        def read():
+            value = reads.pop(0)
+            if isinstance(value, BaseException):
+                raise value
+            return value
+        self.sampler.read = read
+        # The loop continues after the driver error, until the test stops it.
+        with self.assertRaises(Stop):
+            self.sampler.run()
+        self.assertEqual(self.sampler.errors, 1)
+        self.assertIsNone(self.sampler.failure)
+        self.assertEqual(self.sampler.collect()["bus_voltage_solar"], 5.0)
+
+if __name__ == "__main__":
+    unittest.main()
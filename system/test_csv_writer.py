@@ -0,0 +1,75 @@
+import pathlib
+import tempfile
+import unittest
+from unittest.mock import Mock, patch
+
+from csv_writer import CsvWriter
+
+HEADER = "datetime,bus_voltage_solar,current_solar,bus_voltage_battery,current_battery,temperature,humidity\r\n"
+
+
+class TestCsvWriter(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = pathlib.Path(self.tmp_dir.name)
+        self.now = 1000.0
+        self.patcher = patch("csv_writer.time.monotonic", lambda: self.now)
+        self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+        self.tmp_dir.cleanup()
+
+    def rows(self):
+        return (self.path / "power.csv").read_text().count("\n") - 1
+
+    def sample(self, i):
+        return [1700000000 + i, 5.0, 100.0, 4.0, -10.0, 21.0, 40.0]
+
+    def test_flush_by_rows(self):
+        writer = CsvWriter(self.path, "power.csv", flush_rows=3, flush_interval=60, fsync="never")
+        self.assertEqual((self.path / "power.csv").read_bytes().decode(), HEADER)
+        writer.write(self.sample(0))
+        writer.write(self.sample(1))
+        self.assertEqual(self.rows(), 0)
+        writer.write(self.sample(2))
+        self.assertEqual(self.rows(), 3)
+        writer.close()
+
+    def test_flush_by_time(self):
+        writer = CsvWriter(self.path, "power.csv", flush_rows=100, flush_interval=60, fsync="flush")
+        writer.write(self.sample(0))
+        self.now += 30
+        writer.write(self.sample(1))
+        self.assertEqual(self.rows(), 0)
+        self.now += 30
+        writer.write(self.sample(2))
+        self.assertEqual(self.rows(), 3)
+        writer.close()
+
+    def test_close(self):
+        writer = CsvWriter(self.path, "power.csv", flush_rows=100, flush_interval=60, fsync="close")
+        writer.write(self.sample(0))
+        writer.close()
+        writer.close()
+        self.assertEqual(self.rows(), 1)
+        self.assertEqual(writer.summary()["rows"], 1)
+
+    def test_interrupted_write_is_not_repeated(self):
+        writer = CsvWriter(self.path, "power.csv", flush_rows=2, flush_interval=60, fsync="never")
+        writer.write(self.sample(0))
+        csvwriter = writer.csvwriter
+        writer.csvwriter = Mock(writerows=Mock(side_effect=KeyboardInterrupt))
+        with self.assertRaises(KeyboardInterrupt):
+            writer.write(self.sample(1))
+        writer.csvwriter = csvwriter
+        writer.close()
+        self.assertEqual(self.rows(), 0)
+
+    def test_invalid_fsync_policy(self):
+        with self.assertRaises(ValueError):
+            CsvWriter(self.path, "power.csv", fsync="sometimes")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+import json
+import pathlib
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+import file_rotation
+
+
+class FakeWriter:
+    def __init__(self, created, row_count=0, size=0):
+        self.created = created
+        self.row_count = row_count
+        self._size = size
+
+    def size(self):
+        return self._size
+
+
+class TestRotation(unittest.TestCase):
+    def test_half_day(self):
+        policy = file_rotation.ROTATION_POLICIES["half-day"]()
+        writer = FakeWriter(datetime(2024, 1, 1, 11, 30))
+        self.assertFalse(policy.due(writer, datetime(2024, 1, 1, 11, 59)))
+        self.assertTrue(policy.due(writer, datetime(2024, 1, 1, 12, 0)))
+        # The file started at noon is not rotated again within the hour.
+        writer = FakeWriter(datetime(2024, 1, 1, 12, 0))
+        self.assertFalse(policy.due(writer, datetime(2024, 1, 1, 12, 30)))
+        self.assertTrue(policy.due(writer, datetime(2024, 1, 2, 0, 0)))
+
+    def test_limits(self):
+        created = datetime(2024, 1, 1, 11, 30)
+        cases = [
+            ("size", 1000, FakeWriter(created, size=999), FakeWriter(created, size=1000), created),
+            ("rows", 10, FakeWriter(created, row_count=9), FakeWriter(created, row_count=10), created),
+            ("duration", 3600, FakeWriter(created), FakeWriter(created - timedelta(seconds=1)),
+             created + timedelta(seconds=3599)),
+        ]
+        for name, limit, below, reached, now in cases:
+            with self.subTest(name):
+                policy = file_rotation.ROTATION_POLICIES[name](limit)
+                self.assertFalse(policy.due(below, now))
+                self.assertTrue(policy.due(reached, now))
+
+
+class TestFileIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.index_path = pathlib.Path(self.tmp_dir.name) / file_rotation.INDEX_FILE_NAME
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def touch(self, *names):
+        for name in names:
+            (self.index_path.parent / name).write_bytes(b"")
+
+    def test_update(self):
+        self.touch("rpi1_a.csv", "rpi1_a.parquet", "rpi1_b.csv")
+        index = file_rotation.FileIndex(self.index_path)
+        index.update("rpi1_a", file="rpi1_a.csv", rows=10, bytes=500)
+        index.update("rpi1_a", file="rpi1_a.parquet", bytes=200)
+        index.update("rpi1_b", file="rpi1_b.csv", rows=0, bytes=50)
+
+        expected = {
+            "rpi1_a": {"file": "rpi1_a.parquet", "rows": 10, "bytes": 200},
+            "rpi1_b": {"file": "rpi1_b.csv", "rows": 0, "bytes": 50},
+        }
+        self.assertEqual(json.loads(self.index_path.read_text()), expected)
+        self.assertEqual(list(self.index_path.parent.glob(".*.tmp")), [])
+        # A restarted logger continues the index.
+        self.assertEqual(file_rotation.FileIndex(self.index_path).files, expected)
+
+    def test_broken_index(self):
+        self.touch("rpi1_b.csv")
+        self.index_path.write_text('{"rpi1_a": ')
+        index = file_rotation.FileIndex(self.index_path)
+        index.update("rpi1_b", file="rpi1_b.csv", rows=1)
+        self.assertEqual(json.loads(self.index_path.read_text()), {"rpi1_b": {"file": "rpi1_b.csv", "rows": 1}})
+
+    def test_deleted_files(self):
+        self.touch("rpi1_a.csv", "rpi1_b.csv", "rpi1_c.csv")
+        index = file_rotation.FileIndex(self.index_path)
+        for key in ("rpi1_a", "rpi1_b"):
+            index.update(key, file=f"{key}.csv", rows=1)
+        (self.index_path.parent / "rpi1_a.csv").unlink()
+        index.update("rpi1_c", file="rpi1_c.csv", rows=1)
+        self.assertEqual(list(json.loads(self.index_path.read_text())), ["rpi1_b", "rpi1_c"])
+
+
+if __name__ == "__main__":
+    unittest.main()
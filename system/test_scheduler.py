@@ -0,0 +1,56 @@
+import unittest
+
+from scheduler import Scheduler
+
+
+class FakeClock():
+    def __init__(self, now=1000.25):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class TestScheduler(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.scheduler = Scheduler(5, clock=self.clock.time, wall_clock=self.clock.time, sleep=self.clock.sleep)
+
+    def test_deadlines_dont_drift(self):
+        timestamps = []
+        for _ in range(4):
+            timestamps.append(self.scheduler.wait())
+            # Work takes a different time on every sample.
+            self.clock.now += 0.3 * len(timestamps)
+        self.assertEqual(timestamps, [1001, 1006, 1011, 1016])
+        self.assertEqual(self.scheduler.missed, 0)
+
+    def test_missed_deadlines_are_skipped(self):
+        self.assertEqual(self.scheduler.wait(), 1001)
+        self.clock.now += 12
+        self.assertEqual(self.scheduler.wait(), 1011)
+        self.assertEqual(self.scheduler.missed, 1)
+
+    def test_wall_clock_jump(self):
+        wall_offset = 0
+        scheduler = Scheduler(
+            5, clock=self.clock.time, wall_clock=lambda: self.clock.now + wall_offset, sleep=self.clock.sleep
+        )
+        self.assertEqual(scheduler.wait(), 1001)
+        wall_offset = 3600
+        self.assertEqual(scheduler.wait(), 4606)
+
+    def test_stage_stats(self):
+        with self.scheduler.stage("read"):
+            self.clock.now += 0.5
+        with self.scheduler.stage("read"):
+            self.clock.now += 1.5
+        summary = self.scheduler.stages["read"].summary()
+        self.assertEqual(summary, {"count": 2, "mean": 1.0, "max": 1.5})
+
+
+if __name__ == "__main__":
+    unittest.main()
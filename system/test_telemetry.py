@@ -0,0 +1,65 @@
+import math
+import socket
+import time
+import unittest
+
+import zmq
+
+import telemetry
+
+FIELDS = ["bus_voltage_solar", "current_solar", "temperature"]
+
+
+class TestTelemetry(unittest.TestCase):
+    def setUp(self):
+        self.context = zmq.Context()
+        self.push = None
+        self.pull = None
+
+    def tearDown(self):
+        if self.push is not None:
+            self.push.close(linger=0)
+        if self.pull is not None:
+            self.pull.close()
+        self.context.term()
+
+    def test_encode_decode(self):
+        rows = [[1700000000, 5.1, 120.5, ""], [1700000005, 5.2, 130.0, 21.5]]
+        fields, decoded = telemetry.decode(telemetry.encode(FIELDS, rows))
+        self.assertEqual(fields, FIELDS)
+        self.assertEqual(decoded[1][0], 1700000005)
+        self.assertAlmostEqual(decoded[0][1], 5.1, places=5)
+        self.assertTrue(math.isnan(decoded[0][3]))
+
+    def test_buffer_until_sink_is_reachable(self):
+        # A free port where nobody listens yet.
+        with socket.socket() as probe:
+            probe.bind(("127.0.0.1", 0))
+            port = probe.getsockname()[1]
+        self.push = telemetry.connect(self.context, "127.0.0.1", port)
+        self.assertEqual(self.push.getsockopt(zmq.SNDHWM), telemetry.SEND_HWM)
+        self.assertEqual(self.push.getsockopt(zmq.HEARTBEAT_IVL), telemetry.HEARTBEAT_INTERVAL)
+        publisher = telemetry.TelemetryPublisher(self.push, "box", FIELDS, batch_rows=2)
+        for i in range(4):
+            publisher.add([1700000000 + i, 5.0, 100.0, 20.0])
+        self.assertEqual(len(publisher.rows), 4)
+
+        self.pull = self.context.socket(zmq.PULL)
+        self.pull.bind(f"tcp://127.0.0.1:{port}")
+        # The PUSH socket reconnects after its reconnect interval.
+        for _ in range(50):
+            if publisher.send():
+                break
+            time.sleep(0.1)
+        self.assertEqual(len(publisher.rows), 0)
+
+        timestamps = []
+        for _ in range(2):
+            topic, hostname, body = self.pull.recv_multipart()
+            self.assertEqual((topic, hostname), (telemetry.TOPIC, b"box"))
+            timestamps += [row[0] for row in telemetry.decode(body)[1]]
+        self.assertEqual(timestamps, [1700000000, 1700000001, 1700000002, 1700000003])
+
+
+if __name__ == "__main__":
+    unittest.main()